@@ -11,8 +11,14 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from shared.db_models import get_engine, AccountSnapshot, OpenPosition, AccountAlias, AppConfig
+from shared.db_models import AccountSnapshot, OpenPosition, AccountAlias, AppConfig
 from analysis.shared.ui_components import apply_theme, card_container, card_end
+from analysis.shared import queries, duckdb_backend
+from analysis.shared.cache import cached, loader_cache
+from analysis.shared.db import get_db_engine
+from analysis.shared.trade_frame import trade_frame
+from analysis.shared.metrics import group_metrics, equity_drawdown, dominant_ea_map, floating_drawdown
+from analysis.shared.charts import line_figure
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
@@ -22,67 +28,129 @@ load_dotenv(os.path.join(parent_dir, ".env"))
 
 st.set_page_config(page_title="EA Repository", layout="wide")
 
-# Database Connection
-@st.cache_resource
-def get_db_engine():
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        st.error("DATABASE_URL not found. Please set it in .env")
-        return None
-    return get_engine(db_url)
-
+# Database Connection (one pooled engine for every page and rerun)
 engine = get_db_engine()
 Session = sessionmaker(bind=engine)
+loader_cache.bind(engine)
 
-def get_theme():
-    try:
-        session = Session()
+# Cached fetchers raise on DB errors (failures are never cached); the loaders below
+# turn errors into empty results. TTLs are in seconds.
+@cached("theme", ttl=300)
+def fetch_theme():
+    with Session() as session:
         conf = session.query(AppConfig).filter_by(key="ui_theme").first()
-        session.close()
         return conf.value if conf else "Light Mode"
+
+def get_theme():
+    try:
+        return fetch_theme()
     except: return "Light Mode"
 
 apply_theme(get_theme())
 
 # Fetch Data
-def load_data():
+@cached("filter_options", ttl=600, depends_on=("trades",))
+def fetch_filter_options():
+    return queries.load_filter_options(engine)
+
+# ANALYTICS_BACKEND=duckdb aggregates raw deals in an embedded DuckDB (local Parquet
+# mirror or SQLite copy) instead of reading the daily_pnl table; same result shape
+analytics = duckdb_backend if duckdb_backend.enabled() else queries
+
+@cached("daily_pnl", ttl=600, depends_on=("trades",))
+def fetch_rollup(*filters):
+    return analytics.load_daily_pnl(engine, *filters)
+
+def load_filter_options():
+    """Sidebar options from cheap DISTINCT queries (no trade rows are loaded)"""
     if not engine:
+        return None
+    try:
+        return fetch_filter_options()
+    except Exception as e:
+        st.error(f"Error connecting to DB: {e}")
+        return None
+
+def load_rollup(start_date, end_date, accounts, eas, symbols):
+    """Daily PnL rollup rows (account/EA/symbol/day) for the current selection, filtered in SQL"""
+    try:
+        return fetch_rollup(start_date, end_date, accounts, eas, symbols)
+    except Exception as e:
+        st.error(f"Error connecting to DB: {e}")
         return pd.DataFrame()
-    
-    query = """
-    SELECT 
-        t.ticket, t.symbol, t.type, t.volume, t.profit, t.commission, t.swap, t.close_time, t.magic_number, t.account_id,
-        e.name as ea_name
-    FROM trades t
-    LEFT JOIN eas e ON t.magic_number = e.magic_number AND t.account_id = e.account_id
-    ORDER BY t.close_time ASC
-    """
+
+def load_trade_frame():
+    """Tops up the process-wide deal frame with deals written since its last refresh"""
+    try:
+        trade_frame.refresh(engine, loader_cache.data_version()["trades"])
+        return True
+    except Exception as e:
+        st.error(f"Error connecting to DB: {e}")
+        return False
+
+def load_trades(start_date, end_date, accounts, eas, symbols):
+    """Raw deals for the current selection, from the deal frame"""
+    columns = ("ticket", "symbol", "type", "volume", "profit", "commission", "swap", "net_profit", "close_time",
+               "magic_number", "account_id", "ea_name")
+    if symbols is not None:
+        symbols = list(symbols) + [""] # keep balance operations
+    return trade_frame.select(start_date, end_date, accounts, eas, symbols, columns=columns)
+
+@cached("risk_state", ttl=600, depends_on=("trades",))
+def fetch_risk_state():
+    return queries.load_risk_state(engine)
+
+def load_risk_state():
+    """Whole-history risk metrics per account and per EA, maintained by the collector"""
     try:
-        df = pd.read_sql(query, engine)
-        if not df.empty:
-            df['close_time'] = pd.to_datetime(df['close_time'])
-            # Fill NaN EA names with Magic Number immediately
-            df['ea_name'] = df['ea_name'].fillna(df['magic_number'].astype(str))
-        return df
+        return fetch_risk_state()
     except Exception as e:
         st.error(f"Error connecting to DB: {e}")
         return pd.DataFrame()
 
+def deal_drawdown(start_date, end_date, accounts, eas, symbols):
+    """Max drawdown over individual deals of the selection"""
+    whole_history = symbols is None and start_date <= options["min_date"] and end_date >= options["max_date"]
+    if whole_history and accounts is None and eas is None:
+        return trade_frame.max_drawdown # maintained incrementally by the frame
+    if whole_history and accounts is not None and len(accounts) == 1:
+        # One account, or one EA on it: precomputed by the collector
+        states = load_risk_state()
+        if not states.empty:
+            states = states[states['account_id'] == int(accounts[0])]
+            states = states[states['ea_name'].isna()] if eas is None else states[states['ea_name'].isin(eas)]
+            if len(states) == 1:
+                return float(states['max_drawdown'].iloc[0])
+    deals = trade_frame.select(start_date, end_date, accounts, eas, symbols, columns=("type", "net_profit"))
+    return equity_drawdown(deals.loc[deals['type'] != 'BALANCE', 'net_profit'])
+
+@cached("open_positions", ttl=30, depends_on=("positions",))
+def fetch_open_positions():
+    # Join with EAs table to get EA Name
+    query = """
+    SELECT 
+        op.*, e.name as ea_name 
+    FROM open_positions op
+    LEFT JOIN eas e ON op.magic_number = e.magic_number AND op.account_id = e.account_id
+    """
+    return pd.read_sql(query, engine)
+
 def load_open_positions():
     if not engine: return pd.DataFrame()
     try:
-        # Join with EAs table to get EA Name
-        query = """
-        SELECT 
-            op.*, e.name as ea_name 
-        FROM open_positions op
-        LEFT JOIN eas e ON op.magic_number = e.magic_number AND op.account_id = e.account_id
-        """
-        df = pd.read_sql(query, engine)
-        return df
+        return fetch_open_positions()
     except: return pd.DataFrame()
 
-def get_account_names(df):
+@cached("aliases", ttl=300)
+def fetch_aliases():
+    with Session() as session:
+        return {str(a.account_id): a.alias for a in session.query(AccountAlias).all()}
+
+@cached("ea_trade_counts", ttl=600, depends_on=("trades",))
+def fetch_ea_trade_counts():
+    return queries.load_ea_trade_counts(engine)
+
+def get_account_names(account_ids):
     """
     Creates a mapping of account_id -> "Display Name".
     """
@@ -90,25 +158,18 @@ def get_account_names(df):
     
     # 1. Fetch Manual Aliases from DB
     try:
-        session = Session()
-        aliases = session.query(AccountAlias).all()
-        db_aliases = {str(a.account_id): a.alias for a in aliases}
-        session.close()
+        db_aliases = fetch_aliases()
     except:
         db_aliases = {}
     
-    # 2. Determine Dominant EA per Account
-    if not df.empty and 'ea_name' in df.columns:
-        ea_counts = df.groupby(['account_id', 'ea_name']).size().reset_index(name='count')
-        ea_counts = ea_counts.sort_values(['account_id', 'count'], ascending=[True, False])
-        dominant_eas = ea_counts.drop_duplicates('account_id')
-        dominant_map = {str(row['account_id']): str(row['ea_name']) for _, row in dominant_eas.iterrows()}
-    else:
+    # 2. Determine Dominant EA per Account (by number of trades)
+    try:
+        dominant_map = dominant_ea_map(fetch_ea_trade_counts())
+    except:
         dominant_map = {}
 
     # 3. Build Mapping
-    all_ids = df['account_id'].unique() if not df.empty else []
-    for acc_id in all_ids:
+    for acc_id in account_ids:
         s_id = str(acc_id)
         if s_id in db_aliases:
             mapping[s_id] = db_aliases[s_id]
@@ -119,24 +180,39 @@ def get_account_names(df):
              
     return mapping
 
+@cached("latest_snapshots", ttl=30, depends_on=("snapshots",))
+def fetch_snapshots():
+    # Get latest snapshot for each account
+    query = """
+    SELECT DISTINCT ON (account_id) *
+    FROM account_snapshots
+    ORDER BY account_id, timestamp DESC
+    """
+    return pd.read_sql(query, engine)
+
 def load_snapshots():
     if not engine: return pd.DataFrame()
     try:
-        # Get latest snapshot for each account
-        query = """
-        SELECT DISTINCT ON (account_id) *
-        FROM account_snapshots
-        ORDER BY account_id, timestamp DESC
-        """
-        df = pd.read_sql(query, engine)
-        return df
+        return fetch_snapshots()
     except: return pd.DataFrame()
 
+@cached("equity_series", ttl=60, depends_on=("snapshots",))
+def fetch_equity_series(*args):
+    return queries.load_equity_series(engine, *args)
+
+def load_equity_series(start_date, end_date, accounts, resolution):
+    """Equity/margin of the selected accounts from the snapshot history, bucketed in SQL"""
+    try:
+        return floating_drawdown(fetch_equity_series(start_date, end_date, accounts, resolution))
+    except Exception as e:
+        st.error(f"Error connecting to DB: {e}")
+        return pd.DataFrame()
+
 st.title("🤖 EA Performance Repository")
 
 if engine:
     with st.spinner("Loading Cloud Data..."):
-        df = load_data()
+        options = load_filter_options()
         df_open = load_open_positions()
         df_snaps = load_snapshots()
 
@@ -148,20 +224,21 @@ if engine:
     selected_accounts = []
     selected_eas = []
     selected_symbols = []
+    account_mapping = {}
 
-    if not df.empty:
-        min_date = df['close_time'].min().date()
-        max_date = df['close_time'].max().date()
+    has_history = bool(options and options["min_date"])
+    if has_history:
+        min_date = options["min_date"]
+        max_date = options["max_date"]
         try:
              start_date, end_date = st.sidebar.date_input("Date Range", [min_date, max_date], min_value=min_date, max_value=max_date)
         except:
              start_date, end_date = min_date, max_date
 
     # --- SHARED FILTERS ---
-    if not df.empty:
+    if has_history:
         # Prepare Account Options with Aliases
-        account_mapping = get_account_names(df)
-        all_accounts = sorted(df['account_id'].unique())
+        account_mapping = get_account_names(options["accounts"])
         
         # Formatter function for the multiselect
         def format_account_name(acc_id):
@@ -169,12 +246,12 @@ if engine:
 
         selected_accounts = st.sidebar.multiselect(
             "Select Accounts", 
-            options=sorted(df['account_id'].unique()), 
-            default=df['account_id'].unique(),
+            options=options["accounts"], 
+            default=options["accounts"],
             format_func=format_account_name
         )
-        selected_eas = st.sidebar.multiselect("Select EAs", options=sorted(df['ea_name'].unique()), default=df['ea_name'].unique())
-        selected_symbols = st.sidebar.multiselect("Select Symbols", options=sorted(df['symbol'].unique()), default=df['symbol'].unique())
+        selected_eas = st.sidebar.multiselect("Select EAs", options=options["ea_names"], default=options["ea_names"])
+        selected_symbols = st.sidebar.multiselect("Select Symbols", options=options["symbols"], default=options["symbols"])
     else:
         st.sidebar.info("No data to filter.")
         selected_accounts, selected_eas, selected_symbols = [], [], []
@@ -187,7 +264,7 @@ if engine:
         st.warning("No Live Data Available (Check Collector)")
     else:
         # Get Alias Mapping
-        alias_map = get_account_names(df)
+        alias_map = account_mapping or get_account_names(df_snaps['account_id'].unique())
         
         # Filter Snapshots by Selected Accounts
         filtered_snaps = df_snaps.copy()
@@ -237,6 +314,33 @@ if engine:
         else:
             st.info("No Open Positions")
 
+    # --- ACCOUNT EQUITY (snapshot history) ---
+    st.subheader("📉 Account Equity")
+    resolution = st.selectbox("Resolution", ["Auto"] + list(queries.EQUITY_RESOLUTIONS), key="equity_resolution")
+    resolution = None if resolution == "Auto" else resolution
+    # The last trading day is not the end of the snapshots: keep the window open up to now
+    equity_end = None if has_history and end_date >= options["max_date"] else end_date
+    equity_accounts = queries.selection(selected_accounts, options["accounts"]) if has_history else None
+    equity = load_equity_series(start_date, equity_end, equity_accounts, resolution)
+
+    if equity.empty:
+        st.info("No account snapshots for the selected range.")
+    else:
+        shown = queries.equity_resolution(start_date, equity_end, resolution)
+        e1, e2, e3 = st.columns(3)
+        e1.metric("Floating Max Drawdown", f"${equity['drawdown'].min():,.2f}", delta_color="inverse",
+                  help="Lowest equity in a bucket against the highest equity so far (deposits and withdrawals included)")
+        e2.metric("Peak Equity", f"${equity['equity'].max():,.2f}")
+        e3.metric("Max Margin Used", f"${equity['margin'].max():,.2f}")
+
+        fig_equity = px.line(equity, x='bucket', y=['equity', 'balance'])
+        fig_equity.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#888'), margin=dict(l=0, r=0, t=0, b=0), legend_title_text=None)
+        st.plotly_chart(fig_equity, use_container_width=True)
+        fig_margin = px.area(equity, x='bucket', y='margin', height=200)
+        fig_margin.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#888'), margin=dict(l=0, r=0, t=0, b=0))
+        st.plotly_chart(fig_margin, use_container_width=True)
+        st.caption(f"{len(equity)} points at {shown} resolution")
+
     
 
 
@@ -245,16 +349,17 @@ if engine:
     # Filters are now applies globally above
 
     # --- APPLY FILTERS ---
+    # Only the selected window is fetched; a fully selected list means "no filter"
     filtered_df = pd.DataFrame()
-    if not df.empty:
-        mask = (
-            (df['close_time'].dt.date >= start_date) &
-            (df['close_time'].dt.date <= end_date) &
-            (df['ea_name'].isin(selected_eas)) &
-            (df['symbol'].isin(selected_symbols)) &
-            (df['account_id'].isin(selected_accounts))
+    if has_history:
+        filter_args = (
+            start_date, end_date,
+            queries.selection(selected_accounts, options["accounts"]),
+            queries.selection(selected_eas, options["ea_names"]),
+            queries.selection(selected_symbols, options["symbols"]),
         )
-        filtered_df = df[mask].copy()
+        filtered_df = load_rollup(*filter_args)
+        has_deals = load_trade_frame()
 
     # --- KPI CARDS (Consolidated) ---
     st.subheader("📈 Performance Overview")
@@ -263,33 +368,28 @@ if engine:
     if filtered_df.empty:
         st.info("No historical trades found for selected range.")
     else:
-        # Metric Calculations
-        trade_mask = filtered_df['type'] != 'BALANCE'
-        trades_only = filtered_df[trade_mask].copy()
-        
-        trades_only['net_profit'] = trades_only['profit'] + trades_only['commission'] + trades_only['swap']
-        total_deposits = filtered_df[~trade_mask]['profit'].sum()
+        # Metric Calculations (from the daily rollup; balance operations only carry deposits,
+        # rows of entry deals alone carry their commission)
+        trades_only = filtered_df[(filtered_df['trades'] > 0) | (filtered_df['net_profit'] != 0)].copy()
         
         # Metrics
         net_profit = trades_only['net_profit'].sum()
-        gross_profit = trades_only[trades_only['net_profit'] > 0]['net_profit'].sum()
-        gross_loss = trades_only[trades_only['net_profit'] < 0]['net_profit'].sum()
+        gross_profit = trades_only['gross_profit'].sum()
+        gross_loss = trades_only['gross_loss'].sum()
         
-        total_trades = len(trades_only)
-        winning_trades = len(trades_only[trades_only['net_profit'] > 0])
-        losing_trades = len(trades_only[trades_only['net_profit'] < 0])
+        total_trades = int(trades_only['trades'].sum())
+        winning_trades = int(trades_only['wins'].sum())
+        losing_trades = int(trades_only['losses'].sum())
         
         win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0.0
         profit_factor = abs(gross_profit / gross_loss) if gross_loss != 0 else float('inf')
         
-        # Max Drawdown
-        max_drawdown = 0.0
-        if not trades_only.empty:
-            trades_only['cum_profit'] = trades_only['net_profit'].cumsum()
-            running_equity = total_deposits + trades_only['cum_profit']
-            running_max = running_equity.cummax()
-            drawdown = (running_equity - running_max)
-            max_drawdown = drawdown.min()
+        # Daily net PnL across the selection
+        daily = trades_only.groupby('day')['net_profit'].sum().sort_index().reset_index()
+        daily['cumulative_net'] = daily['net_profit'].cumsum()
+
+        # Max Drawdown (deal by deal, from the deal frame)
+        max_drawdown = deal_drawdown(*filter_args) if has_deals else 0.0
 
         c1, c2, c3, c4 = st.columns(4)
         c1.metric("Net Profit", f"${net_profit:,.2f}", delta=f"{total_trades} trades")
@@ -307,9 +407,9 @@ if engine:
 
             # Equity Curve
             st.markdown("#### Equity Growth")
-            if not trades_only.empty:
-                trades_only['cumulative_net'] = trades_only['net_profit'].cumsum()
-                fig = px.line(trades_only, x='close_time', y='cumulative_net', markers=True)
+            if not daily.empty:
+                # Decimated to the chart's pixel budget (LTTB keeps the peaks and troughs)
+                fig = line_figure(daily, x='day', y='cumulative_net')
                 fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#888'), margin=dict(l=0, r=0, t=0, b=0))
                 st.plotly_chart(fig, use_container_width=True)
 
@@ -318,8 +418,8 @@ if engine:
 
             # Symbol Performance
             st.markdown("#### Top Symbols")
-            sym_perf = filtered_df.groupby('symbol')['profit'].sum().reset_index().sort_values('profit', ascending=False).head(10)
-            fig_sym = px.bar(sym_perf, x='profit', y='symbol', orientation='h', text_auto='.2s')
+            sym_perf = group_metrics(trades_only, 'symbol')[['symbol', 'net_profit']].sort_values('net_profit', ascending=False).head(10)
+            fig_sym = px.bar(sym_perf, x='net_profit', y='symbol', orientation='h', text_auto='.2s')
             fig_sym.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#888'), margin=dict(l=0, r=0, t=0, b=0))
             st.plotly_chart(fig_sym, use_container_width=True)
 
@@ -327,29 +427,12 @@ if engine:
         # Account Breakdown Table
         st.subheader("Account Breakdown")
         
-        # Manual Aggregation to ensure clean DataFrame for Streamlit
-        acc_data = []
-        for account_id, group in trades_only.groupby('account_id'):
-            pnl_series = group['profit'] + group['commission'] + group['swap']
-            gross_profit = pnl_series[pnl_series > 0].sum()
-            gross_loss = abs(pnl_series[pnl_series < 0].sum())
-            
-            pf = (gross_profit / gross_loss) if gross_loss != 0 else 0.0
-            wr = (len(pnl_series[pnl_series > 0]) / len(group) * 100) if len(group) > 0 else 0.0
-            
-            acc_data.append({
-                'account_id': str(account_id),
-                'Trades': int(len(group)),
-                'Net Profit': float(pnl_series.sum()),
-                'Profit Factor': float(pf),
-                'Win Rate': float(wr)
-            })
-            
-
-        if not acc_data:
-            account_perf = pd.DataFrame(columns=['account_id', 'Trades', 'Net Profit', 'Profit Factor', 'Win Rate'])
-        else:
-            account_perf = pd.DataFrame(acc_data)
+        # One vectorized pass over the rollup rows (drawdown on daily closes)
+        account_perf = group_metrics(trades_only, 'account_id', time_col='day').rename(columns={
+            'trades': 'Trades', 'net_profit': 'Net Profit', 'profit_factor': 'Profit Factor',
+            'win_rate': 'Win Rate', 'max_drawdown': 'Max Drawdown'})
+        account_perf['account_id'] = account_perf['account_id'].astype(str)
+        account_perf = account_perf[['account_id', 'Trades', 'Net Profit', 'Profit Factor', 'Win Rate', 'Max Drawdown']]
         
         st.dataframe(
             account_perf,
@@ -360,25 +443,69 @@ if engine:
                 "Trades": st.column_config.NumberColumn("Trades", format="%d"),
                 "Net Profit": st.column_config.NumberColumn("Net Profit", format="$%.2f"),
                 "Profit Factor": st.column_config.NumberColumn("Profit Factor", format="%.2f"),
-                "Win Rate": st.column_config.NumberColumn("Win Rate", format="%.1f%%")
+                "Win Rate": st.column_config.NumberColumn("Win Rate", format="%.1f%%"),
+                "Max Drawdown": st.column_config.NumberColumn("Max Drawdown", format="$%.2f", help="Measured on daily closing PnL")
             }
         )
 
+        # Risk metrics over each account's and EA's whole history (risk_state, no deal is read here)
+        st.subheader("Risk Metrics")
+        risk = load_risk_state()
+        if not risk.empty:
+            if selected_accounts:
+                risk = risk[risk['account_id'].isin(selected_accounts)]
+            risk = risk[risk['ea_name'].isna() | risk['ea_name'].isin(selected_eas)]
+            risk = risk.assign(
+                account_id=risk['account_id'].astype(str).map(lambda x: account_mapping.get(x, x)),
+                ea_name=risk['ea_name'].fillna("All EAs"),
+                max_drawdown_days=risk['max_drawdown_seconds'] / 86400,
+            )
+            st.caption("Whole history of each account and EA, kept up to date by the collector (date and symbol filters don't apply).")
+            st.dataframe(
+                risk[['account_id', 'ea_name', 'trades', 'net_profit', 'profit_factor', 'win_rate', 'max_drawdown',
+                      'max_drawdown_days', 'sharpe', 'sortino', 'max_win_streak', 'max_loss_streak']],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "account_id": st.column_config.TextColumn("Account"),
+                    "ea_name": st.column_config.TextColumn("EA"),
+                    "trades": st.column_config.NumberColumn("Trades", format="%d"),
+                    "net_profit": st.column_config.NumberColumn("Net Profit", format="$%.2f"),
+                    "profit_factor": st.column_config.NumberColumn("Profit Factor", format="%.2f"),
+                    "win_rate": st.column_config.NumberColumn("Win Rate", format="%.1f%%"),
+                    "max_drawdown": st.column_config.NumberColumn("Max Drawdown", format="$%.2f", help="Deal by deal"),
+                    "max_drawdown_days": st.column_config.NumberColumn("Longest Drawdown", format="%.1f days"),
+                    "sharpe": st.column_config.NumberColumn("Sharpe", format="%.2f", help="Per trade: mean / standard deviation of trade net profit"),
+                    "sortino": st.column_config.NumberColumn("Sortino", format="%.2f", help="Per trade: mean / downside deviation"),
+                    "max_win_streak": st.column_config.NumberColumn("Win Streak", format="%d"),
+                    "max_loss_streak": st.column_config.NumberColumn("Loss Streak", format="%d"),
+                }
+            )
+
         st.subheader("EA Breakdown")
-        ea_perf = trades_only.groupby('ea_name')['net_profit'].sum().reset_index().sort_values('net_profit', ascending=False)
+        ea_perf = group_metrics(trades_only, 'ea_name')[['ea_name', 'net_profit']].sort_values('net_profit', ascending=False)
         st.bar_chart(ea_perf, x='ea_name', y='net_profit')
 
         st.subheader("Raw Data")
-        st.dataframe(
-            filtered_df, 
-            hide_index=True, 
-            use_container_width=False,
-            column_config={
-                "ticket": st.column_config.NumberColumn("Ticket", format="%d"),
-                "magic_number": st.column_config.NumberColumn("Magic Number", format="%d"),
-                "account_id": st.column_config.TextColumn("Account ID"),
-            }
-        )
+        # Individual deals come from the in-memory deal frame; only rendered on request
+        if has_deals and st.checkbox("Show raw deals for the selected range"):
+            raw_df = load_trades(*filter_args)
+            st.dataframe(
+                raw_df, 
+                hide_index=True, 
+                use_container_width=False,
+                column_config={
+                    "ticket": st.column_config.NumberColumn("Ticket", format="%d"),
+                    "magic_number": st.column_config.NumberColumn("Magic Number", format="%d"),
+                    "account_id": st.column_config.TextColumn("Account ID"),
+                }
+            )
+
+    with st.sidebar.expander("⚡ Cache"):
+        st.dataframe(loader_cache.stats(), hide_index=True, use_container_width=True)
+        if trade_frame.df is not None:
+            st.caption(f"Deal frame: {len(trade_frame.df):,} deals, last refresh added "
+                       f"{trade_frame.last_refresh['new_rows']:,} in {trade_frame.last_refresh['seconds'] * 1000:.0f} ms")
 
 else:
     st.error("Could not connect to database.")
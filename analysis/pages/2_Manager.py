@@ -10,8 +10,11 @@ parent_dir = os.path.dirname(current_dir) # analysis
 root_dir = os.path.dirname(parent_dir) # root
 sys.path.append(root_dir)
 
-from shared.db_models import get_engine, EA, AppConfig
+from shared.db_models import EA, AppConfig
 from analysis.shared.ui_components import apply_theme
+from analysis.shared.cache import loader_cache
+from analysis.shared.db import get_db_engine
+from analysis.shared.trade_frame import trade_frame
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
@@ -19,13 +22,10 @@ load_dotenv(os.path.join(root_dir, ".env"))
 
 st.set_page_config(page_title="EA Manager", layout="wide")
 
-# DB Connection
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    st.error("DATABASE_URL not set")
+# DB Connection (shared with the other pages)
+engine = get_db_engine()
+if engine is None:
     st.stop()
-
-engine = get_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 
 def get_theme():
@@ -51,6 +51,9 @@ def save_changes(edited_df):
                 for index, row in edited_df.iterrows():
                     stmt = text("UPDATE eas SET name=:name, description=:desc WHERE magic_number=:magic AND account_id=:acc")
                     conn.execute(stmt, {"name": row['name'], "desc": row['description'], "magic": row['magic_number'], "acc": row['account_id']})
+        # EA names appear in most cached dashboard frames
+        loader_cache.invalidate()
+        trade_frame.reset()
         st.success("Changes saved successfully!")
     except Exception as e:
         st.error(f"Error saving changes: {e}")
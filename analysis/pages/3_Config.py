@@ -8,8 +8,10 @@ parent_dir = os.path.dirname(current_dir) # analysis
 root_dir = os.path.dirname(parent_dir) # root
 sys.path.append(root_dir)
 
-from shared.db_models import get_engine, AppConfig
+from shared.db_models import AppConfig
 from analysis.shared.ui_components import apply_theme, THEMES
+from analysis.shared.cache import loader_cache
+from analysis.shared.db import get_db_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 from dotenv import load_dotenv
@@ -17,8 +19,7 @@ from datetime import datetime
 
 load_dotenv(os.path.join(root_dir, ".env"))
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_engine(DATABASE_URL)
+engine = get_db_engine()
 Session = sessionmaker(bind=engine)
 
 # --- THEME MANAGEMENT ---
@@ -41,6 +42,8 @@ def save_config(key, value):
             """)
             conn.execute(stmt, {"key": key, "value": value, "time": datetime.utcnow()})
             conn.commit()
+        # Dashboard pages cache the theme
+        loader_cache.invalidate("theme")
     except Exception as e:
         st.error(f"Save failed: {e}")
 
@@ -167,6 +170,7 @@ def add_alias(acc_id, name):
             alias.updated_at = datetime.utcnow()
         session.commit()
         session.close()
+        loader_cache.invalidate("aliases")
         st.success(f"Saved alias for {acc_id}: {name}")
     except Exception as e:
         st.error(f"Error saving alias: {e}")
@@ -178,6 +182,7 @@ def delete_alias(acc_id):
         session.query(AccountAlias).filter_by(account_id=acc_id).delete()
         session.commit()
         session.close()
+        loader_cache.invalidate("aliases")
         st.success(f"Deleted alias for {acc_id}")
     except Exception as e:
         st.error(f"Error deleting alias: {e}")
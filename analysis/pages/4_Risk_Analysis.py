@@ -13,46 +13,67 @@ parent_dir = os.path.dirname(current_dir) # analysis
 root_dir = os.path.dirname(parent_dir) # root
 sys.path.append(root_dir)
 
-from shared.db_models import get_engine, AccountAlias, AppConfig
+from shared.db_models import AccountAlias, AppConfig
 from analysis.shared.ui_components import apply_theme, card_container, card_end
+from analysis.shared import queries
+from analysis.shared.cache import cached, loader_cache
+from analysis.shared.db import get_db_engine
+from analysis.shared.metrics import group_metrics, dominant_ea_map
+from analysis.shared.charts import scatter_figure
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(root_dir, ".env"))
 
 # --- DB & THEME ---
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_engine(DATABASE_URL)
+engine = get_db_engine()
 Session = sessionmaker(bind=engine)
+loader_cache.bind(engine)
 
-def get_theme():
-    try:
-        session = Session()
+# Cached fetchers raise on DB errors (failures are never cached). TTLs are in seconds.
+@cached("theme", ttl=300)
+def fetch_theme():
+    with Session() as session:
         conf = session.query(AppConfig).filter_by(key="ui_theme").first()
-        session.close()
         return conf.value if conf else "Light Mode"
+
+@cached("aliases", ttl=300)
+def fetch_aliases():
+    with Session() as session:
+        return {str(a.account_id): a.alias for a in session.query(AccountAlias).all()}
+
+@cached("ea_trade_counts", ttl=600, depends_on=("trades",))
+def fetch_ea_trade_counts():
+    return queries.load_ea_trade_counts(engine)
+
+@cached("filter_options", ttl=600, depends_on=("trades",))
+def fetch_filter_options():
+    return queries.load_filter_options(engine)
+
+@cached("risk_trades", ttl=300, depends_on=("trades",))
+def fetch_trades(columns, *filters):
+    return queries.load_trades(engine, columns, *filters, types=("BUY", "SELL"), exits_only=True)
+
+def get_theme():
+    try:
+        return fetch_theme()
     except: return "Light Mode"
 
 st.set_page_config(page_title="Risk Analysis", layout="wide")
 apply_theme(get_theme())
 
-def get_account_names(df):
+def get_account_names(account_ids):
     mapping = {}
     if not engine: return mapping
     try:
-        session = Session()
-        aliases = session.query(AccountAlias).all()
-        db_aliases = {str(a.account_id): a.alias for a in aliases}
-        session.close()
+        db_aliases = fetch_aliases()
     except: db_aliases = {}
     
     dominant_map = {}
-    if not df.empty and 'ea_name' in df.columns:
-        ea_counts = df.groupby(['account_id', 'ea_name']).size().reset_index(name='count')
-        ea_counts = ea_counts.sort_values(['account_id', 'count'], ascending=[True, False])
-        dominant_eas = ea_counts.drop_duplicates('account_id')
-        dominant_map = {str(row['account_id']): str(row['ea_name']) for _, row in dominant_eas.iterrows()}
+    try:
+        dominant_map = dominant_ea_map(fetch_ea_trade_counts())
+    except: pass
 
-    for acc in df['account_id'].unique():
+    for acc in account_ids:
         s = str(acc)
         if s in db_aliases: mapping[s] = db_aliases[s]
         elif s in dominant_map and dominant_map[s] not in ['nan', 'None']:
@@ -60,25 +81,14 @@ def get_account_names(df):
         else: mapping[s] = s
     return mapping
 
-def load_trades():
+# Only the columns this page uses
+TRADE_COLUMNS = ("ticket", "symbol", "volume", "profit", "commission", "swap", "close_time", "account_id", "ea_name")
+
+def load_trades(start_date, end_date, accounts, eas, symbols):
+    """BUY/SELL exit deals of the selection, filtered in SQL"""
     if not engine: return pd.DataFrame()
-    query = """
-    SELECT 
-        t.ticket, t.symbol, t.type, t.volume, t.profit, t.commission, t.swap, 
-        t.close_time, t.magic_number, t.account_id,
-        e.name as ea_name
-    FROM trades t
-    LEFT JOIN eas e ON t.magic_number = e.magic_number AND t.account_id = e.account_id
-    WHERE t.type IN ('BUY', 'SELL')
-    ORDER BY t.close_time ASC
-    """
     try:
-        df = pd.read_sql(query, engine)
-        if not df.empty:
-            df['close_time'] = pd.to_datetime(df['close_time'])
-            df['ea_name'] = df['ea_name'].fillna(df['magic_number'].astype(str))
-            df['net_profit'] = df['profit'] + df['commission'] + df['swap']
-        return df
+        return fetch_trades(TRADE_COLUMNS, start_date, end_date, accounts, eas, symbols)
     except Exception as e:
         st.error(f"Data Error: {e}")
         return pd.DataFrame()
@@ -87,19 +97,27 @@ def load_trades():
 st.title("⚖️ Risk & Volume Analysis")
 st.caption("Analyze trade performance by Lot Size to optimize risk efficiency.")
 
-df = load_trades()
+try:
+    options = fetch_filter_options()
+except Exception as e:
+    st.error(f"Data Error: {e}")
+    options = None
 
-if df.empty:
+if not options or not options["min_date"]:
     st.warning("No trade data found to analyze.")
     st.stop()
 
 # Filters
 with st.sidebar:
     st.header("Graph Filters")
-    alias_map = get_account_names(df)
-    df['account_label'] = df['account_id'].astype(str).map(lambda x: alias_map.get(x, x))
+    alias_map = get_account_names(options["accounts"])
     
-    all_accs = sorted(df['account_id'].unique())
+    try:
+        start_date, end_date = st.date_input("Date Range", [options["min_date"], options["max_date"]],
+                                             min_value=options["min_date"], max_value=options["max_date"])
+    except:
+        start_date, end_date = options["min_date"], options["max_date"]
+    all_accs = options["accounts"]
     sel_accs_raw = st.multiselect(
         "Accounts", 
         all_accs, 
@@ -107,26 +125,29 @@ with st.sidebar:
         format_func=lambda x: alias_map.get(str(x), str(x))
     )
     
-    sel_eas = st.multiselect("EAs", sorted(df['ea_name'].unique()), default=df['ea_name'].unique())
-    sel_pairs = st.multiselect("Symbols", sorted(df['symbol'].unique()), default=df['symbol'].unique())
-
-# Application
-mask = (
-    (df['account_id'].isin(sel_accs_raw)) &
-    (df['ea_name'].isin(sel_eas)) &
-    (df['symbol'].isin(sel_pairs))
+    sel_eas = st.multiselect("EAs", options["ea_names"], default=options["ea_names"])
+    sel_pairs = st.multiselect("Symbols", options["symbols"], default=options["symbols"])
+
+    with st.expander("⚡ Cache"):
+        st.dataframe(loader_cache.stats(), hide_index=True, use_container_width=True)
+
+# Application (filters run in SQL; only matching trades are fetched)
+filtered = load_trades(
+    start_date, end_date,
+    queries.selection(sel_accs_raw, all_accs),
+    queries.selection(sel_eas, options["ea_names"]),
+    queries.selection(sel_pairs, options["symbols"]),
 )
-filtered = df[mask].copy()
 
 if filtered.empty:
     st.info("No trades match filters.")
     st.stop()
 
+filtered['account_label'] = filtered['account_id'].astype(str).map(lambda x: alias_map.get(x, x))
+
 # --- ADVANCED ADVISOR LOGIC ---
-def calculate_pf(sub_df):
-    gross_profit = sub_df[sub_df['net_profit'] > 0]['net_profit'].sum()
-    gross_loss = abs(sub_df[sub_df['net_profit'] < 0]['net_profit'].sum())
-    return gross_profit / gross_loss if gross_loss > 0 else (999 if gross_profit > 0 else 0)
+# Profit factor shown when a group has gains but no losses
+PF_WITHOUT_LOSSES = 999
 
 st.subheader("1. Profit vs Volume Overview")
 c_chart, c_ai = st.columns([3, 1])
@@ -135,7 +156,8 @@ c_chart, c_ai = st.columns([3, 1])
 with c_chart:
 
     color_col = 'account_label' if len(sel_accs_raw) > 1 else 'ea_name'
-    fig = px.scatter(
+    # SVG, WebGL or a density grid depending on the number of trades
+    fig = scatter_figure(
         filtered, 
         x='volume', 
         y='net_profit', 
@@ -159,17 +181,20 @@ with c_chart:
 with c_ai:
     st.write("### 🤖 Advanced Advisor")
     
-    # Logic Buckets
-    small_trades = filtered[filtered['volume'] < 0.1]
-    large_trades = filtered[filtered['volume'] >= 0.1]
-    
-    pf_small = calculate_pf(small_trades)
-    pf_large = calculate_pf(large_trades)
+    # Logic Buckets (small < 0.1 lots <= large), both in one pass
+    size_stats = group_metrics(
+        filtered.assign(lot_class=filtered['volume'].lt(0.1).map({True: 'small', False: 'large'})),
+        'lot_class', without_losses=PF_WITHOUT_LOSSES,
+    ).set_index('lot_class')
+    pf_small = size_stats['profit_factor'].get('small', 0.0)
+    pf_large = size_stats['profit_factor'].get('large', 0.0)
+    n_small = int(size_stats['trades'].get('small', 0))
+    n_large = int(size_stats['trades'].get('large', 0))
     
     advice_list = []
     
     # 1. Lot Size Cap Advice
-    if not large_trades.empty and len(large_trades) > 5:
+    if n_large > 5:
         if pf_large < 1.0 and pf_small > 1.1:
             advice_list.append({
                 "type": "danger",
@@ -184,10 +209,7 @@ with c_ai:
             })
             
     # 2. Specific Losers
-    lot_stats = filtered.groupby('volume').agg(
-        pnl=('net_profit', 'sum'),
-        count=('ticket', 'count')
-    ).reset_index()
+    lot_stats = group_metrics(filtered, 'volume').rename(columns={'net_profit': 'pnl', 'trades': 'count'})
     worst_lot = lot_stats.sort_values('pnl').iloc[0]
     if worst_lot['pnl'] < -100 and worst_lot['count'] > 3:
         advice_list.append({
@@ -212,8 +234,8 @@ with c_ai:
             """, unsafe_allow_html=True)
             
     with st.expander("📊 Data Support"):
-        st.write(f"**Small Lots (<0.1)**: PF {pf_small:.2f} ({len(small_trades)} trades)")
-        st.write(f"**Large Lots (>= 0.1)**: PF {pf_large:.2f} ({len(large_trades)} trades)")
+        st.write(f"**Small Lots (<0.1)**: PF {pf_small:.2f} ({n_small} trades)")
+        st.write(f"**Large Lots (>= 0.1)**: PF {pf_large:.2f} ({n_large} trades)")
 
 
 
@@ -221,19 +243,39 @@ with c_ai:
 st.subheader("2. Deep Dive: Performance by Lot Category")
 
 
-bins = [0, 0.01, 0.05, 0.10, 0.50, 1.0, 100.0]
-labels = ["Micro (0.01)", "Tiny (0.02-0.05)", "Small (0.06-0.10)", "Medium (0.11-0.50)", "High (0.51-1.0)", "Whale (1.0+)"]
-
-filtered['lot_bucket'] = pd.cut(filtered['volume'], bins=bins, labels=labels, right=True)
-
-bucket_stats = filtered.groupby('lot_bucket', observed=False).agg(
-    Trades=('ticket', 'count'),
-    Net_Profit=('net_profit', 'sum'),
-    Profit_Factor=('net_profit', lambda x: calculate_pf(filtered.loc[x.index])),
-    Win_Rate=('net_profit', lambda x: ((x > 0).sum() / len(x) * 100) if len(x) > 0 else 0)
-).reset_index()
-
-bucket_stats = bucket_stats[bucket_stats['Trades'] > 0]
+# Upper bucket edges in lots (the last bucket is open-ended)
+DEFAULT_EDGES = [0.01, 0.05, 0.10, 0.50, 1.0]
+DEFAULT_LABELS = ["Micro (0.01)", "Tiny (0.02-0.05)", "Small (0.06-0.10)", "Medium (0.11-0.50)", "High (0.51-1.0)", "Whale (1.0+)"]
+BREAKDOWNS = {"None": None, "Account": "account_label", "EA": "ea_name", "Symbol": "symbol"}
+
+def parse_edges(text):
+    """'0.01, 0.05, 1' -> sorted positive bucket edges"""
+    return sorted({float(x) for x in text.replace(";", ",").split(",") if x.strip()} - {0.0})
+
+def bucket_labels(edges):
+    if edges == DEFAULT_EDGES:
+        return DEFAULT_LABELS
+    lows = [0.0] + edges[:-1]
+    return [f"{lo:g}-{hi:g}" for lo, hi in zip(lows, edges)] + [f"{edges[-1]:g}+"]
+
+c_edges, c_by = st.columns([2, 1])
+edges_text = c_edges.text_input("Bucket edges (lots)", ", ".join(f"{e:g}" for e in DEFAULT_EDGES))
+breakdown = BREAKDOWNS[c_by.selectbox("Break down by", list(BREAKDOWNS))]
+try:
+    edges = parse_edges(edges_text)
+    if not edges or edges[0] < 0:
+        raise ValueError
+except ValueError:
+    st.warning("Bucket edges must be positive numbers separated by commas. Using the defaults.")
+    edges = DEFAULT_EDGES
+
+filtered['lot_bucket'] = pd.cut(filtered['volume'], bins=[0] + edges + [float('inf')], labels=bucket_labels(edges), right=True)
+
+# One vectorized pass: gross profit/loss are summed per bucket, PF and win rate derived from them
+group_by = ['lot_bucket'] + ([breakdown] if breakdown else [])
+bucket_stats = group_metrics(filtered, group_by, without_losses=PF_WITHOUT_LOSSES).rename(columns={
+    'trades': 'Trades', 'net_profit': 'Net_Profit', 'profit_factor': 'Profit_Factor', 'win_rate': 'Win_Rate'})
+bucket_stats = bucket_stats[group_by + ['Trades', 'Net_Profit', 'Profit_Factor', 'Win_Rate']]
 
 c1, c2 = st.columns([2, 1])
 
@@ -242,8 +284,9 @@ with c1:
         bucket_stats, 
         x='lot_bucket', 
         y='Net_Profit', 
-        color='Net_Profit',
+        color=breakdown or 'Net_Profit',
         color_continuous_scale='RdYlGn',
+        barmode='group',
         title="Net Profit by Category",
         text_auto='.2s'
     )
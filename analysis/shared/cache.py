@@ -0,0 +1,124 @@
+"""
+Process-wide cache for the dashboard data loaders.
+
+Every Streamlit interaction re-runs the page script, so without a cache each click
+re-queries the database. A loader decorated with `cached()` keeps its result for
+its own TTL. Loaders that declare `depends_on` also key their entries on a cheap
+"data version" (newest deal per account, newest snapshot, open position state):
+their frames are reused until the collector actually writes something new, which
+then shows up within VERSION_TTL seconds instead of after the loader's TTL.
+
+Entries are shared by all sessions of the Streamlit server. Hit/miss counts per
+loader are available from `stats()`.
+"""
+import time
+import threading
+import functools
+
+import pandas as pd
+
+from analysis.shared.queries import load_data_version
+
+# Seconds between data-version checks (bounds how stale a "fresh" frame can be)
+VERSION_TTL = 5.0
+
+class LoaderCache:
+    def __init__(self, version_ttl=VERSION_TTL):
+        self.version_ttl = version_ttl
+        self.engine = None
+        self.entries = {} # (loader, args, version) -> (expires_at, value)
+        self.counts = {} # loader -> {"hits": n, "misses": n}
+        self.lock = threading.Lock()
+        self._version = None # (fetched_at, {source: version})
+
+    def bind(self, engine):
+        """Engine used for data-version checks (the page's engine)"""
+        if engine is not self.engine:
+            self.engine = engine
+            self._version = None
+
+    def data_version(self):
+        with self.lock:
+            if self._version and time.monotonic() - self._version[0] < self.version_ttl:
+                return self._version[1]
+        version = load_data_version(self.engine)
+        with self.lock:
+            self._version = (time.monotonic(), version)
+        return version
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return True, entry[1]
+            if entry:
+                del self.entries[key]
+        return False, None
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            now = time.monotonic()
+            # Drop expired entries, and this call's entries for older data versions
+            for old_key in [k for k, (expires, _) in self.entries.items() if expires <= now or k[:3] == key[:3]]:
+                del self.entries[old_key]
+            self.entries[key] = (now + ttl, value)
+
+    def count(self, name, hit):
+        with self.lock:
+            counts = self.counts.setdefault(name, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def invalidate(self, *names):
+        """Drop cached entries of the named loaders (all loaders if none given)"""
+        with self.lock:
+            self.entries = {k: v for k, v in self.entries.items() if names and k[0] not in names}
+            self._version = None
+
+    def stats(self):
+        """Hit/miss counts per loader as a DataFrame"""
+        with self.lock:
+            rows = [{"loader": name, **counts} for name, counts in sorted(self.counts.items())]
+            cached = {}
+            for key in self.entries:
+                cached[key[0]] = cached.get(key[0], 0) + 1
+        df = pd.DataFrame(rows, columns=["loader", "hits", "misses"])
+        if not df.empty:
+            df["hit_rate"] = df["hits"] / (df["hits"] + df["misses"]) * 100
+            df["entries"] = df["loader"].map(cached).fillna(0).astype(int)
+        return df
+
+loader_cache = LoaderCache()
+
+def _freeze(value):
+    """Hashable cache key for loader arguments (sidebar selections are lists)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def cached(name, ttl, depends_on=()):
+    """
+    Cache a loader's result for `ttl` seconds. `depends_on` names data-version
+    sources ("trades", "snapshots", "positions") whose change invalidates it.
+    Exceptions are not cached. DataFrames are copied on the way out, so callers
+    may modify them.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            version = None
+            if depends_on:
+                data_version = loader_cache.data_version()
+                version = tuple(data_version[source] for source in depends_on)
+            key = (name, _freeze(args), _freeze(kwargs), version)
+            hit, value = loader_cache.get(key)
+            loader_cache.count(name, hit)
+            if not hit:
+                value = func(*args, **kwargs)
+                loader_cache.put(key, value, ttl)
+            return value.copy() if isinstance(value, pd.DataFrame) else value
+        return wrapper
+    return decorator
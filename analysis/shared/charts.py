@@ -0,0 +1,114 @@
+"""
+Server-side decimation for Plotly charts.
+
+The browser only has so many pixels: a line chart needs at most a couple of
+points per horizontal pixel, and a scatter of a million trades is a blob. These
+helpers keep the payload bounded whatever the history size.
+
+- `lttb()` / `minmax()`: indices of the points to keep from a time series.
+  Largest-Triangle-Three-Buckets keeps the visual shape (peaks and troughs
+  included); min/max bucketing keeps every bucket's extremes exactly.
+- `decimate()`: a DataFrame reduced to `max_points` rows with one of them.
+- `scatter_figure()`: px.scatter (SVG) for small sets, WebGL above
+  SVG_MAX_POINTS, and a server-side 2D histogram above WEBGL_MAX_POINTS.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Points per line chart (~2 per horizontal pixel of a full-width chart)
+MAX_POINTS = 2000
+# Line charts get markers up to this many points
+MARKERS_MAX_POINTS = 200
+# Scatter rendering thresholds
+SVG_MAX_POINTS = 5_000
+WEBGL_MAX_POINTS = 200_000
+DENSITY_BINS = 100
+
+def _as_float(values):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("int64").to_numpy(dtype=float)
+    return values.to_numpy(dtype=float)
+
+def lttb(x, y, n_out):
+    """Indices (ascending) of the `n_out` points Largest-Triangle-Three-Buckets keeps; x must be sorted"""
+    x, y = _as_float(x), _as_float(y)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # First and last point are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Third vertex: the average of the next bucket (the last point for the last bucket)
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if not np.isnan(area).all() else lo
+        keep[i + 1] = a
+    return keep
+
+def minmax(y, n_out):
+    """Indices (ascending) of the min and max of each of (n_out - 2) // 2 equal-count buckets, plus first and last"""
+    y = pd.Series(_as_float(y))
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    buckets = np.arange(n) * ((n_out - 2) // 2) // n
+    grouped = y.groupby(buckets)
+    keep = np.concatenate([[0, n - 1], grouped.idxmin().dropna().to_numpy(), grouped.idxmax().dropna().to_numpy()])
+    return np.unique(keep.astype(np.int64))
+
+def decimate(df, x, y, max_points=MAX_POINTS, method="lttb"):
+    """`df` (sorted by `x`) reduced to at most `max_points` rows that keep the shape of `y`"""
+    if len(df) <= max_points:
+        return df
+    keep = lttb(df[x], df[y], max_points) if method == "lttb" else minmax(df[y], max_points)
+    return df.iloc[keep]
+
+def line_figure(df, x, y, max_points=MAX_POINTS, **kwargs):
+    """px.line of the decimated series, with markers only while they stay readable"""
+    points = decimate(df.reset_index(drop=True), x, y, max_points)
+    return px.line(points, x=x, y=y, markers=len(points) <= MARKERS_MAX_POINTS, **kwargs)
+
+def _ols_line(x, y):
+    """(xs, ys) of the least-squares line over the whole x range"""
+    x, y = _as_float(x), _as_float(y)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    if ok.sum() < 2 or np.ptp(x[ok]) == 0:
+        return None
+    slope, intercept = np.polyfit(x[ok], y[ok], 1)
+    xs = np.array([x[ok].min(), x[ok].max()])
+    return xs, slope * xs + intercept
+
+def scatter_figure(df, x, y, color=None, hover_data=None, trendline="ols", **kwargs):
+    """
+    Scatter that stays responsive with any number of points:
+    - up to SVG_MAX_POINTS: px.scatter as usual
+    - up to WEBGL_MAX_POINTS: the same in WebGL (no hover data, it's the payload)
+    - above: a 2D histogram computed here (DENSITY_BINS x DENSITY_BINS cells) with
+      one least-squares line over all points; `color` is not shown
+    """
+    n = len(df)
+    if n <= WEBGL_MAX_POINTS:
+        webgl = n > SVG_MAX_POINTS
+        return px.scatter(df, x=x, y=y, color=color, hover_data=None if webgl else hover_data, trendline=trendline,
+                          render_mode="webgl" if webgl else "auto", **kwargs)
+
+    xs, ys = _as_float(df[x]), _as_float(df[y])
+    ok = ~(np.isnan(xs) | np.isnan(ys))
+    counts, x_edges, y_edges = np.histogram2d(xs[ok], ys[ok], bins=DENSITY_BINS)
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=np.where(counts > 0, counts, np.nan).T, colorscale="Viridis", colorbar=dict(title="Trades"),
+    ))
+    line = _ols_line(xs, ys) if trendline else None
+    if line is not None:
+        fig.add_trace(go.Scatter(x=line[0], y=line[1], mode="lines", name="OLS", line=dict(color="#ff4b4b")))
+    fig.update_layout(title=kwargs.get("title"), height=kwargs.get("height"))
+    return fig
@@ -0,0 +1,35 @@
+"""
+One database engine per Streamlit process, shared by every page, session and rerun.
+
+Pages used to create an engine at module level, i.e. a new engine, pool and TLS
+handshake with NeonDB on every rerun and page switch. `get_db_engine()` is an
+`st.cache_resource`, so the pool (and its warm connections) outlives reruns;
+pool settings are in shared/db_models.py.
+
+Environment:
+- DATABASE_URL: the database
+- DB_POOL_SIZE: connections kept open (default POOL_SIZE)
+- DB_POOLER_URL: optional connection pooler to go through instead, e.g. a
+  PgBouncer on localhost in transaction mode in front of Neon. The pooler keeps
+  the connections to Neon; connecting to it is cheap, so pages hold no pool of
+  their own (NullPool).
+"""
+import os
+
+import streamlit as st
+from sqlalchemy.pool import NullPool
+
+from shared.db_models import get_engine
+
+@st.cache_resource
+def get_db_engine():
+    """The process-wide engine (None without DATABASE_URL)"""
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        st.error("DATABASE_URL not found. Please set it in .env")
+        return None
+    pooler_url = os.getenv("DB_POOLER_URL")
+    if pooler_url:
+        return get_engine(pooler_url, poolclass=NullPool, pool_pre_ping=False)
+    pool_size = os.getenv("DB_POOL_SIZE")
+    return get_engine(db_url, **({"pool_size": int(pool_size)} if pool_size else {}))
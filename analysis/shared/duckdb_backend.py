@@ -0,0 +1,160 @@
+"""
+Optional DuckDB backend for the dashboard's daily PnL loader.
+
+`load_daily_pnl()` has the same signature and result as `queries.load_daily_pnl()`,
+but computes the per account/EA/symbol/day aggregates from raw deals with
+vectorized, multi-threaded SQL in an embedded DuckDB instead of reading the
+`daily_pnl` table. Deals come from:
+- the local Parquet mirror (PARQUET_MIRROR_DIR), pruned to the partitions of the
+  selected accounts and months, or
+- a SQLite copy of the database (DUCKDB_SQLITE_PATH), read through DuckDB's
+  sqlite extension.
+
+Enable with ANALYTICS_BACKEND=duckdb (needs `pip install duckdb`). Results reflect
+the source as of its last sync. EA names still come from the database.
+"""
+import os
+import logging
+import threading
+
+import pandas as pd
+
+from analysis.shared import queries
+from shared import parquet_mirror
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Same columns as queries.load_daily_pnl (the daily_pnl table + ea_name)
+COLUMNS = ["account_id", "magic_number", "symbol", "day", "net_profit", "gross_profit", "gross_loss", "trades",
+           "wins", "losses", "volume", "deposits", "ea_name"]
+
+_conn = None
+_lock = threading.Lock()
+
+def get_source():
+    """("parquet", mirror dir) or ("sqlite", file), None when neither is configured"""
+    if parquet_mirror.get_mirror_dir():
+        return "parquet", parquet_mirror.get_mirror_dir()
+    if os.getenv("DUCKDB_SQLITE_PATH"):
+        return "sqlite", os.getenv("DUCKDB_SQLITE_PATH")
+    return None
+
+def enabled():
+    """ANALYTICS_BACKEND=duckdb, with duckdb installed and a source configured"""
+    if os.getenv("ANALYTICS_BACKEND", "sql").lower() != "duckdb":
+        return False
+    if duckdb is None or get_source() is None:
+        logger.warning("ANALYTICS_BACKEND=duckdb needs duckdb and PARQUET_MIRROR_DIR or DUCKDB_SQLITE_PATH; using SQL")
+        return False
+    return True
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _cursor():
+    """Cursor on the process-wide DuckDB connection (one cursor per thread/query)"""
+    global _conn
+    with _lock:
+        if _conn is None:
+            conn = duckdb.connect()
+            source = get_source()
+            if source and source[0] == "sqlite":
+                conn.execute(f"ATTACH {_quote(source[1])} AS src (TYPE sqlite, READ_ONLY)")
+            _conn = conn
+        return _conn.cursor()
+
+def parquet_relation(files):
+    """DuckDB FROM clause reading the given Parquet files (files written before a column was added lack it)"""
+    return f"read_parquet([{', '.join(_quote(f) for f in files)}], union_by_name = true)"
+
+def _deals_relation(start, end, accounts):
+    """FROM clause with the raw deals, or None when no partition can match"""
+    kind, location = get_source()
+    if kind == "sqlite":
+        return "src.trades"
+    files = parquet_mirror.partition_files(location, "trades", accounts, start, end)
+    if not files:
+        return None
+    return parquet_relation(files)
+
+def aggregate_daily_pnl(cursor, relation, eas, start=None, end=None, accounts=None, ea_names=None, symbols=None):
+    """
+    Aggregate the deals of `relation` (a DuckDB FROM clause) like shared.rollups:
+    BALANCE deals count as deposits, every other deal adds net profit = profit +
+    commission + swap and, unless it is an IN deal, counts as a trade. `eas` is a
+    DataFrame of registered EA names.
+    """
+    cursor.register("ea_names", eas)
+    # Sources older than migration 5 have no entry column: every deal counts
+    has_entry = "entry" in {row[0] for row in cursor.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
+    where, params = ["close_time IS NOT NULL"], {}
+    if start is not None:
+        where.append("close_time >= $start")
+        params["start"] = start
+    if end is not None:
+        where.append("close_time < $end")
+        params["end"] = end
+    if accounts is not None:
+        where.append("list_contains($accounts, account_id)")
+        params["accounts"] = [int(a) for a in accounts]
+    ea_name = "coalesce(e.name, CAST(t.magic_number AS VARCHAR))"
+    joined_where = []
+    if ea_names is not None:
+        joined_where.append(f"list_contains($ea_names, {ea_name})")
+        params["ea_names"] = list(ea_names)
+    if symbols is not None:
+        # Balance operations (symbol '') carry the deposits, keep them
+        joined_where.append("list_contains($symbols, t.symbol)")
+        params["symbols"] = list(symbols) + [""]
+
+    sql = f"""
+    WITH t AS (
+        SELECT account_id,
+               coalesce(magic_number, 0) AS magic_number,
+               coalesce(symbol, '') AS symbol,
+               CAST(close_time AS DATE) AS day,
+               coalesce(type, '') <> 'BALANCE' AS is_trade,
+               coalesce(type, '') <> 'BALANCE' {"AND coalesce(entry, '') <> 'IN'" if has_entry else ''} AS is_exit,
+               coalesce(profit, 0) + coalesce(commission, 0) + coalesce(swap, 0) AS net,
+               coalesce(profit, 0) AS profit,
+               coalesce(volume, 0) AS volume
+        FROM {relation}
+        WHERE {' AND '.join(where)}
+    )
+    SELECT t.account_id, t.magic_number, t.symbol, t.day,
+           sum(CASE WHEN is_trade THEN net ELSE 0 END) AS net_profit,
+           sum(CASE WHEN is_trade AND net > 0 THEN net ELSE 0 END) AS gross_profit,
+           sum(CASE WHEN is_trade AND net < 0 THEN net ELSE 0 END) AS gross_loss,
+           CAST(count(*) FILTER (WHERE is_exit) AS BIGINT) AS trades,
+           CAST(count(*) FILTER (WHERE is_exit AND net > 0) AS BIGINT) AS wins,
+           CAST(count(*) FILTER (WHERE is_exit AND net < 0) AS BIGINT) AS losses,
+           sum(CASE WHEN is_trade THEN volume ELSE 0 END) AS volume,
+           sum(CASE WHEN is_trade THEN 0 ELSE profit END) AS deposits,
+           {ea_name} AS ea_name
+    FROM t
+    LEFT JOIN ea_names e ON e.account_id = t.account_id AND e.magic_number = t.magic_number
+    {'WHERE ' + ' AND '.join(joined_where) if joined_where else ''}
+    GROUP BY ALL
+    ORDER BY t.day
+    """
+    df = cursor.execute(sql, params).df()
+    df['day'] = pd.to_datetime(df['day'])
+    return df[COLUMNS]
+
+def load_daily_pnl(engine, start_date=None, end_date=None, accounts=None, ea_names=None, symbols=None):
+    """Drop-in for `queries.load_daily_pnl`, aggregated by DuckDB from the configured source"""
+    start, end = queries._day_bounds(start_date, end_date)
+    relation = _deals_relation(start, end, accounts)
+    if relation is None:
+        return pd.DataFrame(columns=COLUMNS)
+    eas = queries.load_ea_names(engine).astype({"account_id": "int64", "magic_number": "int64"})
+    cursor = _cursor()
+    try:
+        return aggregate_daily_pnl(cursor, relation, eas, start, end, accounts, ea_names, symbols)
+    finally:
+        cursor.close()
@@ -0,0 +1,94 @@
+"""
+Vectorized performance metrics for the dashboard pages.
+
+`group_metrics()` computes trades, net profit, gross profit/loss, profit factor, win
+rate and max drawdown per group for any grouping key, in a handful of groupby
+passes (no Python loop over groups). It accepts either
+- deals: one row per deal with `net_profit` (e.g. the deal frame), or
+- rollup rows: `daily_pnl`-shaped rows carrying net_profit, gross_profit,
+  gross_loss, trades, wins and losses.
+
+Drawdown follows the Dashboard convention: the running peak starts at the first
+point of the equity curve, so it is 0 when every point is a new high.
+"""
+import numpy as np
+import pandas as pd
+
+SUMMED = ["trades", "wins", "losses", "net_profit", "gross_profit", "gross_loss"]
+
+def equity_drawdown(net_profit):
+    """Max drawdown (<= 0) of the equity curve built from a series of net profits"""
+    if net_profit.empty:
+        return 0.0
+    equity = net_profit.fillna(0.0).cumsum()
+    return float((equity - equity.cummax()).min())
+
+def floating_drawdown(series):
+    """
+    Adds open_pnl and the floating drawdown (each bucket's low against the running
+    peak of bucket closes) to queries.load_equity_series. Lows are summed over the
+    accounts, as if they bottomed out together, so the drawdown errs on the
+    cautious side.
+    """
+    series = series.copy()
+    series["open_pnl"] = series["equity"] - series["balance"]
+    series["drawdown"] = (series["low"] - series["equity"].cummax()).clip(upper=0.0)
+    return series
+
+def profit_factor(gross_profit, gross_loss, without_losses=0.0):
+    """
+    gross_profit / |gross_loss| (scalars or Series). Without losses: `without_losses`
+    if there was any profit, else 0.
+    """
+    gross_profit = np.asarray(gross_profit, dtype=float)
+    gross_loss = np.abs(np.asarray(gross_loss, dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pf = np.where(gross_loss > 0, gross_profit / gross_loss, np.where(gross_profit > 0, without_losses, 0.0))
+    return pf if pf.ndim else float(pf)
+
+def deal_measures(deals):
+    """Per-deal rows -> rollup-shaped measures (one row per deal)"""
+    net = deals["net_profit"].fillna(0.0).to_numpy()
+    return deals.assign(
+        trades=np.ones(len(net), dtype="int64"),
+        wins=(net > 0).astype("int64"),
+        losses=(net < 0).astype("int64"),
+        net_profit=net,
+        gross_profit=np.maximum(net, 0.0),
+        gross_loss=np.minimum(net, 0.0),
+    )
+
+def group_metrics(df, by, time_col=None, without_losses=0.0):
+    """
+    Metrics per group of `by` (column name or list of names), one row per group:
+    trades, wins, losses, net_profit, gross_profit, gross_loss, profit_factor,
+    win_rate (%) and, when `time_col` is given, max_drawdown along that column.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    columns = by + SUMMED + ["profit_factor", "win_rate"] + (["max_drawdown"] if time_col else [])
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    if "trades" not in df:
+        # Only the columns needed (assigning measures to a wide frame would copy all of it)
+        df = deal_measures(df[by + ([time_col] if time_col else []) + ["net_profit"]])
+
+    out = df.groupby(by, observed=True, sort=True)[SUMMED].sum()
+    out["profit_factor"] = profit_factor(out["gross_profit"], out["gross_loss"], without_losses)
+    out["win_rate"] = (out["wins"] / out["trades"].replace(0, np.nan) * 100).fillna(0.0)
+
+    if time_col:
+        # Equity per group along time_col (rows sharing a time point are summed first)
+        points = df.groupby(by + [time_col], observed=True, sort=True)["net_profit"].sum()
+        keys = [points.index.get_level_values(b) for b in by]
+        equity = points.groupby(keys, observed=True).cumsum()
+        drawdown = equity - equity.groupby(keys, observed=True).cummax()
+        out["max_drawdown"] = drawdown.groupby(keys, observed=True).min()
+
+    return out.reset_index()[columns]
+
+def dominant_ea_map(ea_counts):
+    """{str(account_id): str(ea_name)} of the EA with most trades per account"""
+    if ea_counts.empty:
+        return {}
+    top = ea_counts.sort_values(["account_id", "count"], ascending=[True, False]).drop_duplicates("account_id")
+    return dict(zip(top["account_id"].astype(str), top["ea_name"].astype(str)))
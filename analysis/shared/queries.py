@@ -0,0 +1,351 @@
+"""
+Query layer for the dashboard pages.
+
+Sidebar selections are turned into parameterized SQL, so pages only fetch the rows
+and columns they show instead of filtering the whole `trades` table in pandas.
+Filter arguments follow one convention: None means "no filter" (everything
+selected), a list (possibly empty) restricts to those values.
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import select, func, cast, or_, tuple_, case, literal_column, union_all, String, Integer
+
+from shared.db_models import Trade, EA, DailyPnl, AccountSnapshot, OpenPosition, EquityBar, RiskState
+from shared import risk_state
+from analysis.shared.metrics import profit_factor
+
+def selection(selected, options):
+    """Sidebar multiselect -> filter value: None when everything is selected (no IN list needed)"""
+    if set(selected) >= set(options):
+        return None
+    return list(selected)
+
+def _ea_name(table):
+    """EA display name: registered name, else the magic number"""
+    return func.coalesce(EA.name, cast(table.c.magic_number, String))
+
+def _join_eas(table):
+    return table.outerjoin(EA.__table__, (table.c.magic_number == EA.magic_number) & (table.c.account_id == EA.account_id))
+
+def _day_bounds(start_date, end_date):
+    start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+    return start, end
+
+def _apply_filters(query, table, accounts, ea_names, symbols):
+    if accounts is not None:
+        query = query.where(table.c.account_id.in_([int(a) for a in accounts]))
+    if ea_names is not None:
+        query = query.where(_ea_name(table).in_(list(ea_names)))
+    if symbols is not None:
+        query = query.where(table.c.symbol.in_(list(symbols)))
+    return query
+
+# --- Data version (what the collector has written so far) ---
+
+def load_data_version(engine):
+    """
+    Cheap fingerprint of the collector's writes, used as a cache key:
+    - trades: newest close_time per account (one index probe per account on
+      trades(account_id, close_time); accounts come from the small daily_pnl rollup)
+    - snapshots: newest snapshot timestamp (collector clock, so one global max will do)
+    - positions: row count and newest update of the small open_positions table
+    """
+    rollup = DailyPnl.__table__
+    accounts = select(rollup.c.account_id).distinct().subquery()
+    newest_deal = (select(func.max(Trade.close_time)).where(Trade.account_id == accounts.c.account_id)
+                   .scalar_subquery())
+    with engine.connect() as conn:
+        trades = conn.execute(select(accounts.c.account_id, newest_deal).order_by(accounts.c.account_id)).all()
+        snapshots = conn.execute(select(func.max(AccountSnapshot.timestamp))).scalar()
+        positions = conn.execute(select(func.count(), func.max(OpenPosition.updated_at))).one()
+    return {
+        "trades": tuple(tuple(row) for row in trades),
+        "snapshots": snapshots,
+        "positions": tuple(positions),
+    }
+
+# --- Filter options (cheap DISTINCT queries on the daily_pnl rollup) ---
+
+def load_filter_options(engine):
+    """Accounts, EA names, symbols and the date range available for filtering"""
+    rollup = DailyPnl.__table__
+    with engine.connect() as conn:
+        accounts = conn.execute(select(rollup.c.account_id).distinct().order_by(rollup.c.account_id)).scalars().all()
+        ea_names = conn.execute(select(_ea_name(rollup)).distinct().select_from(_join_eas(rollup))).scalars().all()
+        symbols = conn.execute(select(rollup.c.symbol).distinct().where(rollup.c.symbol != "")).scalars().all()
+        min_day, max_day = conn.execute(select(func.min(rollup.c.day), func.max(rollup.c.day))).one()
+    return {
+        "accounts": list(accounts),
+        "ea_names": sorted(ea_names),
+        "symbols": sorted(symbols),
+        "min_date": pd.to_datetime(min_day).date() if min_day else None,
+        "max_date": pd.to_datetime(max_day).date() if max_day else None,
+    }
+
+def load_ea_names(engine):
+    """Registered EA names per (account_id, magic_number)"""
+    return pd.read_sql(select(EA.account_id, EA.magic_number, EA.name), engine)
+
+def load_ea_trade_counts(engine):
+    """Trades per (account_id, ea_name), for naming accounts after their dominant EA"""
+    rollup = DailyPnl.__table__
+    ea_name = _ea_name(rollup).label("ea_name")
+    query = (select(rollup.c.account_id, ea_name, func.sum(rollup.c.trades).label("count"))
+             .select_from(_join_eas(rollup)).group_by(rollup.c.account_id, ea_name))
+    return pd.read_sql(query, engine)
+
+# --- Data ---
+
+def load_daily_pnl(engine, start_date=None, end_date=None, accounts=None, ea_names=None, symbols=None):
+    """
+    daily_pnl rows matching the filters. Balance operations (symbol '') are kept
+    whatever the symbol filter, since they carry the deposits.
+    """
+    rollup = DailyPnl.__table__
+    query = select(rollup, _ea_name(rollup).label("ea_name")).select_from(_join_eas(rollup))
+    if start_date is not None:
+        query = query.where(rollup.c.day >= start_date)
+    if end_date is not None:
+        query = query.where(rollup.c.day <= end_date)
+    query = _apply_filters(query, rollup, accounts, ea_names, None if symbols is None else list(symbols) + [""])
+    df = pd.read_sql(query.order_by(rollup.c.day), engine)
+    if not df.empty:
+        df['day'] = pd.to_datetime(df['day'])
+    return df
+
+# Columns pages may ask load_trades for ("ea_name" is joined from eas)
+TRADE_COLUMNS = ("ticket", "account_id", "magic_number", "symbol", "type", "volume", "open_price", "close_price",
+                 "open_time", "close_time", "profit", "commission", "swap", "comment", "ea_name")
+
+def load_trades(engine, columns=TRADE_COLUMNS, start_date=None, end_date=None, accounts=None, ea_names=None,
+                symbols=None, types=None, exits_only=False):
+    """
+    Deals matching the filters, with only the requested columns, ordered by close_time.
+    Adds `net_profit` when profit, commission and swap are all requested.
+    `exits_only` drops IN deals (position entries carry no PnL of their own).
+    """
+    trades = Trade.__table__
+    cols = [_ea_name(trades).label("ea_name") if c == "ea_name" else trades.c[c] for c in columns]
+    query = select(*cols).select_from(_join_eas(trades) if "ea_name" in columns or ea_names is not None else trades)
+    start, end = _day_bounds(start_date, end_date)
+    if start is not None:
+        query = query.where(trades.c.close_time >= start)
+    if end is not None:
+        query = query.where(trades.c.close_time < end)
+    query = _apply_filters(query, trades, accounts, ea_names, symbols)
+    if types is not None:
+        query = query.where(trades.c.type.in_(list(types)))
+    if exits_only:
+        query = query.where(func.coalesce(trades.c.entry, "") != "IN")
+    return _read_trades(query.order_by(trades.c.close_time), engine)
+
+def load_new_trades(engine, columns, watermarks):
+    """
+    Deals past the per-account watermarks {account_id: (close_time, ticket)}, plus all
+    deals of accounts without one, ordered by (close_time, ticket). Each watermark is
+    a keyset probe on trades(account_id, close_time) that only touches the recent
+    months of a partitioned table. `columns` must include account_id, close_time
+    and ticket.
+    """
+    trades = Trade.__table__
+    cols = [_ea_name(trades).label("ea_name") if c == "ea_name" else trades.c[c] for c in columns]
+    query = select(*cols).select_from(_join_eas(trades) if "ea_name" in columns else trades)
+    if watermarks:
+        # Accounts without a watermark come from the (small) EA registry, which the collector
+        # fills for every account it writes deals for; a NOT IN arm would scan every deal.
+        new_accounts = sorted({int(a) for a in load_ea_names(engine)["account_id"]} - set(watermarks))
+        query = query.where(or_(
+            trades.c.account_id.in_(new_accounts),
+            # The plain close_time bound is what partition pruning and the index range use
+            *[(trades.c.account_id == account_id) & (trades.c.close_time >= close_time)
+              & (tuple_(trades.c.close_time, trades.c.ticket) > tuple_(close_time, ticket))
+              for account_id, (close_time, ticket) in watermarks.items()],
+        ))
+    return _read_trades(query.where(trades.c.close_time.is_not(None)).order_by(trades.c.close_time, trades.c.ticket), engine)
+
+def _read_trades(query, engine):
+    df = pd.read_sql(query, engine)
+    if "close_time" in df:
+        df['close_time'] = pd.to_datetime(df['close_time'])
+    if {"profit", "commission", "swap"} <= set(df.columns):
+        df['net_profit'] = df['profit'] + df['commission'] + df['swap']
+    return df
+
+def load_risk_state(engine, accounts=None):
+    """
+    Precomputed whole-history risk metrics (shared/risk_state.py): one row per
+    account (`ea_name` None) and per EA on it, with win_rate, profit_factor,
+    sharpe and sortino derived from the running totals
+    """
+    table = RiskState.__table__
+    query = select(table, _ea_name(table).label("ea_name")).select_from(_join_eas(table))
+    query = _apply_filters(query, table, accounts, None, None)
+    df = pd.read_sql(query.order_by(table.c.account_id, table.c.magic_number), engine)
+    df.loc[df['magic_number'] == risk_state.ALL_EAS, 'ea_name'] = None
+    states = df.to_dict("records")
+    df['win_rate'] = (df['wins'] / df['trades'].where(df['trades'] > 0) * 100).fillna(0.0)
+    df['profit_factor'] = profit_factor(df['gross_profit'], df['gross_loss'])
+    df['sharpe'] = pd.Series([risk_state.sharpe(s) for s in states], index=df.index, dtype=float)
+    df['sortino'] = pd.Series([risk_state.sortino(s) for s in states], index=df.index, dtype=float)
+    return df
+
+# --- Equity history (account_snapshots + equity_bars) ---
+
+# Bucket sizes of the equity series, finest first
+EQUITY_RESOLUTIONS = {
+    "1min": timedelta(minutes=1), "5min": timedelta(minutes=5), "15min": timedelta(minutes=15),
+    "1h": timedelta(hours=1), "4h": timedelta(hours=4), "1d": timedelta(days=1), "1w": timedelta(weeks=1),
+}
+# Buckets per series, whatever the window
+EQUITY_MAX_POINTS = 2000
+# Buckets are aligned on this Monday (weeks start on Mondays, like date_trunc('week'))
+_BUCKET_ORIGIN = datetime(2000, 1, 3)
+# Equity history sources, finest first: raw snapshots, then the bars shared/retention.py builds
+_EQUITY_SOURCES = {"raw": None, "1h": timedelta(hours=1), "1d": timedelta(days=1)}
+
+def equity_resolution(start_date, end_date, requested=None, first=None, max_points=EQUITY_MAX_POINTS):
+    """
+    Resolution load_equity_series uses: the finest one (at least `requested`) that
+    keeps the window within `max_points` buckets. An open window runs from `first`
+    (the earliest sample) to now.
+    """
+    now = datetime.utcnow()
+    start, end = _day_bounds(start_date, end_date)
+    start = start if start is not None else (first or now)
+    span = max(min(end or now, now) - start, timedelta(0))
+    floor = EQUITY_RESOLUTIONS[requested] if requested else timedelta(0)
+    for name, step in EQUITY_RESOLUTIONS.items():
+        if step >= floor and span / step <= max_points:
+            return name
+    return "1w"
+
+def _time_bucket(column, step, dialect):
+    """Start of the `step`-sized bucket holding `column`"""
+    seconds = int(step.total_seconds())
+    if dialect == "postgresql":
+        return func.date_bin(literal_column(f"interval '{seconds} seconds'"), column,
+                             literal_column(f"timestamp '{_BUCKET_ORIGIN:%Y-%m-%d}'"))
+    origin = int((_BUCKET_ORIGIN - datetime(1970, 1, 1)).total_seconds())
+    epoch = cast(func.strftime("%s", column), Integer)
+    return func.datetime((epoch - origin) // seconds * seconds + origin, "unixepoch")
+
+def _equity_coverage(conn, accounts):
+    """{source: (first, end)} of the equity history sources holding data (end None: still growing)"""
+    snaps, bars = AccountSnapshot.__table__, EquityBar.__table__
+    raw = select(func.min(snaps.c.timestamp))
+    by_resolution = (select(bars.c.resolution, func.min(bars.c.bucket), func.max(bars.c.bucket))
+                     .group_by(bars.c.resolution))
+    if accounts is not None:
+        raw = raw.where(snaps.c.account_id.in_([int(a) for a in accounts]))
+        by_resolution = by_resolution.where(bars.c.account_id.in_([int(a) for a in accounts]))
+    coverage = {}
+    first = conn.execute(raw).scalar()
+    if first is not None:
+        coverage["raw"] = (first, None)
+    for resolution, first, last in conn.execute(by_resolution):
+        if resolution in _EQUITY_SOURCES:
+            coverage[resolution] = (first, last + _EQUITY_SOURCES[resolution])
+    return coverage
+
+def _equity_ranges(coverage, step):
+    """
+    [(source, from, until)] reading each stretch of history from one source: the
+    coarsest one no coarser than `step`, finer ones for what is newer than its
+    last bar, coarser ones for what was aged out of it. None bounds are open.
+    """
+    available = [name for name in _EQUITY_SOURCES if name in coverage]
+    if not available:
+        return []
+    fitting = [i for i, name in enumerate(available) if _EQUITY_SOURCES[name] is None or _EQUITY_SOURCES[name] <= step]
+    primary = fitting[-1] if fitting else 0
+    first, end = coverage[available[primary]]
+    ranges = [(available[primary], None, end)]
+    for name in reversed(available[:primary]):
+        if end is None:
+            break
+        newest = coverage[name][1]
+        if newest is None or newest > end:
+            ranges.append((name, end, newest))
+            end = newest
+    for name in available[primary + 1:]:
+        # Whole bars only: the bar holding `first` also covers finer data
+        first = first - (first - _BUCKET_ORIGIN) % _EQUITY_SOURCES[name]
+        ranges.append((name, None, first))
+        first = min(first, coverage[name][0])
+    return ranges
+
+def _equity_source(name, lo, hi, start, end, accounts):
+    """Rows of one source as (account_id, ts, high, low, close, balance, margin)"""
+    if name == "raw":
+        t = AccountSnapshot.__table__
+        ts = t.c.timestamp
+        query = select(t.c.account_id, ts.label("ts"), t.c.equity.label("high"), t.c.equity.label("low"),
+                       t.c.equity.label("close"), t.c.balance, t.c.margin)
+    else:
+        t = EquityBar.__table__
+        ts = t.c.bucket
+        query = (select(t.c.account_id, ts.label("ts"), t.c.high, t.c.low, t.c.close, t.c.balance, t.c.margin)
+                 .where(t.c.resolution == name))
+    for bound in (lo, start):
+        if bound is not None:
+            query = query.where(ts >= bound)
+    for bound in (hi, end):
+        if bound is not None:
+            query = query.where(ts < bound)
+    if accounts is not None:
+        query = query.where(t.c.account_id.in_([int(a) for a in accounts]))
+    return query
+
+def load_equity_series(engine, start_date=None, end_date=None, accounts=None, resolution=None):
+    """
+    Equity history of the selected accounts together, bucketed and summed in SQL
+    so at most EQUITY_MAX_POINTS rows come back, whatever the window or the number
+    of accounts: (bucket, equity, low, balance, margin). Per account a bucket
+    holds its equity low, its equity and balance at the last sample and its highest
+    margin; an account without a sample in a bucket counts with its previous
+    values (nothing before its first sample). Raw snapshots are used where they are
+    fine enough and still kept, equity_bars elsewhere. `resolution` (a key of
+    EQUITY_RESOLUTIONS) is raised if it would exceed the budget.
+    """
+    start, end = _day_bounds(start_date, end_date)
+    with engine.connect() as conn:
+        coverage = _equity_coverage(conn, accounts)
+        if not coverage:
+            return pd.DataFrame(columns=["bucket", "equity", "low", "balance", "margin"])
+        first = min(first for first, _ in coverage.values())
+        step = EQUITY_RESOLUTIONS[equity_resolution(start_date, end_date, resolution, first)]
+
+        # 1. One row per (account, bucket)
+        sources = [_equity_source(name, lo, hi, start, end, accounts) for name, lo, hi in _equity_ranges(coverage, step)]
+        rows = union_all(*sources).subquery() if len(sources) > 1 else sources[0].subquery()
+        bucketed = select(rows, _time_bucket(rows.c.ts, step, conn.dialect.name).label("bucket")).subquery()
+        ranked = select(bucketed, func.row_number().over(
+            partition_by=(bucketed.c.account_id, bucketed.c.bucket), order_by=bucketed.c.ts.desc()).label("rn")).subquery()
+        last = lambda col: func.max(case((ranked.c.rn == 1, col)))
+        per_account = (select(ranked.c.account_id, ranked.c.bucket, func.min(ranked.c.low).label("low"),
+                              last(ranked.c.close).label("close"), last(ranked.c.balance).label("balance"),
+                              func.max(ranked.c.margin).label("margin"))
+                       .group_by(ranked.c.account_id, ranked.c.bucket).subquery())
+
+        # 2. Carry each account forward as changes against its previous bucket: the
+        # running sum of the changes is the accounts' total in every bucket
+        change = lambda col: func.coalesce(col, 0.0) - func.coalesce(func.lag(col).over(
+            partition_by=per_account.c.account_id, order_by=per_account.c.bucket), 0.0)
+        changes = select(per_account.c.bucket, change(per_account.c.close).label("close"),
+                         change(per_account.c.balance).label("balance"), change(per_account.c.margin).label("margin"),
+                         (per_account.c.low - per_account.c.close).label("dip")).subquery()
+        totals = (select(changes.c.bucket, func.sum(changes.c.close).label("close"),
+                         func.sum(changes.c.balance).label("balance"), func.sum(changes.c.margin).label("margin"),
+                         func.sum(changes.c.dip).label("dip"))
+                  .group_by(changes.c.bucket).subquery())
+        running = lambda col: func.sum(col).over(order_by=totals.c.bucket)
+        # Accounts with a sample in the bucket count with their low, the others with their close
+        query = (select(totals.c.bucket, running(totals.c.close).label("equity"),
+                        (running(totals.c.close) + func.coalesce(totals.c.dip, 0.0)).label("low"),
+                        running(totals.c.balance).label("balance"), running(totals.c.margin).label("margin"))
+                 .order_by(totals.c.bucket))
+        df = pd.read_sql(query, conn)
+    df['bucket'] = pd.to_datetime(df['bucket'])
+    return df
@@ -0,0 +1,152 @@
+"""
+Process-wide, append-only frame of all deals for the per-deal dashboard views.
+
+The first refresh reads the whole history once, from the local Parquet mirror when
+PARQUET_MIRROR_DIR is set (see shared/parquet_mirror.py) and from the database
+otherwise. After that a refresh only fetches
+deals past each account's (close_time, ticket) watermark and appends them, and
+only when the loader cache's data version for trades has moved, so an unchanged
+database costs no query at all.
+
+The frame is kept in (close_time, ticket) order with a running equity curve over
+all non-balance deals (`cum_net`, `peak`) and its max drawdown. New deals that sort
+after the current tail extend those columns from the last value; a batch that lands
+earlier (a newly added account backfilling its history) re-sorts the frame and
+recomputes them.
+
+Deals are never updated or deleted by the collector. Call `reset()` after changes
+the watermarks cannot see (EA renames in the Manager, manual deletes).
+"""
+import time
+import threading
+
+import pandas as pd
+
+from analysis.shared import queries
+from shared import parquet_mirror
+
+COLUMNS = ("ticket", "account_id", "magic_number", "symbol", "type", "entry", "volume", "profit", "commission",
+           "swap", "close_time", "ea_name")
+
+class TradeFrame:
+    def __init__(self):
+        self.df = None
+        self.watermarks = {} # account_id -> (close_time, ticket) of its newest deal in the frame
+        self.version = None
+        self.max_drawdown = 0.0
+        self.last_refresh = {"new_rows": 0, "seconds": 0.0}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.df = None
+            self.watermarks = {}
+            self.version = None
+            self.max_drawdown = 0.0
+
+    def refresh(self, engine, version=None):
+        """
+        Bring the frame up to date and return it (do not modify it; use `select()` for
+        a private copy). `version` is the loader cache's trades data version; when it
+        matches the previous refresh nothing is queried.
+        """
+        with self.lock:
+            if self.df is not None and version is not None and version == self.version:
+                return self.df
+            started = time.perf_counter()
+            added = 0
+            if self.df is None:
+                history = self._load_mirrored_history(engine)
+                if history is not None:
+                    self.df = self._with_equity(history, pd.DataFrame())
+                    self._move_watermarks(history)
+                    added += len(history)
+            # 1. Fetch everything past the watermarks (the whole history if there is none yet)
+            new = queries.load_new_trades(engine, COLUMNS, self.watermarks)
+            # 2. Append and extend the running equity columns
+            if self.df is None:
+                self.df = self._with_equity(new, pd.DataFrame())
+            elif not new.empty:
+                self.df = self._with_equity(new, self.df)
+            # 3. Move the watermarks
+            self._move_watermarks(new)
+            added += len(new)
+            self.version = version
+            self.last_refresh = {"new_rows": added, "seconds": time.perf_counter() - started}
+            return self.df
+
+    def _move_watermarks(self, new):
+        if new.empty:
+            return
+        newest = new.groupby("account_id")[["close_time", "ticket"]].last()
+        for account_id, row in newest.iterrows():
+            self.watermarks[int(account_id)] = (row["close_time"].to_pydatetime(), int(row["ticket"]))
+
+    def _load_mirrored_history(self, engine):
+        """All deals in the Parquet mirror, shaped like `load_new_trades` (None without a mirror)"""
+        root = parquet_mirror.get_mirror_dir()
+        if not root or not parquet_mirror.available():
+            return None
+        columns = [c for c in COLUMNS if c != "ea_name"]
+        df = parquet_mirror.read(root, "trades", columns=columns)
+        df = df.sort_values(["close_time", "ticket"], ignore_index=True)
+        # EA names come from the (small) eas table: registered name, else the magic number
+        names = queries.load_ea_names(engine)
+        df = df.merge(names, on=["account_id", "magic_number"], how="left")
+        magic = df["magic_number"].astype("Int64")
+        df["ea_name"] = df.pop("name").fillna(magic.astype(str).where(magic.notna()))
+        df["net_profit"] = df["profit"] + df["commission"] + df["swap"]
+        return df[[*COLUMNS, "net_profit"]]
+
+    def _with_equity(self, new, old):
+        net = new["net_profit"].where(new["type"] != "BALANCE", 0.0).fillna(0.0)
+        tail_key = (old["close_time"].iloc[-1], old["ticket"].iloc[-1]) if not old.empty else None
+        if tail_key is None or (new["close_time"].iloc[0], new["ticket"].iloc[0]) > tail_key:
+            # Extend from the last value: only the new rows are touched
+            last_cum = old["cum_net"].iloc[-1] if not old.empty else 0.0
+            last_peak = old["peak"].iloc[-1] if not old.empty else float("-inf")
+            new = new.assign(cum_net=last_cum + net.cumsum())
+            new["peak"] = new["cum_net"].cummax().clip(lower=last_peak)
+            if not old.empty:
+                new = pd.concat([old, new], ignore_index=True)
+            else:
+                new = new.reset_index(drop=True)
+            added = new.iloc[len(old):]
+            if not added.empty:
+                self.max_drawdown = min(self.max_drawdown, float((added["cum_net"] - added["peak"]).min()))
+            return new
+        # Out-of-order batch: merge and recompute from scratch
+        df = pd.concat([old.drop(columns=["cum_net", "peak"]), new], ignore_index=True)
+        df = df.sort_values(["close_time", "ticket"], ignore_index=True)
+        self.max_drawdown = 0.0
+        return self._with_equity(df, pd.DataFrame())
+
+    def select(self, start_date=None, end_date=None, accounts=None, ea_names=None, symbols=None, types=None,
+               columns=None, exits_only=False):
+        """
+        Copy of the frame's deals matching the filters (same conventions as
+        `queries.load_trades`: None means no filter), optionally limited to `columns`.
+        `exits_only` drops IN deals (position entries carry no PnL of their own).
+        """
+        df = self.df
+        if df is None or df.empty:
+            return pd.DataFrame(columns=list(columns or COLUMNS))
+        mask = pd.Series(True, index=df.index)
+        start, end = queries._day_bounds(start_date, end_date)
+        if start is not None:
+            mask &= df["close_time"] >= start
+        if end is not None:
+            mask &= df["close_time"] < end
+        if accounts is not None:
+            mask &= df["account_id"].isin([int(a) for a in accounts])
+        if ea_names is not None:
+            mask &= df["ea_name"].isin(list(ea_names))
+        if symbols is not None:
+            mask &= df["symbol"].isin(list(symbols))
+        if types is not None:
+            mask &= df["type"].isin(list(types))
+        if exits_only:
+            mask &= df["entry"] != "IN"
+        return df.loc[mask, list(columns) if columns else df.columns].copy()
+
+trade_frame = TradeFrame()
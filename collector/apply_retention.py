@@ -0,0 +1,48 @@
+"""
+Downsample `account_snapshots` into equity bars and age out old data.
+
+Usage:
+    python collector/apply_retention.py [--every SECONDS]
+
+Each run:
+1. creates the month partitions of the coming months (partitioned Postgres)
+2. writes hourly/daily equity bars up to the last complete hour/day
+3. drops raw snapshots older than SNAPSHOT_RETENTION_DAYS and hourly bars older
+   than HOURLY_BAR_RETENTION_DAYS (only what has been downsampled)
+--every repeats it on an interval (e.g. 3600). Safe while the collector runs.
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.db_models import get_engine
+from shared import partitions, retention
+from collector.config_vps import DATABASE_URL, SNAPSHOT_RETENTION_DAYS, HOURLY_BAR_RETENTION_DAYS
+
+def run_once(engine):
+    t0 = time.perf_counter()
+    created = partitions.create_ahead(engine)
+    bars = retention.downsample(engine)
+    removed = retention.apply_retention(engine, snapshot_days=SNAPSHOT_RETENTION_DAYS,
+                                       hourly_days=HOURLY_BAR_RETENTION_DAYS)
+    print(f"Retention: {len(created)} partition(s) created, {bars['1h']} hourly / {bars['1d']} daily bars written, "
+          f"{len(removed['partitions_dropped'])} partition(s) dropped, {removed['snapshots_deleted']} snapshots and "
+          f"{removed['hourly_bars_deleted']} hourly bars deleted in {time.perf_counter() - t0:.2f}s.")
+
+def main():
+    args = sys.argv[1:]
+    every = float(args[args.index("--every") + 1]) if "--every" in args else None
+    engine = get_engine(DATABASE_URL)
+
+    run_once(engine)
+    while every:
+        time.sleep(every)
+        try:
+            run_once(engine)
+        except Exception as e:
+            print(f"Retention failed (retrying in {every:.0f}s): {e}")
+
+if __name__ == "__main__":
+    main()
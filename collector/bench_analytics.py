@@ -0,0 +1,145 @@
+"""
+Benchmark: dashboard aggregations in pandas vs the embedded DuckDB backend.
+
+Usage:
+    python collector/bench_analytics.py [n_deals] [mirror_dir]
+
+Writes a synthetic Parquet mirror (default 5M deals over 20 accounts and three
+years into a throwaway directory), then builds the daily PnL rollup the Dashboard
+works from, plus its KPIs and breakdowns, twice:
+- pandas: load the deals from the mirror, then group by in a single thread
+- duckdb: aggregate the same files with analysis/shared/duckdb_backend.py
+Needs pyarrow and duckdb.
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from shared import parquet_mirror
+from analysis.shared import duckdb_backend
+
+N_ACCOUNTS = 20
+SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "AUDUSD", "USDCAD", "USDCHF", "NZDUSD", "EURJPY", "GBPJPY",
+           "US30", "NAS100"]
+WRITE_CHUNK = 500_000
+
+def generate_deals(n, seed=42):
+    """
+    n synthetic deals in close_time order (about 1 in 500 a BALANCE operation,
+    half of the rest entries that only carry their commission)
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2023-01-01T00:00:00")
+    seconds = np.sort(rng.integers(0, 3 * 365 * 86400, n))
+    accounts = rng.integers(0, N_ACCOUNTS, n) + 50_000_000
+    balance = rng.random(n) < 0.002
+    entry_in = ~balance & (rng.random(n) < 0.5)
+    profit = np.round(rng.normal(2.0, 40.0, n), 2)
+    profit[balance] = 1000.0
+    profit[entry_in] = 0.0
+    tickets = np.arange(n, dtype="int64") + 1
+    return pd.DataFrame({
+        "ticket": tickets,
+        "account_id": accounts,
+        "magic_number": np.where(balance, 0, accounts % 1000 * 10 + rng.integers(0, 3, n)),
+        "symbol": np.where(balance, None, np.array(SYMBOLS, dtype=object)[rng.integers(0, len(SYMBOLS), n)]),
+        "type": np.where(balance, "BALANCE", np.where(rng.random(n) < 0.5, "BUY", "SELL")),
+        "volume": np.where(balance, 0.0, rng.choice([0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0], n)),
+        "open_price": np.round(rng.uniform(1.0, 2.0, n), 5),
+        "close_price": np.round(rng.uniform(1.0, 2.0, n), 5),
+        "open_time": start + (seconds - 600).astype("timedelta64[s]"),
+        "close_time": start + seconds.astype("timedelta64[s]"),
+        "profit": profit,
+        "commission": np.where(balance, 0.0, -0.7),
+        "swap": np.where(balance, 0.0, np.round(rng.normal(0.0, 0.5, n), 2)),
+        "comment": None,
+        "position_id": np.where(balance, 0, tickets),
+        "entry": np.where(balance, None, np.where(entry_in, "IN", "OUT")),
+    })
+
+def pandas_daily_pnl(deals, eas):
+    """The daily rollup computed with pandas group-bys (single threaded)"""
+    is_trade = deals["type"].fillna("") != "BALANCE"
+    # Only exits count as trades (shared/rollups.py); deals without an entry all do
+    is_exit = is_trade & (deals["entry"].fillna("") != "IN")
+    net = deals["profit"].fillna(0.0) + deals["commission"].fillna(0.0) + deals["swap"].fillna(0.0)
+    frame = pd.DataFrame({
+        "account_id": deals["account_id"],
+        "magic_number": deals["magic_number"].fillna(0).astype("int64"),
+        "symbol": deals["symbol"].fillna(""),
+        "day": deals["close_time"].dt.normalize(),
+        "net_profit": net.where(is_trade, 0.0),
+        "gross_profit": net.where(is_trade & (net > 0), 0.0),
+        "gross_loss": net.where(is_trade & (net < 0), 0.0),
+        "trades": is_exit.astype("int64"),
+        "wins": (is_exit & (net > 0)).astype("int64"),
+        "losses": (is_exit & (net < 0)).astype("int64"),
+        "volume": deals["volume"].fillna(0.0).where(is_trade, 0.0),
+        "deposits": deals["profit"].fillna(0.0).where(~is_trade, 0.0),
+    })
+    daily = frame.groupby(["account_id", "magic_number", "symbol", "day"], sort=False).sum().reset_index()
+    daily = daily.merge(eas, on=["account_id", "magic_number"], how="left")
+    daily["ea_name"] = daily.pop("name").fillna(daily["magic_number"].astype(str))
+    return daily
+
+def dashboard_metrics(daily):
+    """KPIs and breakdowns as the Dashboard derives them from the rollup"""
+    trades_only = daily[daily["trades"] > 0]
+    gross_loss = trades_only["gross_loss"].sum()
+    return {
+        "net_profit": trades_only["net_profit"].sum(),
+        "profit_factor": abs(trades_only["gross_profit"].sum() / gross_loss) if gross_loss else float("inf"),
+        "win_rate": trades_only["wins"].sum() / trades_only["trades"].sum() * 100,
+        "accounts": trades_only.groupby("account_id")[["net_profit", "gross_profit", "gross_loss", "trades", "wins"]].sum(),
+        "eas": trades_only.groupby("ea_name")["net_profit"].sum(),
+        "symbols": trades_only.groupby("symbol")["net_profit"].sum().nlargest(10),
+    }
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    root = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix="mirror_bench_")
+    if not parquet_mirror.available() or duckdb_backend.duckdb is None:
+        print("Needs pyarrow and duckdb: pip install pyarrow duckdb")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    deals = generate_deals(n)
+    for i in range(0, n, WRITE_CHUNK):
+        parquet_mirror.write_partitions(root, "trades", deals.iloc[i:i + WRITE_CHUNK])
+    del deals
+    files = parquet_mirror.partition_files(root, "trades")
+    print(f"Wrote {n:,} deals to {len(files)} files in {root} ({time.perf_counter() - t0:.1f}s)")
+    eas = pd.DataFrame({"account_id": pd.Series(dtype="int64"), "magic_number": pd.Series(dtype="int64"),
+                        "name": pd.Series(dtype="object")})
+
+    t0 = time.perf_counter()
+    deals = parquet_mirror.read(root, "trades", columns=["account_id", "magic_number", "symbol", "type", "entry",
+                                                           "volume", "profit", "commission", "swap", "close_time"])
+    loaded = time.perf_counter() - t0
+    pandas_result = dashboard_metrics(pandas_daily_pnl(deals, eas))
+    pandas_time = time.perf_counter() - t0
+    del deals
+
+    t0 = time.perf_counter()
+    cursor = duckdb_backend.duckdb.connect().cursor()
+    relation = duckdb_backend.parquet_relation(files)
+    duckdb_result = dashboard_metrics(duckdb_backend.aggregate_daily_pnl(cursor, relation, eas))
+    duckdb_time = time.perf_counter() - t0
+    threads = cursor.execute("SELECT current_setting('threads')").fetchone()[0]
+
+    assert abs(pandas_result["net_profit"] - duckdb_result["net_profit"]) < 1e-3 * n
+    assert abs(pandas_result["win_rate"] - duckdb_result["win_rate"]) < 1e-9
+    print(f"pandas  {pandas_time:8.2f}s (load {loaded:.2f}s) | net {pandas_result['net_profit']:,.2f}, "
+          f"PF {pandas_result['profit_factor']:.3f}, WR {pandas_result['win_rate']:.2f}%")
+    print(f"duckdb  {duckdb_time:8.2f}s ({threads} threads) | "
+          f"net {duckdb_result['net_profit']:,.2f}, PF {duckdb_result['profit_factor']:.3f}, "
+          f"WR {duckdb_result['win_rate']:.2f}%")
+    print(f"Speedup: {pandas_time / duckdb_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
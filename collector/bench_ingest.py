@@ -0,0 +1,90 @@
+"""
+Benchmark: per-deal ORM ingest vs set-based bulk ingest against the fake MT5 module.
+
+Usage:
+    python collector/bench_ingest.py [n_deals] [database_url]
+
+Defaults to 100k deals into a throwaway SQLite file. Pass a Postgres URL to measure
+round-trip savings against a real server (tables are created, and trades for the
+benchmark account are deleted before each run).
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collector import fake_mt5
+fake_mt5.install()
+
+from sqlalchemy import delete
+from sqlalchemy.orm import sessionmaker
+from shared.db_models import Base, EA, Trade, get_engine
+from collector import main_collector
+from collector.main_collector import deal_to_row, bulk_insert_trades
+
+BENCH_ACCOUNT = 999000001
+
+def legacy_ingest(session, account_id, deals):
+    """The previous per-deal path: one lookup + one add per deal, plus an EA lookup"""
+    inserted = 0
+    for deal in deals:
+        if session.query(Trade).filter_by(ticket=deal.ticket).first():
+            continue
+        session.add(Trade(**deal_to_row(deal, account_id)))
+        ea = session.query(EA).filter_by(magic_number=deal.magic, account_id=account_id).first()
+        if not ea:
+            session.add(EA(magic_number=deal.magic, account_id=account_id, name=f"EA_{deal.magic}"))
+            session.flush()
+        inserted += 1
+    session.commit()
+    return inserted, len(deals) - inserted
+
+def reset(session):
+    session.execute(delete(Trade).where(Trade.account_id == BENCH_ACCOUNT))
+    session.execute(delete(EA).where(EA.account_id == BENCH_ACCOUNT))
+    session.commit()
+
+def run(label, fn, Session, deals):
+    session = Session()
+    reset(session)
+    t0 = time.perf_counter()
+    inserted, skipped = fn(session, BENCH_ACCOUNT, deals)
+    session.commit()
+    elapsed = time.perf_counter() - t0
+    # Second pass: everything is a duplicate
+    t1 = time.perf_counter()
+    _, dup_skipped = fn(session, BENCH_ACCOUNT, deals)
+    session.commit()
+    rerun = time.perf_counter() - t1
+    session.close()
+    print(f"{label:<8} first pass {elapsed:8.2f}s ({inserted} inserted, {skipped} skipped) | "
+          f"re-run {rerun:8.2f}s ({dup_skipped} skipped)")
+    return elapsed
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db_url = sys.argv[2] if len(sys.argv) > 2 else "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    fake_mt5.reset()
+    fake_mt5.add_terminal(None, login=BENCH_ACCOUNT, deals=fake_mt5.generate_deals(n, start_ticket=10_000_000))
+    main_collector.mt5.initialize()
+
+    engine = get_engine(db_url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    deals = main_collector.mt5.history_deals_get(0, time.time())
+    print(f"Benchmarking ingest of {len(deals)} deals into {engine.dialect.name}")
+
+    bulk = run("bulk", bulk_insert_trades, Session, deals)
+    legacy = run("legacy", legacy_ingest, Session, deals)
+    print(f"Speedup: {legacy / bulk:.1f}x")
+
+    session = Session()
+    reset(session)
+    session.close()
+
+if __name__ == "__main__":
+    main()
@@ -20,5 +20,51 @@ if not DATABASE_URL:
 _mt5_raw = os.getenv("MT5_PATH", "")
 MT5_PATHS = [p.strip() for p in _mt5_raw.split(";") if p.strip()]
 
+# Historical Backfill (new accounts)
+# History is walked in windows of BACKFILL_WINDOW_DAYS, committing and checkpointing each one
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", "3650"))
+BACKFILL_WINDOW_DAYS = int(os.getenv("BACKFILL_WINDOW_DAYS", "30"))
+
+# Parallel Collection
+# Number of worker processes (one terminal per process). 1 = sync terminals sequentially.
+COLLECTOR_WORKERS = int(os.getenv("COLLECTOR_WORKERS", "1"))
+# "sequential" | "pool" (process pool, reconnect every cycle) | "persistent" (one warm worker per terminal)
+COLLECTOR_MODE = os.getenv("COLLECTOR_MODE", "pool" if COLLECTOR_WORKERS > 1 else "sequential").lower()
+
+# Sync Cadence (seconds). Overridable at runtime via app_config keys
+# 'live_sync_interval' (snapshot + open positions) and 'history_sync_interval' (deal history).
+# Only persistent workers keep their terminal connection between runs, so the
+# other modes default to the old 60s live cadence.
+LIVE_SYNC_INTERVAL = float(os.getenv("LIVE_SYNC_INTERVAL", "5" if COLLECTOR_MODE == "persistent" else "60"))
+HISTORY_SYNC_INTERVAL = float(os.getenv("HISTORY_SYNC_INTERVAL", "300"))
+CONFIG_REFRESH_INTERVAL = float(os.getenv("CONFIG_REFRESH_INTERVAL", "60"))
+# Random +/- fraction applied to each interval so terminals don't hit the DB in lockstep
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.1"))
+
+# Snapshot Buffering
+# Snapshots from all terminals are written in one batch every SNAPSHOT_FLUSH_SECONDS
+# or SNAPSHOT_FLUSH_ROWS rows. Unsent rows are spilled to SNAPSHOT_SPILL_FILE.
+SNAPSHOT_BUFFER = os.getenv("SNAPSHOT_BUFFER", "1") == "1"
+SNAPSHOT_FLUSH_ROWS = int(os.getenv("SNAPSHOT_FLUSH_ROWS", "200"))
+SNAPSHOT_FLUSH_SECONDS = float(os.getenv("SNAPSHOT_FLUSH_SECONDS", "30"))
+SNAPSHOT_SPILL_FILE = os.getenv("SNAPSHOT_SPILL_FILE", "snapshot_spill.jsonl")
+# Drop snapshots whose balance/equity/margin are unchanged (still keep one every SNAPSHOT_HEARTBEAT seconds)
+SNAPSHOT_COALESCE = os.getenv("SNAPSHOT_COALESCE", "1") == "1"
+SNAPSHOT_HEARTBEAT = float(os.getenv("SNAPSHOT_HEARTBEAT", "300"))
+
+# Retention (collector/apply_retention.py)
+# Raw snapshots are kept SNAPSHOT_RETENTION_DAYS (whole months on partitioned Postgres),
+# hourly equity bars HOURLY_BAR_RETENTION_DAYS; daily bars forever.
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", "30"))
+HOURLY_BAR_RETENTION_DAYS = int(os.getenv("HOURLY_BAR_RETENTION_DAYS", "365"))
+
+# Local Outbox
+# When enabled, collected deals/snapshots/position diffs are queued in a local SQLite file
+# and a background flusher writes them to the database, so DB outages don't stop collection.
+OUTBOX = os.getenv("OUTBOX", "0") == "1"
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "collector_outbox.db")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+
 # Logging
 LOG_LEVEL = "INFO"
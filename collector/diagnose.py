@@ -34,7 +34,7 @@ def check_db_health():
                 if res.rowcount == 0 and res.fetchone() is None:
                      print("[CRITICAL ERROR] 'account_id' column MISSING in 'eas' table.")
                      print(">> CAUSE: You updated the code but did not reset the database.")
-                     print(">> FIX: Run 'python collector/init_db.py' or manually drop the 'eas' table.")
+                     print(">> FIX: Run 'python collector/init_db.py' to migrate the schema.")
                 else:
                     print("[OK] 'account_id' column exists in 'eas'.")
                     
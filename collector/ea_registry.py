@@ -0,0 +1,48 @@
+"""
+In-process cache of the `eas` registry for EA auto-discovery.
+
+The known (magic_number, account_id) keys are loaded once and only re-read from the
+DB when a deal batch contains a key the cache hasn't seen. Keys still missing after
+that refresh are registered in one INSERT ... ON CONFLICT DO NOTHING, which makes
+discovery safe when several collectors share the same database.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+from shared.db_models import EA, dialect_insert
+
+class EARegistry:
+    def __init__(self):
+        self.known = None # set of (magic_number, account_id); None = not loaded
+
+    def refresh(self, session):
+        self.known = set(map(tuple, session.execute(select(EA.magic_number, EA.account_id))))
+
+    def invalidate(self):
+        """Forget the cache, e.g. after a rollback discarded our own inserts"""
+        self.known = None
+
+    def ensure(self, session, account_id, magic_numbers):
+        """Register unseen EAs for this account (does not commit). Returns the number registered."""
+        keys = {(magic, account_id) for magic in magic_numbers}
+        if self.known is not None and keys <= self.known:
+            return 0
+
+        # Unknown key: another collector (or the Manager page) may have added it
+        self.refresh(session)
+        missing = sorted(keys - self.known)
+        if not missing:
+            return 0
+
+        now = datetime.utcnow()
+        stmt = dialect_insert(session.get_bind(), EA).values([
+            {"magic_number": magic, "account_id": acc, "name": f"EA_{magic}",
+             "description": f"Auto-discovered on {acc}", "created_at": now}
+            for magic, acc in missing
+        ]).on_conflict_do_nothing()
+        session.execute(stmt)
+        self.known.update(missing)
+        for magic, acc in missing:
+            logging.info(f"Discovered new EA: {magic} on Account {acc}")
+        return len(missing)
@@ -0,0 +1,75 @@
+"""
+Capture query plans for the collector/dashboard hot queries.
+
+Usage:
+    python collector/explain_queries.py [label]      # write explain_<label>.txt
+    python collector/explain_queries.py --migrate    # plans before, apply pending migrations (init_db.py), plans after
+
+On Postgres plans come from EXPLAIN (ANALYZE, BUFFERS), so the queries really run;
+on the local SQLite fallback from EXPLAIN QUERY PLAN.
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from shared.db_models import get_engine
+from collector.config_vps import DATABASE_URL
+from shared.migrations import upgrade
+
+# name -> (postgres SQL, sqlite SQL). :account_id is bound to a real account.
+QUERIES = {
+    "latest_trade_for_account": (
+        "SELECT close_time FROM trades WHERE account_id = :account_id ORDER BY close_time DESC LIMIT 1",
+    ) * 2,
+    "latest_snapshot_per_account": (
+        "SELECT DISTINCT ON (account_id) * FROM account_snapshots ORDER BY account_id, timestamp DESC",
+        # SQLite has no DISTINCT ON; bare columns with MAX() pick the latest row per group
+        "SELECT *, MAX(timestamp) FROM account_snapshots GROUP BY account_id",
+    ),
+    "trades_with_ea_for_account": (
+        """SELECT t.ticket, t.profit, t.close_time, e.name AS ea_name
+        FROM trades t
+        LEFT JOIN eas e ON t.magic_number = e.magic_number AND t.account_id = e.account_id
+        WHERE t.account_id = :account_id
+        ORDER BY t.close_time ASC""",
+    ) * 2,
+}
+
+def capture_plans(engine):
+    is_pg = engine.dialect.name == "postgresql"
+    prefix = "EXPLAIN (ANALYZE, BUFFERS) " if is_pg else "EXPLAIN QUERY PLAN "
+    lines = []
+    with engine.connect() as conn:
+        account_id = conn.execute(text("SELECT account_id FROM trades LIMIT 1")).scalar() or 0
+        for name, (pg_sql, sqlite_sql) in QUERIES.items():
+            sql = pg_sql if is_pg else sqlite_sql
+            rows = conn.execute(text(prefix + sql), {"account_id": account_id}).fetchall()
+            lines.append(f"=== {name} (account_id={account_id}) ===")
+            # Postgres returns one text column; SQLite returns (id, parent, notused, detail)
+            lines.extend(str(row[0]) if is_pg else f"  {row[-1]}" for row in rows)
+            lines.append("")
+    return "\n".join(lines)
+
+def save(label, plans):
+    filename = f"explain_{label}.txt"
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"# {label} - {datetime.now():%Y-%m-%d %H:%M:%S}\n\n{plans}")
+    print(plans)
+    print(f"Saved to {filename}")
+
+def main():
+    engine = get_engine(DATABASE_URL)
+    if "--migrate" in sys.argv[1:]:
+        save("before", capture_plans(engine))
+        applied = upgrade(engine)
+        print(f"Applied migration(s): {', '.join(map(str, applied)) or '-'}\n")
+        save("after", capture_plans(engine))
+    else:
+        label = sys.argv[1] if len(sys.argv) > 1 else datetime.now().strftime("%Y%m%d_%H%M%S")
+        save(label, capture_plans(engine))
+
+if __name__ == "__main__":
+    main()
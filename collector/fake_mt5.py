@@ -0,0 +1,169 @@
+"""
+Fake `MetaTrader5` module for benchmarking and exercising the collector on Linux.
+
+Usage:
+    from collector import fake_mt5
+    fake_mt5.install()                      # registers itself as 'MetaTrader5'
+    fake_mt5.add_terminal("A", login=1001, deals=fake_mt5.generate_deals(1000))
+    from collector import main_collector    # now imports the fake
+"""
+import sys
+import time
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# Constants (same values as the real library)
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+DEAL_TYPE_BALANCE = 2
+
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_INOUT = 2
+DEAL_ENTRY_OUT_BY = 3
+
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+
+TradeDeal = namedtuple("TradeDeal", [
+    "ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id",
+    "reason", "volume", "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id",
+])
+
+TradePosition = namedtuple("TradePosition", [
+    "ticket", "time", "type", "magic", "identifier", "volume", "price_open", "sl", "tp",
+    "price_current", "swap", "profit", "symbol", "comment",
+])
+
+AccountInfo = namedtuple("AccountInfo", [
+    "login", "balance", "equity", "margin", "margin_free", "margin_level", "profit",
+])
+
+TerminalInfo = namedtuple("TerminalInfo", ["connected", "path"])
+
+# Simulated cost of mt5.initialize() in seconds
+INIT_DELAY = 0.0
+# Simulated cost of each history/positions call in seconds
+CALL_DELAY = 0.0
+
+# path -> terminal state dict (path=None is stored under DEFAULT_PATH)
+DEFAULT_PATH = "__default__"
+TERMINALS = {}
+_current = None
+_init_count = 0
+
+
+def add_terminal(path, login, deals=None, positions=None, balance=10000.0):
+    """Register a simulated terminal reachable via initialize(path=path)."""
+    path = path or DEFAULT_PATH
+    TERMINALS[path] = {
+        "login": login,
+        "deals": sorted(deals or [], key=lambda d: d.time),
+        "positions": list(positions or []),
+        "balance": balance,
+    }
+    return TERMINALS[path]
+
+
+def reset():
+    global _current, _init_count
+    TERMINALS.clear()
+    _current = None
+    _init_count = 0
+
+
+def install():
+    """Expose this module as `MetaTrader5` for subsequent imports."""
+    sys.modules["MetaTrader5"] = sys.modules[__name__]
+    return sys.modules[__name__]
+
+
+def generate_deals(n, start=None, days=3650, start_ticket=1, magics=(101, 102, 103), symbols=("EURUSD", "GBPUSD", "XAUUSD"), seed=42):
+    """Synthetic IN/OUT deal pairs spread evenly over `days`, preceded by one deposit."""
+    rnd = random.Random(seed)
+    start = start or (datetime.now(timezone.utc) - timedelta(days=days))
+    t0 = int(start.timestamp())
+    step = max(1, int(days * 86400 / max(n, 1)))
+    deals = [TradeDeal(start_ticket, 0, t0, t0 * 1000, DEAL_TYPE_BALANCE, DEAL_ENTRY_IN, 0, 0, 0,
+                       0.0, 0.0, 0.0, 0.0, 10000.0, 0.0, "", "Deposit", "")]
+    ticket = start_ticket + 1
+    for i in range(n - 1):
+        t = t0 + (i + 1) * step
+        position_id = ticket if i % 2 == 0 else ticket - 1
+        entry = DEAL_ENTRY_IN if i % 2 == 0 else DEAL_ENTRY_OUT
+        deal_type = rnd.choice((DEAL_TYPE_BUY, DEAL_TYPE_SELL))
+        profit = 0.0 if entry == DEAL_ENTRY_IN else round(rnd.gauss(5, 50), 2)
+        magic, volume, price, symbol = (rnd.choice(magics), rnd.choice((0.01, 0.05, 0.1, 0.5, 1.0)),
+                                        round(rnd.uniform(1, 2), 5), rnd.choice(symbols))
+        if entry == DEAL_ENTRY_OUT:
+            # The exit trades against its entry: same position, magic, symbol and volume
+            opened = deals[-1]
+            deal_type = DEAL_TYPE_SELL if opened.type == DEAL_TYPE_BUY else DEAL_TYPE_BUY
+            magic, volume, symbol = opened.magic, opened.volume, opened.symbol
+        deals.append(TradeDeal(
+            ticket, ticket, t, t * 1000, deal_type, entry, magic, position_id, 0,
+            volume, price, -0.5, 0.0, profit, 0.0, symbol, "", ""))
+        ticket += 1
+    return deals
+
+
+# --- API surface used by the collector ---
+
+def initialize(path=None, **kwargs):
+    global _current, _init_count
+    if INIT_DELAY:
+        time.sleep(INIT_DELAY)
+    key = path or DEFAULT_PATH
+    if key not in TERMINALS and path is None and TERMINALS:
+        key = next(iter(TERMINALS))
+    if key not in TERMINALS:
+        return False
+    _current = key
+    _init_count += 1
+    return True
+
+
+def shutdown():
+    global _current
+    _current = None
+    return True
+
+
+def last_error():
+    return (0, "OK") if _current is not None else (-10003, "IPC initialize failed")
+
+
+def terminal_info():
+    if _current is None:
+        return None
+    return TerminalInfo(True, _current)
+
+
+def account_info():
+    if _current is None:
+        return None
+    term = TERMINALS[_current]
+    open_pnl = sum(p.profit for p in term["positions"])
+    margin = sum(p.volume for p in term["positions"]) * 100.0
+    equity = term["balance"] + open_pnl
+    return AccountInfo(term["login"], term["balance"], equity, margin, equity - margin,
+                       (equity / margin * 100.0) if margin else 0.0, open_pnl)
+
+
+def history_deals_get(date_from, date_to, **kwargs):
+    if _current is None:
+        return None
+    if CALL_DELAY:
+        time.sleep(CALL_DELAY)
+    lo = int(date_from.timestamp()) if isinstance(date_from, datetime) else int(date_from)
+    hi = int(date_to.timestamp()) if isinstance(date_to, datetime) else int(date_to)
+    return tuple(d for d in TERMINALS[_current]["deals"] if lo <= d.time <= hi)
+
+
+def positions_get(**kwargs):
+    if _current is None:
+        return None
+    if CALL_DELAY:
+        time.sleep(CALL_DELAY)
+    return tuple(TERMINALS[_current]["positions"])
@@ -5,7 +5,8 @@ import logging
 # Add parent directory to path so we can import shared
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from shared.db_models import Base, get_engine, create_tables
+from shared.db_models import get_engine
+from shared.migrations import MIGRATIONS, upgrade, get_schema_version
 from collector.config_vps import DATABASE_URL
 
 # Setup basic logging
@@ -16,15 +17,20 @@ def main():
     # Mask password for safety in logs
     safe_url = DATABASE_URL.split('@')[-1] if '@' in DATABASE_URL else "..."
     print(f"Target: ...@{safe_url}")
-    
+
+    # Optional: python collector/init_db.py <version> to stop at a given migration
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
     try:
         engine = get_engine(DATABASE_URL)
-        print("Engine created. Creating tables...")
-        # Base.metadata.drop_all(engine) # SAFETY: Commented out to prevent accidental wipe
-        Base.metadata.create_all(engine) # Will create app_config if missing
-        print("SUCCESS! Tables 'eas' and 'trades' created (or already existed).")
+        with engine.connect() as conn:
+            current = get_schema_version(conn)
+        print(f"Engine created. Schema version {current}, latest {MIGRATIONS[-1][0]}. Migrating...")
+        applied = upgrade(engine, target)
+        print(f"SUCCESS! Applied {len(applied)} migration(s); schema is at version {applied[-1] if applied else current}.")
     except Exception as e:
-        print(f"FAILED to initialize database: {e}")
+        print(f"FAILED to migrate database: {e}")
+        print("Migrations are idempotent: fix the cause and re-run.")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -6,13 +6,27 @@ import MetaTrader5 as mt5
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import select, delete
 
 # Add parent directory to path so we can import shared
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from shared.db_models import Base, EA, Trade, AppConfig, AccountSnapshot, OpenPosition, get_engine, create_tables
-from collector.config_vps import DATABASE_URL, MT5_PATHS as ENV_MT5_PATHS, LOG_LEVEL
+from shared.db_models import Base, EA, Trade, AppConfig, AccountSnapshot, OpenPosition, get_engine, create_tables, dialect_insert
+from collector.config_vps import (
+    DATABASE_URL, MT5_PATHS as ENV_MT5_PATHS, LOG_LEVEL, BACKFILL_DAYS, BACKFILL_WINDOW_DAYS,
+    COLLECTOR_WORKERS, COLLECTOR_MODE, LIVE_SYNC_INTERVAL, HISTORY_SYNC_INTERVAL,
+    CONFIG_REFRESH_INTERVAL, SCHEDULER_JITTER, SNAPSHOT_BUFFER, SNAPSHOT_FLUSH_ROWS,
+    SNAPSHOT_FLUSH_SECONDS, SNAPSHOT_SPILL_FILE, SNAPSHOT_COALESCE, SNAPSHOT_HEARTBEAT,
+    OUTBOX, OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_MAX_BACKOFF,
+)
+from collector.scheduler import Scheduler
+from collector.snapshot_buffer import SnapshotBuffer
+from collector.ea_registry import EARegistry
+from shared.rollups import apply_trade_rows
+from shared.round_trips import apply_round_trips
+from shared.risk_state import apply_risk_state
+from shared.partitions import partition_registry
+from collector.outbox import get_outbox, OutboxFlusher
 
 # Setup Logging
 logging.basicConfig(
@@ -20,13 +34,15 @@ logging.basicConfig(
     level=getattr(logging, LOG_LEVEL.upper()),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
-console_handler = logging.StreamHandler()
-console_handler.setLevel(getattr(logging, LOG_LEVEL.upper()))
-logging.getLogger().addHandler(console_handler)
+# Worker processes import this module again; only attach the console handler once
+if not any(type(h) is logging.StreamHandler for h in logging.getLogger().handlers):
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(getattr(logging, LOG_LEVEL.upper()))
+    logging.getLogger().addHandler(console_handler)
 
 def connect_mt5(path=None):
     """Initialize MT5 connection"""
-    if not mt5.initialize(path=path) if path else mt5.initialize():
+    if not (mt5.initialize(path=path) if path else mt5.initialize()):
         logging.error(f"MT5 Initialize failed for path {path or 'default'}, error code = {mt5.last_error()}")
         return False
     
@@ -38,16 +54,206 @@ def connect_mt5(path=None):
     logging.info(f"Connected to MT5 Terminal at {path}. Account: {mt5.account_info().login}")
     return True
 
+# Rows per INSERT batch (bounds memory and statement size per round trip)
+INSERT_BATCH_SIZE = 1000
+
+DEAL_ENTRIES = {mt5.DEAL_ENTRY_IN: "IN", mt5.DEAL_ENTRY_OUT: "OUT", mt5.DEAL_ENTRY_INOUT: "INOUT",
+                mt5.DEAL_ENTRY_OUT_BY: "OUT_BY"}
+
+def deal_to_row(deal, account_id):
+    """Map an MT5 deal to a `trades` row dict"""
+    # Deal types: 0=BUY, 1=SELL, 2=BALANCE...
+    type_str = "UNKNOWN"
+    if deal.type == mt5.DEAL_TYPE_BUY: type_str = "BUY"
+    elif deal.type == mt5.DEAL_TYPE_SELL: type_str = "SELL"
+    elif deal.type == mt5.DEAL_TYPE_BALANCE: type_str = "BALANCE"
+
+    # Entry: 0=IN, 1=OUT, 2=INOUT (reversal), 3=OUT_BY (closed by an opposite position)
+    entry = DEAL_ENTRIES.get(deal.entry)
+
+    # Convert timestamp to python datetime
+    dt = datetime.fromtimestamp(deal.time, tz=timezone.utc)
+
+    return {
+        "account_id": account_id,
+        "ticket": deal.ticket,
+        "magic_number": deal.magic,
+        "symbol": deal.symbol,
+        "type": type_str,
+        "volume": deal.volume,
+        "open_price": deal.price, # For a deal, 'price' is execution price
+        "close_price": 0.0, # Deal doesn't have open/close, it IS the close or open.
+                            # Simplification: we store deals as atomic events.
+                            # Full round trips (open + close) are matched from position_id/entry
+                            # into `round_trips` (shared/round_trips.py).
+        "open_time": dt,
+        "close_time": dt, # Using same time for simplicity in Deal model
+        "profit": deal.profit,
+        "commission": deal.commission,
+        "swap": deal.swap,
+        "comment": deal.comment,
+        "position_id": deal.position_id or None,
+        "entry": entry,
+    }
+
+# Per-process cache of registered (magic_number, account_id) keys
+ea_registry = EARegistry()
+
+def write_trade_rows(session, account_id, rows, registry=None):
+    """
+    Multi-row INSERT ... ON CONFLICT DO NOTHING of `trades` row dicts, plus
+    EA discovery, the daily_pnl rollup, round-trip matching and the risk state for them
+    (does not commit).
+    Returns the number of rows inserted.
+    """
+    # executemany with RETURNING is batched into multi-row VALUES by SQLAlchemy ("insertmanyvalues")
+    # and tells us exactly which tickets were written.
+    table = Trade.__table__
+    # No conflict target: on partitioned Postgres the key is (ticket, close_time), elsewhere ticket
+    stmt = dialect_insert(session.get_bind(), table).on_conflict_do_nothing().returning(table.c.ticket)
+    # Month partitions for backfilled history (no-op unless trades is partitioned)
+    partition_registry.ensure(session, "trades", {row["close_time"] for row in rows})
+    inserted = []
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        chunk = rows[i:i + INSERT_BATCH_SIZE]
+        written = set(session.execute(stmt, chunk).scalars())
+        inserted.extend(row for row in chunk if row["ticket"] in written)
+
+    if rows:
+        (registry or ea_registry).ensure(session, account_id, {row["magic_number"] for row in rows})
+    # Only rows we actually inserted, so a replayed batch is never counted twice
+    apply_trade_rows(session, inserted)
+    apply_round_trips(session, inserted)
+    apply_risk_state(session, inserted)
+    return len(inserted)
+
+def bulk_insert_trades(session, account_id, deals):
+    """
+    Set-based ingest of a deal batch (does not commit): multi-row
+    INSERT ... ON CONFLICT DO NOTHING RETURNING, which both skips the deals already
+    stored and tells us which ones were new, then EA registration in one batch.
+    Returns (inserted, skipped).
+    """
+    rows = {}
+    for deal in deals:
+        rows[deal.ticket] = deal_to_row(deal, account_id)
+    if not rows:
+        return 0, 0
+
+    inserted = write_trade_rows(session, account_id, list(rows.values()))
+    return inserted, len(deals) - inserted
+
+# app_config key holding the backfill checkpoint for an account:
+# ISO timestamp of the next window to fetch, or BACKFILL_DONE once history is complete.
+BACKFILL_KEY = "backfill_checkpoint_{account_id}"
+BACKFILL_DONE = "done"
+
+def get_app_config(session, key, default=None):
+    config = session.query(AppConfig).filter_by(key=key).first()
+    return config.value if config and config.value is not None else default
+
+def set_app_config(session, key, value):
+    """Upsert an app_config value (does not commit)"""
+    now = datetime.utcnow()
+    stmt = dialect_insert(session.get_bind(), AppConfig).values(key=key, value=value, updated_at=now)
+    stmt = stmt.on_conflict_do_update(index_elements=["key"], set_={"value": value, "updated_at": now})
+    session.execute(stmt)
+
+def backfill_trades(session, account_id, from_date, outbox=None):
+    """
+    Walk MT5 history from `from_date` to now in BACKFILL_WINDOW_DAYS windows.
+    Each window is inserted and committed together with its checkpoint, so a crash
+    only loses the window in flight and only one window of deals is held in memory.
+    With an `outbox` each window is queued there instead, together with the
+    checkpoint the outbox keeps for the account.
+    Returns (inserted, skipped).
+    """
+    key = BACKFILL_KEY.format(account_id=account_id)
+    window = timedelta(days=BACKFILL_WINDOW_DAYS)
+    end = datetime.now(timezone.utc)
+    total_inserted, total_skipped = 0, 0
+
+    cursor = from_date
+    while cursor < end:
+        window_end = min(cursor + window, end)
+        deals = mt5.history_deals_get(cursor, window_end)
+        if deals is None:
+            # Keep the checkpoint; the next cycle resumes from this window
+            logging.error(f"Backfill for {account_id} stopped at {cursor}: error fetching deals ({mt5.last_error()})")
+            return total_inserted, total_skipped
+
+        if outbox is not None:
+            rows = [deal_to_row(deal, account_id) for deal in deals]
+            outbox.append_deals(account_id, rows, backfill_to=window_end)
+            inserted, skipped = len(rows), 0
+        else:
+            inserted, skipped = bulk_insert_trades(session, account_id, deals)
+            set_app_config(session, key, window_end.isoformat())
+            session.commit()
+
+        total_inserted += inserted
+        total_skipped += skipped
+        if deals:
+            logging.info(f"Backfill {account_id} {cursor:%Y-%m-%d} -> {window_end:%Y-%m-%d}: {inserted} inserted, {skipped} skipped.")
+        del deals
+        cursor = window_end
+
+    if outbox is not None:
+        outbox.finish_backfill(account_id, end)
+    else:
+        set_app_config(session, key, BACKFILL_DONE)
+        session.commit()
+    logging.info(f"Backfill complete for {account_id}: {total_inserted} inserted, {total_skipped} skipped.")
+    return total_inserted, total_skipped
+
+def queue_new_deals(outbox, account_id, last_time, last_ticket):
+    """Outbox path of sync_trades: queue deals newer than the local watermark. Returns (queued, skipped)."""
+    deals = mt5.history_deals_get(last_time.replace(tzinfo=timezone.utc), datetime.now(timezone.utc))
+    if deals is None:
+        logging.info("No deals found or error fetching deals.")
+        return 0, 0
+    # MT5 deal tickets only increase, so anything at or below the watermark is already queued
+    rows = [deal_to_row(deal, account_id) for deal in deals if deal.ticket > last_ticket]
+    if rows:
+        outbox.append_deals(account_id, rows)
+        logging.info(f"Queued {len(rows)} new deals for {account_id} in the outbox.")
+    return len(rows), len(deals) - len(rows)
+
 def sync_trades(session, account_id):
     """
     Main logic:
-    1. Get last trade time from DB.
-    2. Fetch new trades from MT5 since that time.
-    3. Insert into DB.
+    1. Resume/start a chunked backfill if this account's history is incomplete.
+    2. Otherwise get last trade time from DB and fetch new trades from MT5 since then.
+    3. Bulk insert into DB.
+    With OUTBOX=1 the checkpoint and the last deal come from the outbox file and
+    deals are queued there instead.
+    Returns (inserted, skipped).
     """
     try:
-        # 1. Get last known trade time from DB
-        # 1. Get last known trade time from DB for this account
+        if OUTBOX:
+            # Backfill checkpoint and watermark both live in the outbox file (no DB round trip)
+            outbox = get_outbox(OUTBOX_PATH)
+            from_date = outbox.get_backfill(account_id)
+            if from_date:
+                logging.info(f"Resuming backfill for {account_id} from {from_date}.")
+                return backfill_trades(session, account_id, from_date, outbox)
+            watermark = outbox.get_watermark(account_id)
+            if watermark:
+                return queue_new_deals(outbox, account_id, *watermark)
+            # Nothing queued for this account yet: walk its history into the outbox.
+            # Deals the DB already holds are skipped when the flusher writes them.
+            from_date = datetime.now(timezone.utc) - timedelta(days=BACKFILL_DAYS)
+            logging.info(f"No outbox watermark for {account_id}. Backfilling {BACKFILL_DAYS} days of history in {BACKFILL_WINDOW_DAYS}-day windows.")
+            return backfill_trades(session, account_id, from_date, outbox)
+
+        # 1. Backfill state for this account
+        checkpoint = get_app_config(session, BACKFILL_KEY.format(account_id=account_id))
+        if checkpoint and checkpoint != BACKFILL_DONE:
+            from_date = datetime.fromisoformat(checkpoint)
+            logging.info(f"Resuming backfill for {account_id} from {from_date}.")
+            return backfill_trades(session, account_id, from_date)
+
+        # 2. Get last known trade time from DB for this account
         last_trade_query = select(Trade.close_time).where(Trade.account_id == account_id).order_by(Trade.close_time.desc()).limit(1)
         result = session.execute(last_trade_query).scalar()
         
@@ -56,12 +262,16 @@ def sync_trades(session, account_id):
             # Add 1 second to avoid duplicate fetch of the last second
             from_date = from_date.replace(tzinfo=timezone.utc) 
             logging.info(f"Last trade in DB: {from_date}")
+        elif checkpoint != BACKFILL_DONE:
+            # New account: walk full history in windows
+            from_date = datetime.now(timezone.utc) - timedelta(days=BACKFILL_DAYS)
+            logging.info(f"DB empty. Backfilling {BACKFILL_DAYS} days of history in {BACKFILL_WINDOW_DAYS}-day windows.")
+            return backfill_trades(session, account_id, from_date)
         else:
-             # If DB empty, fetch last 3650 days (10 years)
-            from_date = datetime.now(timezone.utc) - timedelta(days=3650)
-            logging.info("DB empty. Fetching full history (10 years).")
+            # Backfilled but no deals yet
+            from_date = datetime.now(timezone.utc) - timedelta(days=BACKFILL_DAYS)
 
-        # 2. Fetch history from MT5
+        # 3. Fetch history from MT5
         # history_deals_get returns deals in UTC (usually) or Broker time. 
         # CAUTION: MT5 returns naive datetimes usually in Broker Time.
         # Ideally we should convert everything to UTC. For this POC we store as-is.
@@ -69,142 +279,149 @@ def sync_trades(session, account_id):
 
         if deals is None:
             logging.info("No deals found or error fetching deals.")
-            return
+            return 0, 0
 
         if len(deals) == 0:
             logging.info("No new deals.")
-            return
+            return 0, 0
 
         logging.info(f"Found {len(deals)} new deals from MT5.")
-        
-        new_trades_count = 0
-        
-        for deal in deals:
-            # Check if trade already exists (deduplication)
-            exists = session.query(Trade).filter_by(ticket=deal.ticket).first()
-            if exists:
-                continue
-
-            # Map MT5 Deal to DB Trade
-            # Only record closed trades (entry out/inout) or balance ops if you want
-            # Deal types: 0=BUY, 1=SELL, 2=BALANCE...
-            # Entry: 0=IN, 1=OUT, 2=INOUT
-            
-            # Simple filer: We want entries that are OUT or INOUT (closing a position)
-            # OR we just store everything and filter in SQL. Storing everything is safer.
-            
-            type_str = "UNKNOWN"
-            if deal.type == mt5.DEAL_TYPE_BUY: type_str = "BUY"
-            elif deal.type == mt5.DEAL_TYPE_SELL: type_str = "SELL"
-            elif deal.type == mt5.DEAL_TYPE_BALANCE: type_str = "BALANCE"
-            
-            # Convert timestamp to python datetime
-            dt = datetime.fromtimestamp(deal.time, tz=timezone.utc)
-
-            trade = Trade(
-                account_id=account_id,
-                ticket=deal.ticket,
-                magic_number=deal.magic,
-                symbol=deal.symbol,
-                type=type_str,
-                volume=deal.volume,
-                open_price=deal.price, # For a deal, 'price' is execution price
-                close_price=0.0, # Deal doesn't have open/close, it IS the close or open. 
-                                 # Simplification: we store deals as atomic events. 
-                                 # Reconstructing full "Trades" (Open+Close) requires matching IN and OUT deals.
-                                 # For V1 POC, we just store the deals.
-                open_time=dt,
-                close_time=dt, # Using same time for simplicity in Deal model
-                profit=deal.profit,
-                commission=deal.commission,
-                swap=deal.swap,
-                comment=deal.comment
-            )
-            
-            # Debug log for first trade
-            if new_trades_count == 0:
-                logging.info(f"Inserting Trade with Account ID: {trade.account_id}")
-
-            session.add(trade)
-            
-            # Auto-Register EA if new magic number AND account_id
-            ea = session.query(EA).filter_by(magic_number=deal.magic, account_id=account_id).first()
-            if not ea:
-                new_ea = EA(magic_number=deal.magic, account_id=account_id, name=f"EA_{deal.magic}", description=f"Auto-discovered on {account_id}")
-                session.add(new_ea)
-                logging.info(f"Discovered new EA: {deal.magic} on Account {account_id}")
-
-            new_trades_count += 1
 
+        # 4. Bulk insert (multi-row insert skipping stored deals + EA discovery)
+        inserted, skipped = bulk_insert_trades(session, account_id, deals)
         session.commit()
-        if new_trades_count > 0:
-            logging.info(f"Successfully synced {new_trades_count} new trades.")
+        logging.info(f"Synced trades for {account_id}: {inserted} inserted, {skipped} skipped.")
+        return inserted, skipped
         
     except Exception as e:
         logging.error(f"Error in sync loop: {e}")
         session.rollback()
+        # EAs registered (and partitions created) in the rolled-back transaction must be re-checked
+        ea_registry.invalidate()
+        partition_registry.invalidate()
+        return 0, 0
 
-def sync_account_snapshot(session, account_id):
-    """Capture Equity, Balance, Margin (TimeSeries)"""
+def capture_account_snapshot(account_id):
+    """Read Equity, Balance, Margin from the terminal as an `account_snapshots` row dict"""
+    info = mt5.account_info()
+    if not info:
+        return None
+    return {
+        "account_id": account_id,
+        "timestamp": datetime.now(timezone.utc),
+        "balance": info.balance,
+        "equity": info.equity,
+        "margin": info.margin,
+        "free_margin": info.margin_free,
+        "margin_level": info.margin_level,
+        "open_pnl": info.profit,
+    }
+
+def sync_account_snapshot(session, account_id, buffer=None):
+    """
+    Capture Equity, Balance, Margin (TimeSeries).
+    With a `buffer` (SnapshotBuffer or list) the row is appended there and written later in a batch.
+    """
     try:
-        info = mt5.account_info()
-        if not info:
+        snapshot = capture_account_snapshot(account_id)
+        if not snapshot:
+            return
+        if buffer is not None:
+            buffer.append(snapshot)
+            return
+        if OUTBOX:
+            get_outbox(OUTBOX_PATH).append("snapshots", account_id, [snapshot])
             return
 
-        snapshot = AccountSnapshot(
-            account_id=account_id,
-            timestamp=datetime.now(timezone.utc),
-            balance=info.balance,
-            equity=info.equity,
-            margin=info.margin,
-            free_margin=info.margin_free,
-            margin_level=info.margin_level,
-            open_pnl=info.profit
-        )
-        session.add(snapshot)
+        partition_registry.ensure(session, "account_snapshots", [snapshot["timestamp"]])
+        session.add(AccountSnapshot(**snapshot))
         session.commit()
     except Exception as e:
         logging.error(f"Error snapshotting account {account_id}: {e}")
         session.rollback()
+        partition_registry.invalidate()
+
+# Columns compared to decide whether a stored open position needs rewriting
+POSITION_FIELDS = ("symbol", "magic_number", "type", "volume", "open_price", "current_price", "sl", "tp", "profit", "swap", "comment")
+
+def position_to_row(pos, account_id):
+    """Map an MT5 position to an `open_positions` row dict"""
+    return {
+        "ticket": pos.ticket,
+        "account_id": account_id,
+        "symbol": pos.symbol,
+        "magic_number": pos.magic,
+        "type": "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL",
+        "volume": pos.volume,
+        "open_price": pos.price_open,
+        "current_price": pos.price_current,
+        "sl": pos.sl,
+        "tp": pos.tp,
+        "profit": pos.profit,
+        "swap": pos.swap,
+        "comment": pos.comment,
+    }
+
+def diff_open_positions(session, account_id, positions):
+    """
+    Compare live MT5 positions with the stored rows by ticket.
+    Returns (upserts, closed): rows that are new or changed, and tickets no longer open.
+    """
+    current = {pos.ticket: position_to_row(pos, account_id) for pos in positions}
+    columns = [getattr(OpenPosition, f) for f in POSITION_FIELDS]
+    stored = {
+        row.ticket: row
+        for row in session.execute(select(OpenPosition.ticket, *columns).where(OpenPosition.account_id == account_id))
+    }
+
+    upserts = [
+        row for ticket, row in current.items()
+        if ticket not in stored or any(getattr(stored[ticket], f) != row[f] for f in POSITION_FIELDS)
+    ]
+    closed = [ticket for ticket in stored if ticket not in current]
+    return upserts, closed
+
+def apply_position_diff(session, upserts, closed):
+    """Write a position diff: one batched upsert + one delete (does not commit)"""
+    if upserts:
+        now = datetime.utcnow()
+        table = OpenPosition.__table__
+        stmt = dialect_insert(session.get_bind(), table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["ticket"],
+            set_={**{f: stmt.excluded[f] for f in ("account_id",) + POSITION_FIELDS}, "updated_at": now},
+        )
+        session.execute(stmt, [{**row, "updated_at": now} for row in upserts])
+    for i in range(0, len(closed), INSERT_BATCH_SIZE):
+        session.execute(delete(OpenPosition).where(OpenPosition.ticket.in_(closed[i:i + INSERT_BATCH_SIZE])))
 
 def sync_open_positions(session, account_id):
-    """Sync Open Positions (Full Replace for Current State)"""
+    """Sync Open Positions as a diff: upsert new/changed tickets, delete closed ones"""
     try:
         positions = mt5.positions_get()
         if positions is None: 
             return
 
-        # 1. Clear existing open positions for this account
-        session.query(OpenPosition).filter_by(account_id=account_id).delete()
-        
-        # 2. Insert current
-        for pos in positions:
-            type_str = "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL"
-            
-            db_pos = OpenPosition(
-                ticket=pos.ticket,
-                account_id=account_id,
-                symbol=pos.symbol,
-                magic_number=pos.magic,
-                type=type_str,
-                volume=pos.volume,
-                open_price=pos.price_open,
-                current_price=pos.price_current,
-                sl=pos.sl,
-                tp=pos.tp,
-                profit=pos.profit,
-                swap=pos.swap,
-                comment=pos.comment
-            )
-            session.add(db_pos)
-        
+        if OUTBOX:
+            # Diffed against the baseline in the outbox file, which every collector process shares
+            get_outbox(OUTBOX_PATH).append_positions(
+                account_id, [position_to_row(pos, account_id) for pos in positions], POSITION_FIELDS)
+            return
+
+        upserts, closed = diff_open_positions(session, account_id, positions)
+        if not upserts and not closed:
+            return
+
+        apply_position_diff(session, upserts, closed)
         session.commit()
-        if len(positions) > 0:
-            logging.info(f"Synced {len(positions)} open positions.")
+        logging.info(f"Open positions for {account_id}: {len(positions)} open, {len(upserts)} upserted, {len(closed)} closed.")
             
     except Exception as e:
         logging.error(f"Error syncing positions for {account_id}: {e}")
         session.rollback()
+        if OUTBOX:
+            # Next outbox diff for this account becomes a full replace
+            get_outbox(OUTBOX_PATH).reset_positions(account_id)
 
 def get_config_paths(session):
     """Fetch MT5 paths from DB, fallback to ENV"""
@@ -216,58 +433,206 @@ def get_config_paths(session):
                 return paths
     except Exception as e:
         logging.error(f"Error fetching config from DB: {e}")
+        session.rollback()
+        # Let the caller keep its current paths rather than fall back during an outage
+        return None
     
     return ENV_MT5_PATHS
 
+# Sync jobs a terminal can run, in execution order
+JOBS = ("trades", "snapshot", "positions")
+# Fast cadence (live equity/positions) vs slow cadence (deal history)
+LIVE_JOBS = ("snapshot", "positions")
+HISTORY_JOBS = ("trades",)
+
+def sync_account(session, account_id, jobs=JOBS, result=None, snapshots=None):
+    """
+    Run the selected sync jobs for a connected account, recording per-job timings in `result`.
+    `snapshots` is passed to sync_account_snapshot as its buffer.
+    """
+    result = result if result is not None else {"inserted": 0, "skipped": 0, "timings": {}}
+    if "trades" in jobs:
+        t0 = time.perf_counter()
+        result["inserted"], result["skipped"] = sync_trades(session, account_id)
+        result["timings"]["trades"] = time.perf_counter() - t0
+    if "snapshot" in jobs:
+        t0 = time.perf_counter()
+        sync_account_snapshot(session, account_id, snapshots)
+        result["timings"]["snapshot"] = time.perf_counter() - t0
+    if "positions" in jobs:
+        t0 = time.perf_counter()
+        sync_open_positions(session, account_id)
+        result["timings"]["positions"] = time.perf_counter() - t0
+    return result
+
+def sync_terminal(session, path, jobs=JOBS, snapshots=None):
+    """
+    Connect to one terminal, run the sync jobs for its account and shut down.
+    Returns a result dict with the account, trade counts and per-step timings.
+    """
+    result = {"path": path, "account_id": None, "ok": False, "inserted": 0, "skipped": 0, "timings": {}, "error": None}
+    t_start = time.perf_counter()
+    try:
+        logging.info(f"--- Syncing Terminal: {path or 'Default'} ---")
+        t0 = time.perf_counter()
+        if not connect_mt5(path):
+            logging.error(f"Failed to connect to {path}")
+            result["error"] = f"connect failed: {mt5.last_error()}"
+            return result
+        result["timings"]["connect"] = time.perf_counter() - t0
+
+        # Get Account ID
+        account_info = mt5.account_info()
+        if not account_info:
+            logging.error("Failed to get account info")
+            result["error"] = "no account info"
+            return result
+
+        account_id = int(account_info.login)
+        result["account_id"] = account_id
+        logging.info(f"Targeting Account ID: {account_id}")
+
+        sync_account(session, account_id, jobs, result, snapshots)
+        result["ok"] = True
+    except Exception as e:
+        logging.error(f"Error processing path {path}: {e}")
+        result["error"] = str(e)
+    finally:
+        # Shutdown to release lock/context for next terminal
+        mt5.shutdown()
+        result["elapsed"] = time.perf_counter() - t_start
+    return result
+
+def get_sync_intervals(session):
+    """Live/history intervals (seconds) from app_config, falling back to config_vps defaults"""
+    intervals = {"live": LIVE_SYNC_INTERVAL, "history": HISTORY_SYNC_INTERVAL}
+    try:
+        for job, key in (("live", "live_sync_interval"), ("history", "history_sync_interval")):
+            value = get_app_config(session, key)
+            if value:
+                intervals[job] = max(1.0, float(value))
+    except Exception as e:
+        logging.error(f"Error fetching sync intervals from DB: {e}")
+        session.rollback()
+    return intervals
+
 def main():
     logging.info("Starting Collector Service...")
     
     # 1. Connect to DB
+    # Each job opens a short-lived session, so one failed statement can't leave a
+    # long-lived session stuck in a broken transaction.
     engine = get_engine(DATABASE_URL)
     create_tables(engine) # Ensure tables exist
     Session = sessionmaker(bind=engine)
-    session = Session()
     logging.info("Database connected.")
 
-    # 3. Main Loop
-    try:
-        while True:
-            # Refresh Config every cycle
+    # 2. Worker processes (one terminal per process) if enabled
+    executor = None
+    supervisor = None
+    with Session() as session:
+        intervals = get_sync_intervals(session)
+    if COLLECTOR_MODE == "pool":
+        from collector.workers import create_pool, run_pool_cycle
+        logging.info(f"Pool mode: up to {COLLECTOR_WORKERS} terminal worker processes.")
+    elif COLLECTOR_MODE == "persistent":
+        from collector.workers import WorkerSupervisor
+        supervisor = WorkerSupervisor(intervals)
+        logging.info("Persistent mode: one long-lived worker per terminal.")
+
+    state = {"paths": []}
+
+    # Local outbox: syncs queue their writes, a background thread drains them to the DB
+    outbox = None
+    flusher = None
+    if OUTBOX:
+        outbox = get_outbox(OUTBOX_PATH)
+        flusher = OutboxFlusher(outbox, Session, batch_size=OUTBOX_BATCH_SIZE, max_backoff=OUTBOX_MAX_BACKOFF)
+        flusher.start()
+        logging.info(f"Outbox enabled at {OUTBOX_PATH} ({outbox.pending()} batches pending).")
+
+    # Snapshots from all terminals are batched here (None = write each one immediately)
+    buffer = None
+    if SNAPSHOT_BUFFER:
+        buffer = SnapshotBuffer(SNAPSHOT_SPILL_FILE, max_rows=SNAPSHOT_FLUSH_ROWS, max_age=SNAPSHOT_FLUSH_SECONDS,
+                                coalesce=SNAPSHOT_COALESCE, heartbeat=SNAPSHOT_HEARTBEAT)
+
+    def collect_snapshots(results):
+        if buffer is not None:
+            for result in results:
+                for row in result.get("snapshots", ()):
+                    buffer.append(row)
+
+    def flush_snapshots(force=False):
+        if buffer is not None and (force or buffer.due()):
+            if outbox is not None:
+                buffer.flush(None, outbox)
+            else:
+                with Session() as session:
+                    buffer.flush(session)
+
+    def refresh_config():
+        with Session() as session:
             current_paths = get_config_paths(session)
-            
-            if not current_paths:
-                logging.warning("No MT5_PATH configured in DB or ENV. Trying default.")
-                current_paths = [None]
-            
+            intervals = get_sync_intervals(session)
+        if current_paths is None:
+            # DB unreachable: keep syncing what we were syncing
+            current_paths = state["paths"] or ENV_MT5_PATHS
+        if not current_paths:
+            logging.warning("No MT5_PATH configured in DB or ENV. Trying default.")
+            current_paths = [None]
+        if current_paths != state["paths"]:
             logging.info(f"Found {len(current_paths)} terminal(s) to sync.")
+            state["paths"] = current_paths
 
-            for path in current_paths:
-                try:
-                    logging.info(f"--- Syncing Terminal: {path or 'Default'} ---")
-                    if connect_mt5(path):
-                        # Get Account ID
-                        account_info = mt5.account_info()
-                        if account_info:
-                            account_id = int(account_info.login)
-                            logging.info(f"Targeting Account ID: {account_id}")
-                            sync_trades(session, account_id)
-                            sync_account_snapshot(session, account_id)
-                            sync_open_positions(session, account_id)
-                        else:
-                            logging.error("Failed to get account info")
-                        
-                        # Shutdown to release lock/context for next terminal
-                        mt5.shutdown()
-                    else:
-                        logging.error(f"Failed to connect to {path}")
-                except Exception as e:
-                    logging.error(f"Error processing path {path}: {e}")
-                    mt5.shutdown()
-            
-            logging.info("Cycle complete. Sleeping 60s...")
-            time.sleep(60)
+        if supervisor is not None:
+            supervisor.reconcile(current_paths)
+            supervisor.set_intervals(intervals)
+        else:
+            scheduler.set_interval("live", intervals["live"])
+            scheduler.set_interval("history", intervals["history"])
+
+    def run_jobs(jobs):
+        nonlocal executor
+        paths = state["paths"]
+        if COLLECTOR_MODE == "pool" and len(paths) > 1:
+            if executor is None:
+                executor = create_pool(COLLECTOR_WORKERS)
+            results, broken = run_pool_cycle(executor, paths, jobs)
+            if broken:
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = None
+            collect_snapshots(results)
+        else:
+            with Session() as session:
+                results = [sync_terminal(session, path, jobs, buffer) for path in paths]
+        return results
+
+    # 3. Main Loop: config refresh + fast (live) and slow (history) cadences
+    scheduler = Scheduler("collector")
+    scheduler.add("config", refresh_config, CONFIG_REFRESH_INTERVAL)
+    if supervisor is not None:
+        # Workers run their own schedules; we only collect what they report
+        scheduler.add("results", lambda: collect_snapshots(supervisor.drain_results()), 1.0)
+    else:
+        scheduler.add("history", lambda: run_jobs(HISTORY_JOBS), intervals["history"], SCHEDULER_JITTER)
+        scheduler.add("live", lambda: run_jobs(LIVE_JOBS), intervals["live"], SCHEDULER_JITTER)
+    scheduler.add("snapshots", flush_snapshots, 1.0)
+    logging.info(f"Live sync every {intervals['live']}s, history sync every {intervals['history']}s.")
+
+    try:
+        scheduler.run_forever()
     except KeyboardInterrupt:
         logging.info("Stopping Collector...")
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if supervisor is not None:
+            supervisor.shutdown()
+            collect_snapshots(supervisor.drain_results())
+        flush_snapshots(force=True)
+        if flusher is not None:
+            flusher.stop()
+            logging.info(f"Outbox has {outbox.pending()} batches pending for next start.")
         mt5.shutdown()
         sys.exit(0)
 
@@ -0,0 +1,282 @@
+"""
+Local durable outbox (write-ahead queue) between the collector and the database.
+
+With OUTBOX=1 the sync jobs append deals, position diffs and snapshots to a local
+SQLite file instead of writing to Postgres, so collection keeps running (and
+nothing collected is lost) while the database is slow or unreachable.
+An OutboxFlusher thread in the supervisor drains the queue to the database in large
+batches, retrying with exponential backoff.
+
+Several collector processes may append to the same file; SQLite serialises writers.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import delete
+
+from shared.db_models import AccountSnapshot, OpenPosition, dialect_insert
+from shared.partitions import partition_registry
+from collector.ea_registry import EARegistry
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+def _decode(obj):
+    if "$dt" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+class Outbox:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                account_id INTEGER,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        # Last deal queued per account, so sync_trades can resume without asking the DB
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS deal_watermarks (
+                account_id INTEGER PRIMARY KEY,
+                close_time TEXT NOT NULL,
+                ticket INTEGER NOT NULL
+            )""")
+        # Last position set queued per account, the baseline of the next position diff.
+        # Kept here rather than in memory: in pool mode consecutive cycles of one account
+        # run in different processes.
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS position_baselines (
+                account_id INTEGER PRIMARY KEY,
+                positions TEXT NOT NULL
+            )""")
+        # Backfill progress per account: start of the next window to fetch. Written with
+        # each queued window; the row is gone once the account's history is complete.
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                account_id INTEGER PRIMARY KEY,
+                next_from TEXT NOT NULL
+            )""")
+        self.lock = threading.Lock()
+
+    def append(self, kind, account_id, payload):
+        with self.lock:
+            self.conn.execute("INSERT INTO outbox (kind, account_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                              (kind, account_id, json.dumps(payload, default=_encode), time.time()))
+
+    def append_deals(self, account_id, rows, backfill_to=None):
+        """
+        Queue trade rows and advance the account's watermark in one local transaction.
+        `backfill_to` also moves the account's backfill checkpoint there (even with no rows).
+        """
+        if not rows and backfill_to is None:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if rows:
+                    last = max(rows, key=lambda r: (r["close_time"], r["ticket"]))
+                    self.conn.execute("INSERT INTO outbox (kind, account_id, payload, created_at) VALUES ('deals', ?, ?, ?)",
+                                      (account_id, json.dumps(rows, default=_encode), time.time()))
+                    self.conn.execute("""
+                        INSERT INTO deal_watermarks (account_id, close_time, ticket) VALUES (?, ?, ?)
+                        ON CONFLICT(account_id) DO UPDATE SET close_time = excluded.close_time, ticket = excluded.ticket
+                        WHERE excluded.ticket > deal_watermarks.ticket""",
+                                      (account_id, last["close_time"].isoformat(), last["ticket"]))
+                if backfill_to is not None:
+                    self.conn.execute("""
+                        INSERT INTO backfill_checkpoints (account_id, next_from) VALUES (?, ?)
+                        ON CONFLICT(account_id) DO UPDATE SET next_from = excluded.next_from""",
+                                      (account_id, backfill_to.isoformat()))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def get_watermark(self, account_id):
+        """(close_time, ticket) of the newest deal queued for this account, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT close_time, ticket FROM deal_watermarks WHERE account_id = ?",
+                                    (account_id,)).fetchone()
+        return (datetime.fromisoformat(row[0]), row[1]) if row else None
+
+    def get_backfill(self, account_id):
+        """Start of the next backfill window for this account, or None if no backfill is in progress"""
+        with self.lock:
+            row = self.conn.execute("SELECT next_from FROM backfill_checkpoints WHERE account_id = ?",
+                                    (account_id,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def finish_backfill(self, account_id, until):
+        """
+        Close the account's backfill. An account whose history had no deals gets its
+        watermark seeded at `until`, so later syncs resume from there.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM backfill_checkpoints WHERE account_id = ?", (account_id,))
+                self.conn.execute("INSERT OR IGNORE INTO deal_watermarks (account_id, close_time, ticket) VALUES (?, ?, 0)",
+                                  (account_id, until.replace(tzinfo=None).isoformat()))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def append_positions(self, account_id, rows, fields):
+        """
+        Queue the diff of an account's open position rows against the last set queued
+        for it (a full replace the first time), and make `rows` the new baseline, in
+        one local transaction. Returns the diff.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT positions FROM position_baselines WHERE account_id = ?",
+                                        (account_id,)).fetchone()
+                previous = json.loads(row[0], object_hook=_decode) if row else None
+                diff = position_diff(previous, rows, fields)
+                if diff["upserts"] or diff["closed"] or diff["replace"]:
+                    self.conn.execute("INSERT INTO outbox (kind, account_id, payload, created_at) VALUES ('positions', ?, ?, ?)",
+                                      (account_id, json.dumps(diff, default=_encode), time.time()))
+                self.conn.execute("""
+                    INSERT INTO position_baselines (account_id, positions) VALUES (?, ?)
+                    ON CONFLICT(account_id) DO UPDATE SET positions = excluded.positions""",
+                                  (account_id, json.dumps(rows, default=_encode)))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return diff
+
+    def reset_positions(self, account_id):
+        """Forget the account's baseline: its next position diff is a full replace"""
+        with self.lock:
+            self.conn.execute("DELETE FROM position_baselines WHERE account_id = ?", (account_id,))
+
+    def peek(self, limit):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, kind, account_id, payload FROM outbox ORDER BY id LIMIT ?",
+                                     (limit,)).fetchall()
+        return [(id_, kind, account_id, json.loads(payload, object_hook=_decode)) for id_, kind, account_id, payload in rows]
+
+    def ack(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def pending(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+_outboxes = {}
+
+def get_outbox(path):
+    """Per-process Outbox (SQLite connections must not cross a fork)"""
+    key = (os.getpid(), path)
+    if key not in _outboxes:
+        _outboxes[key] = Outbox(path)
+    return _outboxes[key]
+
+def position_diff(previous, rows, fields):
+    """
+    Diff of position rows against the previously queued rows (None when there are
+    none): new/changed rows to upsert and closed tickets, or a full replace
+    """
+    current = {row["ticket"]: row for row in rows}
+    if previous is None:
+        return {"upserts": list(current.values()), "closed": [], "replace": True}
+    previous = {row["ticket"]: row for row in previous}
+    upserts = [
+        row for ticket, row in current.items()
+        if ticket not in previous or any(previous[ticket].get(f) != row[f] for f in fields)
+    ]
+    closed = [ticket for ticket in previous if ticket not in current]
+    return {"upserts": upserts, "closed": closed, "replace": False}
+
+class OutboxFlusher(threading.Thread):
+    """Drains the outbox to the database in batches, backing off exponentially on failure"""
+
+    def __init__(self, outbox, Session, batch_size=500, idle=1.0, max_backoff=300.0):
+        super().__init__(name="outbox-flusher", daemon=True)
+        self.outbox = outbox
+        self.Session = Session
+        self.batch_size = batch_size
+        self.idle = idle
+        self.max_backoff = max_backoff
+        self.registry = EARegistry()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        backoff = self.idle
+        while not self.stop_event.is_set():
+            try:
+                flushed = self.flush_once()
+            except Exception as e:
+                pending = self.outbox.pending()
+                logging.warning(f"Outbox flush failed ({pending} batches pending), retrying in {backoff:.0f}s: {e}")
+                self.registry.invalidate()
+                partition_registry.invalidate()
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.idle
+            if not flushed:
+                self.stop_event.wait(self.idle)
+
+    def stop(self, timeout=30):
+        self.stop_event.set()
+        self.join(timeout)
+
+    def flush_once(self):
+        """Apply one batch of queued entries in a single transaction. Returns entries flushed."""
+        from collector.main_collector import write_trade_rows, apply_position_diff
+
+        entries = self.outbox.peek(self.batch_size)
+        if not entries:
+            return 0
+
+        t0 = time.perf_counter()
+        counts = {"deals": 0, "snapshots": 0, "positions": 0}
+        with self.Session() as session:
+            deals, snapshots = {}, []
+            for _, kind, account_id, payload in entries:
+                if kind == "deals":
+                    deals.setdefault(account_id, []).extend(payload)
+                elif kind == "snapshots":
+                    snapshots.extend(payload)
+                elif kind == "positions":
+                    # Position diffs are order-sensitive, apply them as they come
+                    if payload["replace"]:
+                        keep = [row["ticket"] for row in payload["upserts"]]
+                        session.execute(delete(OpenPosition).where(OpenPosition.account_id == account_id,
+                                                                   OpenPosition.ticket.not_in(keep)))
+                    apply_position_diff(session, payload["upserts"], payload["closed"])
+                    counts["positions"] += 1
+
+            for account_id, rows in deals.items():
+                counts["deals"] += write_trade_rows(session, account_id, rows, self.registry)
+            if snapshots:
+                partition_registry.ensure(session, "account_snapshots", {row["timestamp"] for row in snapshots})
+                # A batch replayed after a crash between commit and ack is skipped by the unique key
+                stmt = dialect_insert(session.get_bind(), AccountSnapshot.__table__).on_conflict_do_nothing()
+                session.execute(stmt, snapshots)
+                counts["snapshots"] = len(snapshots)
+            session.commit()
+
+        self.outbox.ack([entry[0] for entry in entries])
+        level = logging.INFO if counts["deals"] else logging.DEBUG
+        logging.log(level, f"Outbox flushed {len(entries)} batches in {time.perf_counter() - t0:.2f}s: "
+                    f"{counts['deals']} new deals, {counts['snapshots']} snapshots, {counts['positions']} position diffs.")
+        return len(entries)
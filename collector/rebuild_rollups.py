@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+from shared.db_models import get_engine
+from shared.rollups import rebuild_daily_pnl
+from shared.risk_state import rebuild_risk_state
+from collector.config_vps import DATABASE_URL
+
+def main():
+    """
+    Recompute the daily_pnl rollup and the risk_state metrics from `trades`.
+    Usage: python collector/rebuild_rollups.py [account_id]
+    Safe while the collector is running (its upserts wait for the rebuild to commit).
+    """
+    account_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    Session = sessionmaker(bind=get_engine(DATABASE_URL))
+
+    t0 = time.perf_counter()
+    with Session() as session:
+        rows = rebuild_daily_pnl(session, account_id)
+        states = rebuild_risk_state(session, account_id)
+        session.commit()
+    scope = f"account {account_id}" if account_id is not None else "all accounts"
+    print(f"Rebuilt daily_pnl for {scope}: {rows} rows, risk_state: {states} states "
+          f"in {time.perf_counter() - t0:.2f}s.")
+
+if __name__ == "__main__":
+    main()
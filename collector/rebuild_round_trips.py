@@ -0,0 +1,129 @@
+"""
+Recompute `round_trips` (and the open `position_legs`) from the deals in `trades`.
+
+Usage:
+    python collector/rebuild_round_trips.py [account_id] [--backfill]
+
+Safe while the collector is running (its matching waits for the rebuild to commit).
+
+--backfill first fills position_id/entry on deals stored before migration 5 by
+re-reading each configured terminal's MT5 history (BACKFILL_WINDOW_DAYS per
+transaction), then rebuilds round_trips, daily_pnl and risk_state for those
+accounts so IN deals stop counting as trades. The deals are updated in place,
+which an append-only Parquet mirror never sees: a mirror configured on this
+machine (PARQUET_MIRROR_DIR) is dropped from the first backfilled month on and
+resynced; for one on another machine the command to run there is printed.
+"""
+import os
+import sys
+import time
+import logging
+from datetime import timedelta, timezone, datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, update, func, bindparam
+from sqlalchemy.orm import sessionmaker
+from shared.db_models import Trade, get_engine
+from shared import parquet_mirror
+from shared.rollups import rebuild_daily_pnl
+from shared.risk_state import rebuild_risk_state
+from shared.round_trips import rebuild_round_trips
+from collector.config_vps import DATABASE_URL, BACKFILL_WINDOW_DAYS
+
+logging.basicConfig(level=logging.INFO)
+
+def backfill_positions(session, mt5, main_collector, account_id):
+    """
+    Set position_id/entry on this account's deals that lack them.
+    Returns (rows updated, close_time of the first deal that lacked them).
+    """
+    first = session.execute(select(func.min(Trade.close_time)).where(
+        Trade.account_id == account_id, Trade.position_id.is_(None), Trade.type != "BALANCE")).scalar()
+    if first is None:
+        return 0, None
+    stmt = (update(Trade.__table__)
+            .where(Trade.ticket == bindparam("t_ticket"), Trade.position_id.is_(None))
+            .values(position_id=bindparam("t_position_id"), entry=bindparam("t_entry")))
+    window = timedelta(days=BACKFILL_WINDOW_DAYS)
+    cursor, end = first.replace(tzinfo=timezone.utc), datetime.now(timezone.utc)
+    updated = 0
+    while cursor <= end:
+        deals = mt5.history_deals_get(cursor, cursor + window)
+        if deals is None:
+            logging.error(f"Backfill for {account_id} stopped at {cursor}: error fetching deals ({mt5.last_error()})")
+            break
+        rows = [main_collector.deal_to_row(deal, account_id) for deal in deals]
+        params = [{"t_ticket": r["ticket"], "t_position_id": r["position_id"], "t_entry": r["entry"]}
+                  for r in rows if r["position_id"]]
+        if params:
+            updated += session.execute(stmt, params).rowcount
+        session.commit()
+        cursor += window
+    return updated, first
+
+def backfill(Session, only=None):
+    """
+    Backfill every configured terminal (or only account `only`).
+    Returns {account_id: first deal backfilled (None if none needed it)}.
+    """
+    from collector import main_collector
+    mt5 = main_collector.mt5
+    accounts = {}
+    with Session() as session:
+        paths = main_collector.get_config_paths(session) or [None]
+        for path in paths:
+            if not main_collector.connect_mt5(path):
+                continue
+            try:
+                account_id = int(mt5.account_info().login)
+                if only is not None and account_id != only:
+                    continue
+                updated, first = backfill_positions(session, mt5, main_collector, account_id)
+                accounts[account_id] = first if updated else None
+                print(f"Account {account_id}: position/entry set on {updated} deals.")
+            finally:
+                mt5.shutdown()
+    return accounts
+
+def resync_mirror(engine, backfilled):
+    """Refetch the backfilled deals ({account_id: first close_time}) into the Parquet mirror"""
+    if not backfilled:
+        return
+    root = parquet_mirror.get_mirror_dir()
+    if root and parquet_mirror.available():
+        for acc, first in backfilled.items():
+            parquet_mirror.invalidate(root, "trades", acc, first)
+        written = parquet_mirror.sync(engine, root, tables=("trades",))
+        print(f"Resynced {written['trades']} mirrored deals.")
+        return
+    for acc, first in backfilled.items():
+        print(f"On a machine with a Parquet mirror, run: "
+              f"python collector/sync_mirror.py --resync {acc} --since {first:%Y-%m-%d}")
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    account_id = int(args[0]) if args else None
+    engine = get_engine(DATABASE_URL)
+    Session = sessionmaker(bind=engine)
+
+    t0 = time.perf_counter()
+    if "--backfill" in sys.argv:
+        # Rollup counts change for the backfilled deals
+        backfilled = backfill(Session, account_id)
+        for acc in backfilled:
+            with Session() as session:
+                rebuild_daily_pnl(session, acc)
+                rebuild_risk_state(session, acc)
+                session.commit()
+        resync_mirror(engine, {acc: first for acc, first in backfilled.items() if first})
+
+    with Session() as session:
+        trips, legs = rebuild_round_trips(session, account_id)
+        session.commit()
+    scope = f"account {account_id}" if account_id is not None else "all accounts"
+    print(f"Rebuilt round_trips for {scope}: {trips} round trips, {legs} open positions "
+          f"in {time.perf_counter() - t0:.2f}s.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Minimal interval scheduler for the collector.
+
+Jobs run in the calling thread, one at a time (an MT5 connection is not shared
+across threads). Overrun protection: the next run is scheduled from when a job
+*finished*, so a slow sync is never queued up behind itself or replayed in a burst.
+"""
+import time
+import random
+import logging
+
+# How often each job's accumulated timings are summarised in the log (seconds)
+STATS_INTERVAL = 300
+
+class Job:
+    def __init__(self, name, func, interval, jitter=0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = 0.0 # due immediately
+        # Timing stats since the last summary
+        self.runs = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.overruns = 0
+        self.failures = 0
+
+    def schedule_next(self, now):
+        spread = self.interval * self.jitter
+        self.next_run = now + max(0.0, self.interval + random.uniform(-spread, spread))
+
+    def reset_stats(self):
+        self.runs, self.total, self.max, self.overruns, self.failures = 0, 0.0, 0.0, 0, 0
+
+class Scheduler:
+    def __init__(self, name="collector"):
+        self.name = name
+        self.jobs = {}
+        self._last_stats = time.monotonic()
+
+    def add(self, name, func, interval, jitter=0.0):
+        job = Job(name, func, interval, jitter)
+        self.jobs[name] = job
+        return job
+
+    def set_interval(self, name, interval):
+        """Change a job's interval; takes effect from its next scheduled run"""
+        job = self.jobs[name]
+        if interval and interval != job.interval:
+            logging.info(f"[{self.name}] Job '{name}' interval {job.interval}s -> {interval}s")
+            job.interval = interval
+            job.next_run = min(job.next_run, time.monotonic() + interval)
+
+    def seconds_until_next(self):
+        if not self.jobs:
+            return 1.0
+        return max(0.0, min(job.next_run for job in self.jobs.values()) - time.monotonic())
+
+    def run_pending(self):
+        """Run every job that is due, in registration order"""
+        for job in list(self.jobs.values()):
+            if time.monotonic() < job.next_run:
+                continue
+            t0 = time.monotonic()
+            try:
+                job.func()
+            except Exception as e:
+                job.failures += 1
+                logging.error(f"[{self.name}] Job '{job.name}' failed: {e}")
+            finished = time.monotonic()
+            duration = finished - t0
+
+            job.runs += 1
+            job.total += duration
+            job.max = max(job.max, duration)
+            logging.debug(f"[{self.name}] Job '{job.name}' took {duration:.3f}s")
+            if duration > job.interval:
+                job.overruns += 1
+                logging.warning(f"[{self.name}] Job '{job.name}' overran: {duration:.2f}s > {job.interval}s interval. Next run skipped ahead.")
+            job.schedule_next(finished)
+
+        if time.monotonic() - self._last_stats >= STATS_INTERVAL:
+            self.log_stats()
+
+    def log_stats(self):
+        for job in self.jobs.values():
+            if job.runs:
+                logging.info(f"[{self.name}] Job '{job.name}': {job.runs} runs, avg {job.total / job.runs:.3f}s, "
+                             f"max {job.max:.3f}s, {job.overruns} overruns, {job.failures} failures")
+            job.reset_stats()
+        self._last_stats = time.monotonic()
+
+    def run_forever(self, idle=None):
+        """
+        Loop forever. `idle(timeout)` is called between runs to wait for the next due
+        job (defaults to time.sleep) so callers can service queues while waiting.
+        """
+        idle = idle or time.sleep
+        while True:
+            self.run_pending()
+            idle(min(1.0, self.seconds_until_next()))
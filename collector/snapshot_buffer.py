@@ -0,0 +1,111 @@
+"""
+Buffered writer for account snapshots.
+
+Snapshot rows from every terminal are collected in memory and written to
+`account_snapshots` as one multi-row INSERT once the buffer reaches a size or age
+threshold. Every buffered row is also appended to a local spill file (JSON lines),
+so rows not yet written survive a collector crash and are reloaded on restart.
+Delivery is at-least-once: a crash between the DB commit and clearing the spill
+file replays that batch.
+
+Optionally, consecutive snapshots whose balance, equity and margin are unchanged
+are dropped (one is still kept every `heartbeat` seconds so the latest
+timestamp stays fresh).
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+from shared.db_models import AccountSnapshot, dialect_insert
+from shared.partitions import partition_registry
+
+# Fields that must change for a snapshot to be kept when coalescing
+COALESCE_FIELDS = ("balance", "equity", "margin")
+
+class SnapshotBuffer:
+    def __init__(self, spill_path, max_rows=200, max_age=30.0, coalesce=True, heartbeat=300.0):
+        self.spill_path = spill_path
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.coalesce = coalesce
+        self.heartbeat = heartbeat
+        self.rows = []
+        self.oldest = None # monotonic time the oldest buffered row was added
+        self.last_kept = {} # account_id -> (values, monotonic time kept)
+        self.dropped = 0
+        self._load_spill()
+
+    def _load_spill(self):
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue # torn final line from a crash mid-write
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                self.rows.append(row)
+        if self.rows:
+            self.oldest = time.monotonic()
+            logging.info(f"Recovered {len(self.rows)} unsent snapshots from {self.spill_path}.")
+
+    def append(self, row):
+        """Buffer one snapshot row dict. Returns False if it was coalesced away."""
+        now = time.monotonic()
+        values = tuple(row.get(f) for f in COALESCE_FIELDS)
+        if self.coalesce:
+            last = self.last_kept.get(row["account_id"])
+            if last and last[0] == values and now - last[1] < self.heartbeat:
+                self.dropped += 1
+                return False
+        self.last_kept[row["account_id"]] = (values, now)
+
+        self.rows.append(row)
+        if self.oldest is None:
+            self.oldest = now
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n")
+        return True
+
+    def due(self):
+        if not self.rows:
+            return False
+        return len(self.rows) >= self.max_rows or time.monotonic() - self.oldest >= self.max_age
+
+    def flush(self, session, outbox=None):
+        """
+        Write all buffered rows in one multi-row INSERT, or hand them to the
+        local outbox as one batch when `outbox` is given. Returns rows written.
+        """
+        if not self.rows:
+            return 0
+        rows = self.rows
+        try:
+            if outbox is not None:
+                outbox.append("snapshots", None, rows)
+            else:
+                partition_registry.ensure(session, "account_snapshots", {row["timestamp"] for row in rows})
+                # Rows recovered from the spill file may already be stored
+                stmt = dialect_insert(session.get_bind(), AccountSnapshot.__table__).on_conflict_do_nothing()
+                session.execute(stmt, rows)
+                session.commit()
+        except Exception as e:
+            logging.error(f"Error flushing {len(rows)} snapshots (kept for retry): {e}")
+            if session is not None:
+                session.rollback()
+                # A partition created in the rolled-back transaction is gone again
+                partition_registry.invalidate()
+            return 0
+
+        self.rows = []
+        self.oldest = None
+        open(self.spill_path, "w").close()
+        logging.debug(f"Flushed {len(rows)} snapshots ({self.dropped} unchanged dropped since last flush).")
+        self.dropped = 0
+        return len(rows)
@@ -0,0 +1,77 @@
+"""
+Keep the local Parquet mirror of `trades` and `account_snapshots` up to date.
+
+Usage:
+    python collector/sync_mirror.py [--every SECONDS] [--bench] [--resync ACCOUNT_ID [--since YYYY-MM-DD]]
+
+The mirror lives in PARQUET_MIRROR_DIR (set the same variable for the dashboard
+so it reads history from the mirror). Each run appends what was written since the
+last one and compacts partitions that collected many small files. --every keeps
+syncing on an interval; --bench compares a full history load from the database
+with one from the mirror. --resync drops an account's mirrored deals (from the
+month of --since on) before syncing, so rows updated in the database since they
+were mirrored (a `rebuild_round_trips.py --backfill`) are fetched again.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from shared.db_models import get_engine
+from shared import parquet_mirror
+from collector.config_vps import DATABASE_URL
+
+BENCH_COLUMNS = ["ticket", "account_id", "magic_number", "symbol", "type", "volume", "profit", "commission", "swap",
+                 "close_time"]
+
+def sync_once(engine, root):
+    t0 = time.perf_counter()
+    written = parquet_mirror.sync(engine, root)
+    merged = parquet_mirror.compact(root)
+    rows = ", ".join(f"{table}: {n}" for table, n in written.items())
+    print(f"Synced mirror ({rows}; {merged} partition(s) compacted) in {time.perf_counter() - t0:.2f}s.")
+
+def bench(engine, root):
+    t0 = time.perf_counter()
+    db_df = pd.read_sql(f"SELECT {', '.join(BENCH_COLUMNS)} FROM trades", engine)
+    db_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    mirror_df = parquet_mirror.read(root, "trades", columns=BENCH_COLUMNS)
+    mirror_time = time.perf_counter() - t0
+    print(f"pd.read_sql: {len(db_df):,} rows in {db_time:.3f}s, {db_df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"mirror:      {len(mirror_df):,} rows in {mirror_time:.3f}s, {mirror_df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"Speed-up: {db_time / mirror_time:.1f}x")
+
+def main():
+    root = parquet_mirror.get_mirror_dir()
+    if not root:
+        print("PARQUET_MIRROR_DIR is not set.")
+        sys.exit(1)
+    if not parquet_mirror.available():
+        print("pyarrow is not installed: pip install pyarrow")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    every = float(args[args.index("--every") + 1]) if "--every" in args else None
+    engine = get_engine(DATABASE_URL)
+
+    if "--resync" in args:
+        account_id = int(args[args.index("--resync") + 1])
+        since = datetime.strptime(args[args.index("--since") + 1], "%Y-%m-%d") if "--since" in args else None
+        removed = parquet_mirror.invalidate(root, "trades", account_id, since)
+        print(f"Dropped {removed} mirrored partition(s) of account {account_id}.")
+    sync_once(engine, root)
+    if "--bench" in args:
+        bench(engine, root)
+    while every:
+        time.sleep(every)
+        try:
+            sync_once(engine, root)
+        except Exception as e:
+            print(f"Sync failed (retrying in {every:.0f}s): {e}")
+
+if __name__ == "__main__":
+    main()
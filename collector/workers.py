@@ -0,0 +1,261 @@
+"""
+Worker-per-terminal collection.
+
+The MetaTrader5 library binds a single terminal per process, so terminals can only be
+synced in parallel from separate processes. Each worker process owns its own MT5
+connection and its own DB engine; the supervisor (main_collector.main) only gathers
+per-terminal results and timings. With SNAPSHOT_BUFFER on, workers return their
+snapshot rows in the result so the supervisor can batch them across terminals.
+
+Two modes:
+- pool: a ProcessPoolExecutor; each task connects, syncs and shuts the terminal down.
+- persistent: one long-lived process per terminal that keeps MT5 initialized
+  between runs, only reconnects after a failure, and runs its own live/history
+  schedule (see collector/scheduler.py).
+"""
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Add parent directory to path so we can import shared
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+from shared.db_models import get_engine
+from collector.config_vps import DATABASE_URL, SCHEDULER_JITTER, SNAPSHOT_BUFFER
+from collector.scheduler import Scheduler
+
+# Per-process DB engine, created lazily inside each worker
+_Session = None
+
+def _get_session():
+    global _Session
+    if _Session is None:
+        _Session = sessionmaker(bind=get_engine(DATABASE_URL))
+    return _Session()
+
+def collect_terminal(path, jobs=None):
+    """Worker entry point: sync one terminal in this process"""
+    from collector.main_collector import sync_terminal, JOBS
+
+    session = _get_session()
+    snapshots = [] if SNAPSHOT_BUFFER else None # handed back to the supervisor's buffer
+    try:
+        result = sync_terminal(session, path, jobs or JOBS, snapshots)
+    finally:
+        session.close()
+    result["snapshots"] = snapshots or []
+    result["pid"] = os.getpid()
+    return result
+
+def create_pool(max_workers):
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+def run_pool_cycle(executor, paths, jobs=None):
+    """
+    Sync all terminals concurrently on the pool. The cycle takes about as long as
+    the slowest terminal. Returns (results, broken) where `broken` means the pool
+    lost a worker and must be recreated.
+    """
+    cycle_start = time.perf_counter()
+    futures = {executor.submit(collect_terminal, path, jobs): path for path in paths}
+    results = []
+    broken = False
+
+    for future in as_completed(futures):
+        path = futures[future]
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            broken = True
+            result = {"path": path, "account_id": None, "ok": False, "timings": {}, "error": f"worker died: {e}"}
+        except Exception as e:
+            result = {"path": path, "account_id": None, "ok": False, "timings": {}, "error": str(e)}
+        results.append(result)
+
+        timings = " ".join(f"{k}={v:.2f}s" for k, v in result.get("timings", {}).items())
+        if result["ok"]:
+            # Live-cadence cycles are frequent; only deal ingests are worth an INFO line
+            level = logging.INFO if result.get("inserted") else logging.DEBUG
+            logging.log(level, f"[{path or 'Default'}] account {result['account_id']}: "
+                        f"{result.get('inserted', 0)} new deals in {result.get('elapsed', 0):.2f}s ({timings})")
+        else:
+            logging.error(f"[{path or 'Default'}] sync failed: {result['error']}")
+
+    slowest = max((r.get("elapsed", 0) for r in results), default=0)
+    logging.debug(f"Pool cycle: {len(paths)} terminals in {time.perf_counter() - cycle_start:.2f}s (slowest terminal {slowest:.2f}s)")
+    return results, broken
+
+
+# --- Persistent workers ---
+
+def _terminal_worker_loop(path, commands, results, intervals):
+    """
+    Worker process body: keeps one terminal initialized and runs its own live/history
+    schedule. Commands: ("intervals", {job: seconds}) to retune, None to stop.
+    """
+    from collector.main_collector import mt5, connect_mt5, sync_account, LIVE_JOBS, HISTORY_JOBS
+
+    # Ctrl+C goes to the whole process group; let the supervisor stop us cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    label = path or "Default"
+    state = {"account_id": None}
+
+    def ensure_connected(result):
+        """Reconnect only if we never connected or the terminal went away"""
+        if state["account_id"] is not None and mt5.terminal_info():
+            return True
+        if state["account_id"] is not None:
+            logging.warning(f"[{label}] Terminal connection lost. Reconnecting...")
+            mt5.shutdown()
+        state["account_id"] = None
+        t0 = time.perf_counter()
+        if not connect_mt5(path):
+            result["error"] = f"connect failed: {mt5.last_error()}"
+            return False
+        result["timings"]["connect"] = time.perf_counter() - t0
+        info = mt5.account_info()
+        if not info:
+            mt5.shutdown()
+            result["error"] = "no account info"
+            return False
+        state["account_id"] = int(info.login)
+        return True
+
+    def run(job, jobs):
+        result = {"path": path, "job": job, "account_id": None, "ok": False, "inserted": 0, "skipped": 0,
+                  "timings": {}, "error": None, "pid": os.getpid(), "snapshots": []}
+        t_start = time.perf_counter()
+        try:
+            if ensure_connected(result):
+                result["account_id"] = state["account_id"]
+                snapshots = result["snapshots"] if SNAPSHOT_BUFFER else None
+                # Fresh session per run so a broken transaction never outlives it
+                with _get_session() as session:
+                    sync_account(session, state["account_id"], jobs, result, snapshots)
+                result["ok"] = True
+        except Exception as e:
+            logging.error(f"[{label}] Job '{job}' failed: {e}")
+            result["error"] = str(e)
+            # Force a clean reconnect next run
+            mt5.shutdown()
+            state["account_id"] = None
+        finally:
+            result["elapsed"] = time.perf_counter() - t_start
+            results.put(result)
+
+    scheduler = Scheduler(label)
+    scheduler.add("history", lambda: run("history", HISTORY_JOBS), intervals["history"], SCHEDULER_JITTER)
+    scheduler.add("live", lambda: run("live", LIVE_JOBS), intervals["live"], SCHEDULER_JITTER)
+
+    while True:
+        scheduler.run_pending()
+        try:
+            command = commands.get(timeout=min(1.0, scheduler.seconds_until_next()))
+        except queue.Empty:
+            continue
+        if command is None:
+            break
+        kind, payload = command
+        if kind == "intervals":
+            for name, interval in payload.items():
+                scheduler.set_interval(name, interval)
+
+    mt5.shutdown()
+
+class TerminalWorker:
+    """Handle on a long-lived worker process bound to one terminal path"""
+
+    def __init__(self, path, results, intervals):
+        self.path = path
+        self.label = path or "Default"
+        self.commands = mp.Queue()
+        self.intervals = dict(intervals)
+        self.process = mp.Process(target=_terminal_worker_loop, args=(path, self.commands, results, self.intervals),
+                                  name=f"mt5-worker-{self.label}", daemon=True)
+
+    def start(self):
+        self.process.start()
+        logging.info(f"[{self.label}] Worker started (pid {self.process.pid}).")
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def set_intervals(self, intervals):
+        if intervals != self.intervals:
+            self.intervals = dict(intervals)
+            self.commands.put(("intervals", self.intervals))
+
+    def stop(self, timeout=10):
+        if self.process.is_alive():
+            self.commands.put(None)
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout)
+        logging.info(f"[{self.label}] Worker stopped.")
+
+class WorkerSupervisor:
+    """Starts/stops one persistent worker per configured path and gathers their results"""
+
+    def __init__(self, intervals):
+        self.results = mp.Queue()
+        self.workers = {}
+        self.paths = []
+        self.intervals = dict(intervals)
+
+    def reconcile(self, paths):
+        """Match running workers to the configured paths (mt5_paths in app_config)"""
+        self.paths = list(dict.fromkeys(paths))
+        for path in list(self.workers):
+            if path not in self.paths:
+                self.workers.pop(path).stop()
+        for path in self.paths:
+            worker = self.workers.get(path)
+            if worker is not None and not worker.is_alive():
+                logging.warning(f"[{worker.label}] Worker died (exit code {worker.process.exitcode}). Restarting.")
+                worker = None
+            if worker is None:
+                worker = TerminalWorker(path, self.results, self.intervals)
+                worker.start()
+                self.workers[path] = worker
+
+    def set_intervals(self, intervals):
+        self.intervals = dict(intervals)
+        for worker in self.workers.values():
+            worker.set_intervals(self.intervals)
+
+    def drain_results(self):
+        """Log whatever the workers have reported since the last call; restart dead workers"""
+        results = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            results.append(result)
+            label = result["path"] or "Default"
+            timings = " ".join(f"{k}={v:.2f}s" for k, v in result["timings"].items())
+            if not result["ok"]:
+                logging.error(f"[{label}] {result['job']} sync failed: {result['error']}")
+            elif result["inserted"] or "connect" in result["timings"]:
+                logging.info(f"[{label}] {result['job']} account {result['account_id']}: "
+                             f"{result['inserted']} new deals in {result['elapsed']:.2f}s ({timings})")
+            else:
+                logging.debug(f"[{label}] {result['job']} in {result['elapsed']:.3f}s ({timings})")
+
+        if any(not worker.is_alive() for worker in self.workers.values()):
+            self.reconcile(self.paths)
+        return results
+
+    def shutdown(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers.clear()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, BigInteger
+from sqlalchemy import create_engine, make_url, Column, Integer, String, Float, Date, DateTime, BigInteger, Index
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 
@@ -25,6 +25,14 @@ class AppConfig(Base):
 class Trade(Base):
     """Historical Trade Data"""
     __tablename__ = 'trades'
+    __table_args__ = (
+        # "Latest close_time for account" (sync_trades) and per-account time ranges
+        Index("ix_trades_account_close_time", "account_id", "close_time"),
+        # trades -> eas join on (magic_number, account_id), filtered by account
+        Index("ix_trades_account_magic", "account_id", "magic_number"),
+        # Deals of a position (round-trip reconstruction)
+        Index("ix_trades_account_position", "account_id", "position_id"),
+    )
 
     ticket = Column(BigInteger, primary_key=True)
     account_id = Column(BigInteger, index=True) # MT5 Login ID
@@ -40,12 +48,15 @@ class Trade(Base):
     commission = Column(Float)
     swap = Column(Float)
     comment = Column(String)
+    position_id = Column(BigInteger) # MT5 position the deal belongs to (NULL for deals stored before migration 5)
+    entry = Column(String) # "IN", "OUT", "INOUT", "OUT_BY" (NULL as above)
 
 class AccountSnapshot(Base):
     """TimeSeries data for Account Health (Equity, Margin, etc.)"""
     __tablename__ = 'account_snapshots'
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # BIGINT is not a rowid alias in SQLite, so the local fallback needs INTEGER to autoincrement
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
     account_id = Column(BigInteger, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     
@@ -59,6 +70,133 @@ class AccountSnapshot(Base):
     # Flexible field for future metrics (stored as JSON string)
     extra_data = Column(String, nullable=True)
 
+# Latest snapshot per account (DISTINCT ON (account_id) ... ORDER BY account_id, timestamp DESC).
+# Unique, so a replayed snapshot batch (outbox, spill file) is skipped with ON CONFLICT DO NOTHING.
+Index("ux_account_snapshots_account_timestamp", AccountSnapshot.account_id, AccountSnapshot.timestamp.desc(),
+      unique=True)
+
+class EquityBar(Base):
+    """
+    OHLC-style equity bars downsampled from `account_snapshots` (shared/retention.py):
+    hourly bars from raw snapshots, daily bars from hourly ones. They outlive the
+    raw snapshots they were built from.
+    """
+    __tablename__ = 'equity_bars'
+
+    account_id = Column(BigInteger, primary_key=True)
+    resolution = Column(String, primary_key=True) # "1h" or "1d"
+    bucket = Column(DateTime, primary_key=True) # start of the hour/day (UTC)
+    open = Column(Float) # equity
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    balance = Column(Float) # balance at close
+    margin = Column(Float) # highest margin in the bucket
+    margin_level = Column(Float) # lowest margin level in the bucket
+    samples = Column(Integer) # raw snapshots aggregated
+
+class DailyPnl(Base):
+    """
+    Per-day rollup of `trades` (see shared/rollups.py). Maintained by the collector in
+    the same transaction as the deals, so dashboards can read it instead of every deal.
+    """
+    __tablename__ = 'daily_pnl'
+
+    account_id = Column(BigInteger, primary_key=True)
+    magic_number = Column(BigInteger, primary_key=True)
+    symbol = Column(String, primary_key=True) # '' for balance operations
+    day = Column(Date, primary_key=True) # UTC day of close_time
+
+    net_profit = Column(Float, default=0.0) # profit + commission + swap of all non-BALANCE deals, IN deals included
+    gross_profit = Column(Float, default=0.0) # sum of positive deal nets
+    gross_loss = Column(Float, default=0.0) # sum of negative deal nets (<= 0), incl. the commission of IN deals
+    trades = Column(Integer, default=0) # exits: non-BALANCE deals other than IN (all of them before entry was stored)
+    wins = Column(Integer, default=0) # exits with a positive net
+    losses = Column(Integer, default=0) # exits with a negative net
+    volume = Column(Float, default=0.0)
+    deposits = Column(Float, default=0.0) # BALANCE deals (deposits/withdrawals)
+
+class RoundTrip(Base):
+    """
+    A closed position (or the closed part of one), reconstructed from its IN/OUT
+    deals by shared/round_trips.py. One row per closing deal, so a partial close
+    or a reversal yields one row per exit.
+    """
+    __tablename__ = 'round_trips'
+    __table_args__ = (
+        Index("ix_round_trips_account_close_time", "account_id", "close_time"),
+    )
+
+    close_ticket = Column(BigInteger, primary_key=True) # the deal that closed this volume
+    account_id = Column(BigInteger)
+    position_id = Column(BigInteger)
+    open_ticket = Column(BigInteger) # first entry deal (NULL if the entry predates the history)
+    magic_number = Column(BigInteger)
+    symbol = Column(String)
+    direction = Column(String) # "BUY" (long) or "SELL" (short)
+    volume = Column(Float) # closed volume
+    open_time = Column(DateTime)
+    close_time = Column(DateTime)
+    open_price = Column(Float) # volume-weighted entry price
+    close_price = Column(Float)
+    holding_seconds = Column(Float)
+    profit = Column(Float)
+    commission = Column(Float) # exit commission + the entry commission share of this volume
+    swap = Column(Float)
+    net_profit = Column(Float) # profit + commission + swap
+
+class PositionLeg(Base):
+    """Open remainder of a position, the matcher state between deal batches (see shared/round_trips.py)"""
+    __tablename__ = 'position_legs'
+
+    account_id = Column(BigInteger, primary_key=True)
+    position_id = Column(BigInteger, primary_key=True)
+    open_ticket = Column(BigInteger)
+    magic_number = Column(BigInteger)
+    symbol = Column(String)
+    direction = Column(String)
+    volume = Column(Float)
+    open_price = Column(Float)
+    open_time = Column(DateTime)
+    commission = Column(Float) # entry commission not yet assigned to a round trip
+
+class RiskState(Base):
+    """
+    Running risk metrics of an account's deals (magic_number -1) or of one EA on it,
+    maintained deal by deal by shared/risk_state.py
+    """
+    __tablename__ = 'risk_state'
+
+    account_id = Column(BigInteger, primary_key=True)
+    magic_number = Column(BigInteger, primary_key=True)
+    last_close_time = Column(DateTime) # (close_time, ticket) of the last deal folded in
+    last_ticket = Column(BigInteger)
+    trades = Column(Integer, default=0) # exits, like daily_pnl
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    net_profit = Column(Float, default=0.0) # cumulative, all non-balance deals
+    gross_profit = Column(Float, default=0.0)
+    gross_loss = Column(Float, default=0.0)
+    peak = Column(Float) # highest cumulative net so far
+    peak_time = Column(DateTime)
+    max_drawdown = Column(Float, default=0.0) # <= 0
+    max_drawdown_seconds = Column(Float, default=0.0) # longest time below a peak
+    win_streak = Column(Integer, default=0) # current
+    loss_streak = Column(Integer, default=0)
+    max_win_streak = Column(Integer, default=0)
+    max_loss_streak = Column(Integer, default=0)
+    mean = Column(Float, default=0.0) # per-trade net: running mean, sum of squared deviations (Welford)
+    m2 = Column(Float, default=0.0)
+    downside_sq = Column(Float, default=0.0) # sum of squared losing-trade nets (Sortino)
+
+class SchemaVersion(Base):
+    """Applied schema migrations (see shared/migrations.py)"""
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
 class AccountAlias(Base):
     __tablename__ = 'account_aliases'
     account_id = Column(String, primary_key=True)
@@ -84,10 +222,48 @@ class OpenPosition(Base):
     comment = Column(String)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-def get_engine(db_url: str):
-    return create_engine(db_url)
+# Connection pool for Postgres. Neon closes idle connections, so a pooled one is
+# pinged before use and replaced after POOL_RECYCLE_SECONDS.
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+POOL_RECYCLE_SECONDS = 300
+POOL_TIMEOUT_SECONDS = 10
+# libpq TCP keepalives: a connection dropped by a NAT or proxy fails fast instead of hanging
+KEEPALIVE_ARGS = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 5}
+
+def get_engine(db_url: str, **kwargs):
+    """Engine with the pool settings above on Postgres; keyword arguments override them"""
+    options = {}
+    url = make_url(db_url)
+    if url.get_backend_name() == "postgresql":
+        options = dict(pool_recycle=POOL_RECYCLE_SECONDS, pool_pre_ping=True)
+        if "poolclass" not in kwargs: # sizing only applies to the default QueuePool
+            options.update(pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT_SECONDS)
+        if url.get_driver_name() in ("psycopg2", "psycopg"):
+            options["connect_args"] = dict(KEEPALIVE_ARGS)
+    options.update(kwargs)
+    return create_engine(db_url, **options)
+
+def dialect_insert(bind, table):
+    """INSERT construct with ON CONFLICT support for the bind's dialect (Postgres or local SQLite)"""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
 
 def create_tables(engine):
-    # WARNING: Dropping all tables to handle schema changes during dev
-    # Base.metadata.drop_all(engine) # Uncomment if you want to force reset
-    pass # Managed manually or via drop_all in init_db
+    """
+    Schema changes are applied by `python collector/init_db.py` (shared/migrations.py),
+    never on startup. This only warns when the database is behind the code.
+    """
+    import logging
+    from shared.migrations import pending_migrations
+    try:
+        pending = pending_migrations(engine)
+    except Exception as e:
+        logging.warning(f"Could not check schema version: {e}")
+        return
+    if pending:
+        logging.warning(f"Database schema is {len(pending)} migration(s) behind "
+                        f"({', '.join(name for _, name, _ in pending)}). Run: python collector/init_db.py")
@@ -0,0 +1,563 @@
+"""
+Versioned schema migrations.
+
+Each migration is an ordered, idempotent step. `upgrade()` applies every step
+newer than the highest version recorded in `schema_version`, one at a time,
+recording each as it completes. A step that fails halfway can simply be re-run.
+Steps check the live schema before changing anything, so a database that
+`create_all()` already brought up to date just gets its versions recorded.
+
+Large tables are never rebuilt with one long-locking statement:
+- new columns are nullable without a default, so adding them doesn't rewrite the
+  table (add_missing_columns)
+- indexes are created CONCURRENTLY on Postgres (create_missing_indexes)
+- table rewrites copy rows into a shadow table in small batches, then swap it in
+  under a brief lock (rebuild_table)
+
+Once released, a step is frozen: it spells out its own SQL (and, where SQL won't
+do, its own logic) instead of calling rebuild code that keeps evolving, so a
+database migrated today ends up where one migrated at release time did. A change
+of behaviour is a new step.
+
+Run with `python collector/init_db.py`. Works against Postgres and the local SQLite fallback.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import (MetaData, Table, Column, Integer, BigInteger, String, Float, DateTime, inspect, select, text,
+                        func, bindparam)
+from sqlalchemy.schema import CreateIndex
+
+from shared.db_models import (Base, EA, Trade, AccountSnapshot, OpenPosition, DailyPnl, RoundTrip, PositionLeg, EquityBar,
+                              RiskState, SchemaVersion, dialect_insert)
+from shared import partitions
+
+# Arbitrary key for pg_advisory_lock, so two init_db runs can't migrate at once
+MIGRATION_LOCK_ID = 727001
+
+# Rows copied per transaction by rebuild_table
+REBUILD_BATCH_SIZE = 5000
+
+# --- Helpers for writing steps ---
+
+def add_missing_columns(engine, table):
+    """
+    ALTER TABLE ... ADD COLUMN for every column of the model that `table` is missing.
+    Only for nullable columns without a server default (no table rewrite). Returns
+    the names of the columns added.
+    """
+    live_cols = {col["name"] for col in inspect(engine).get_columns(table.name)}
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in live_cols:
+                continue
+            col_type = column.type.compile(dialect=engine.dialect)
+            logging.info(f"Adding column {table.name}.{column.name}...")
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'))
+            added.append(column.name)
+    return added
+
+def create_missing_indexes(engine, tables=None, names=None):
+    """
+    Create any index declared in shared/db_models.py (or only those in `names`)
+    that the database is missing. create_all() only builds indexes together with
+    new tables, so existing tables need this. Returns the names of the indexes created.
+
+    On Postgres indexes are built CONCURRENTLY so the collector can keep writing
+    while they build (except on partitioned tables, which don't support it). An
+    invalid index left by an interrupted build is dropped and rebuilt.
+    """
+    is_pg = engine.dialect.name == "postgresql"
+    tables = tables or Base.metadata.sorted_tables
+    created = []
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        inspector = inspect(conn)
+        for table in tables:
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                if names is not None and index.name not in names:
+                    continue
+                if not is_pg and index.name in existing:
+                    continue
+                if is_pg:
+                    valid = conn.execute(text(
+                        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                        "WHERE c.relname = :name"), {"name": index.name}).scalar()
+                    if valid:
+                        continue
+                    if valid is False:
+                        logging.warning(f"Dropping invalid index {index.name} (interrupted build)...")
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+                if is_pg and not partitions.is_partitioned(conn, table.name):
+                    # CREATE [UNIQUE] INDEX
+                    ddl = ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+                logging.info(f"Creating index {index.name}...")
+                conn.execute(text(ddl))
+                created.append(index.name)
+    return created
+
+def _create_partitioned_shadow(engine, table, shadow_name, column):
+    """
+    Shadow of the live table, range partitioned by month on `column` (Postgres):
+    primary key + `column`, month partitions from the oldest row to
+    PARTITION_MONTHS_AHEAD months from now, a default partition, and the model's
+    indexes under temporary names (cheap while the shadow is empty).
+    """
+    name = table.name
+    pk = [col.name for col in table.primary_key.columns] + [column]
+    index_ddl = [str(CreateIndex(index).compile(dialect=engine.dialect))
+                 .replace(f"INDEX {index.name} ON {name} ", f'INDEX "{index.name}__rebuild" ON "{shadow_name}" ', 1)
+                 for index in table.indexes]
+    with engine.begin() as conn:
+        oldest = conn.execute(text(f'SELECT MIN("{column}") FROM "{name}"')).scalar()
+        now = datetime.utcnow()
+        last = partitions.month_start(now)
+        for _ in range(partitions.PARTITION_MONTHS_AHEAD):
+            last = partitions.next_month(last)
+        conn.execute(text(
+            f'CREATE TABLE "{shadow_name}" (LIKE "{name}" INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")'))
+        conn.execute(text(f'ALTER TABLE "{shadow_name}" ADD PRIMARY KEY ({", ".join(pk)})'))
+        for month in partitions.months_between(oldest or now, last):
+            conn.execute(text(
+                f'CREATE TABLE "{partitions.partition_name(shadow_name, month)}" PARTITION OF "{shadow_name}" '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{partitions.next_month(month):%Y-%m-%d}')"))
+        conn.execute(text(f'CREATE TABLE "{shadow_name}_default" PARTITION OF "{shadow_name}" DEFAULT'))
+        for ddl in index_ddl:
+            conn.execute(text(ddl))
+
+def _swap_partitioned_names(conn, table, shadow_name):
+    """After the swap: give the partitions, indexes and primary key of the shadow the live names"""
+    name = table.name
+    prefix = f"{shadow_name}_"
+    children = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name"), {"name": name}).scalars().all()
+    for child in children:
+        if child.startswith(prefix):
+            conn.execute(text(f'ALTER TABLE "{child}" RENAME TO "{name}_{child[len(prefix):]}"'))
+    # Postgres named the partitions' own indexes (and primary keys) after the shadow too
+    child_indexes = conn.execute(text(
+        "SELECT ic.relname FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhparent "
+        "JOIN pg_index x ON x.indrelid = i.inhrelid JOIN pg_class ic ON ic.oid = x.indexrelid "
+        "WHERE p.relname = :name"), {"name": name}).scalars().all()
+    for index in child_indexes:
+        if index.startswith(prefix):
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{name}_{index[len(prefix):]}"'))
+    for index in table.indexes:
+        conn.execute(text(f'ALTER INDEX "{index.name}__rebuild" RENAME TO "{index.name}"'))
+    conn.execute(text(f'ALTER TABLE "{name}" RENAME CONSTRAINT "{shadow_name}_pkey" TO "{name}_pkey"'))
+
+def rebuild_table(engine, table, source_sql=None, batch_size=REBUILD_BATCH_SIZE, recopy_all=False, partition_by=None):
+    """
+    Rewrite `table` to match its model definition (e.g. a new primary key) without
+    holding a long lock:
+
+    1. create an empty shadow table `<name>__rebuild` from the model (no secondary indexes)
+    2. copy rows in primary-key order, `batch_size` per transaction
+    3. in one short transaction: block writes (Postgres), copy rows added since
+       step 2, swap the tables and drop the old one
+    4. build the secondary indexes (CONCURRENTLY on Postgres)
+
+    `source_sql` is a SELECT producing the model's columns (defaults to the columns
+    both tables share). Step 3 only catches up rows whose key sorts after the last
+    copied one; pass `recopy_all=True` for small tables without a monotonic key.
+
+    `partition_by` (Postgres only) makes the new table range partitioned by month
+    on that column (see shared/partitions.py). Its indexes are then built on the
+    shadow before the swap, and a serial key keeps its sequence.
+    """
+    name = table.name
+    shadow_name = f"{name}__rebuild"
+    is_pg = engine.dialect.name == "postgresql"
+    partitioned = is_pg and partition_by is not None
+
+    shadow = table.to_metadata(MetaData(), name=shadow_name)
+    for index in list(shadow.indexes):
+        shadow.indexes.discard(index)
+    key_cols = [shadow.c[col.name] for col in table.primary_key.columns]
+
+    if source_sql is None:
+        live_cols = {col["name"] for col in inspect(engine).get_columns(name)}
+        cols = [col.name for col in table.columns if col.name in live_cols]
+        source_sql = f"SELECT {', '.join(cols)} FROM {name}"
+    else:
+        cols = [col.name for col in table.columns]
+    # Keyset pagination over the source query; row-value comparison works on Postgres and SQLite.
+    # Typed result columns so e.g. SQLite datetimes come back as datetime objects.
+    key_list = ", ".join(col.name for col in key_cols)
+    params = ", ".join(f":k{i}" for i in range(len(key_cols)))
+    select_list = f"SELECT {', '.join(cols)} FROM ({source_sql}) src"
+    result_cols = [shadow.c[c] for c in cols]
+    page_sql = text(f"{select_list} ORDER BY {key_list} LIMIT :limit").columns(*result_cols)
+    next_page_sql = text(f"{select_list} WHERE ({key_list}) > ({params}) ORDER BY {key_list} LIMIT :limit").columns(*result_cols)
+
+    def fetch_page(conn, last, limit):
+        if last is None:
+            rows = conn.execute(page_sql, {"limit": limit})
+        else:
+            rows = conn.execute(next_page_sql, {"limit": limit, **{f"k{i}": v for i, v in enumerate(last)}})
+        return [dict(row._mapping) for row in rows]
+
+    def copy_rows(conn, rows):
+        stmt = dialect_insert(conn, shadow).on_conflict_do_nothing()
+        conn.execute(stmt, [{c: row.get(c) for c in cols} for row in rows])
+
+    # 1. Fresh shadow table (drop leftovers from an interrupted rebuild)
+    shadow.drop(engine, checkfirst=True)
+    if partitioned:
+        _create_partitioned_shadow(engine, table, shadow_name, partition_by)
+    else:
+        shadow.create(engine)
+
+    # 2. Batched copy
+    copied, last = 0, None
+    while True:
+        with engine.begin() as conn:
+            rows = fetch_page(conn, last, batch_size)
+            if not rows:
+                break
+            copy_rows(conn, rows)
+        copied += len(rows)
+        last = tuple(rows[-1][col.name] for col in key_cols)
+        logging.info(f"Rebuilding {name}: {copied} rows copied...")
+
+    # 3. Catch up and swap
+    with engine.begin() as conn:
+        if is_pg:
+            # Readers keep working; writers wait for the (short) swap
+            conn.execute(text(f'LOCK TABLE "{name}" IN EXCLUSIVE MODE'))
+        catch_up = None if recopy_all else last
+        while True:
+            rows = fetch_page(conn, catch_up, batch_size)
+            if not rows:
+                break
+            copy_rows(conn, rows)
+            catch_up = tuple(rows[-1][col.name] for col in key_cols)
+        if partitioned:
+            # The shadow's key default still draws from the live table's sequence; keep it past the drop
+            for col in key_cols:
+                seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": name, "c": col.name}).scalar()
+                if seq:
+                    conn.execute(text(f'ALTER SEQUENCE {seq} OWNED BY "{shadow_name}"."{col.name}"'))
+        elif is_pg and len(key_cols) == 1 and isinstance(key_cols[0].type, Integer):
+            # A serial key gets a new sequence with the shadow table; move it past the copied ids
+            # (setval is a no-op when the column has no sequence)
+            col = key_cols[0].name
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{shadow_name}', '{col}'), "
+                f"COALESCE((SELECT MAX({col}) FROM {shadow_name}), 0) + 1, false)"))
+        conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{name}__old"'))
+        conn.execute(text(f'ALTER TABLE "{shadow_name}" RENAME TO "{name}"'))
+        conn.execute(text(f'DROP TABLE "{name}__old"'))
+        if partitioned:
+            _swap_partitioned_names(conn, table, shadow_name)
+    logging.info(f"Rebuilt {name}: {copied} rows copied, tables swapped.")
+
+    # 4. Secondary indexes
+    create_missing_indexes(engine, [table])
+
+# --- Migration steps (append only; never renumber) ---
+
+# The tables as they stood when migrations were introduced. Step 1 creates these and
+# nothing else; every later table, column and index is added by its own step.
+_BASELINE = MetaData()
+Table("eas", _BASELINE,
+      Column("magic_number", BigInteger, primary_key=True), Column("account_id", BigInteger, primary_key=True),
+      Column("name", String, nullable=False), Column("description", String), Column("created_at", DateTime))
+Table("app_config", _BASELINE,
+      Column("key", String, primary_key=True), Column("value", String), Column("updated_at", DateTime))
+Table("trades", _BASELINE,
+      Column("ticket", BigInteger, primary_key=True), Column("account_id", BigInteger, index=True),
+      Column("magic_number", BigInteger, index=True), Column("symbol", String, index=True), Column("type", String),
+      Column("volume", Float), Column("open_price", Float), Column("close_price", Float),
+      Column("open_time", DateTime), Column("close_time", DateTime, index=True), Column("profit", Float),
+      Column("commission", Float), Column("swap", Float), Column("comment", String))
+Table("account_snapshots", _BASELINE,
+      Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+      Column("account_id", BigInteger, index=True), Column("timestamp", DateTime, index=True),
+      Column("balance", Float), Column("equity", Float), Column("margin", Float), Column("free_margin", Float),
+      Column("margin_level", Float), Column("open_pnl", Float), Column("extra_data", String))
+Table("account_aliases", _BASELINE,
+      Column("account_id", String, primary_key=True), Column("alias", String), Column("updated_at", DateTime))
+Table("open_positions", _BASELINE,
+      Column("ticket", BigInteger, primary_key=True), Column("account_id", BigInteger, index=True),
+      Column("symbol", String), Column("magic_number", BigInteger), Column("type", String), Column("volume", Float),
+      Column("open_price", Float), Column("current_price", Float), Column("sl", Float), Column("tp", Float),
+      Column("profit", Float), Column("swap", Float), Column("comment", String), Column("updated_at", DateTime))
+
+def _baseline(engine):
+    """The baseline tables that don't exist yet"""
+    _BASELINE.create_all(engine)
+
+def _eas_composite_key(engine):
+    """
+    `eas` used to be keyed by magic_number alone. Rebuild it with the
+    (magic_number, account_id) key, taking the account from the trades of each EA.
+    """
+    pk = inspect(engine).get_pk_constraint(EA.__tablename__)["constrained_columns"]
+    if sorted(pk) == ["account_id", "magic_number"]:
+        return
+    cols = {col["name"] for col in inspect(engine).get_columns(EA.__tablename__)}
+    account = "t.account_id" if "account_id" not in cols else "COALESCE(e.account_id, t.account_id)"
+    # EAs never seen in trades have no account to attach to; the collector re-discovers them
+    source_sql = f"""
+        SELECT DISTINCT e.magic_number, {account} AS account_id, e.name, e.description, e.created_at
+        FROM eas e LEFT JOIN trades t ON t.magic_number = e.magic_number
+        WHERE {account} IS NOT NULL
+    """
+    rebuild_table(engine, EA.__table__, source_sql, recopy_all=True)
+
+# The model's indexes when step 3 was released (later ones need columns added by later steps;
+# ix_account_snapshots_account_timestamp has since been replaced by step 9)
+_V3_INDEXES = {
+    "ix_trades_account_close_time", "ix_trades_account_magic", "ix_trades_account_id", "ix_trades_magic_number",
+    "ix_trades_symbol", "ix_trades_close_time", "ix_account_snapshots_account_timestamp",
+    "ix_account_snapshots_account_id", "ix_account_snapshots_timestamp", "ix_open_positions_account_id",
+}
+
+def _composite_indexes(engine):
+    """trades(account_id, close_time), trades(account_id, magic_number), account_snapshots(account_id, timestamp DESC)"""
+    create_missing_indexes(engine, [Trade.__table__, AccountSnapshot.__table__, OpenPosition.__table__], names=_V3_INDEXES)
+
+# daily_pnl as released with step 4: every deal but BALANCE counts as a trade
+_DAILY_PNL_V4_SQL = """
+    INSERT INTO daily_pnl (account_id, magic_number, symbol, day, net_profit, gross_profit, gross_loss,
+                           trades, wins, losses, volume, deposits)
+    SELECT account_id, magic_number, symbol, day,
+           SUM(CASE WHEN is_trade THEN net ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net > 0 THEN net ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net < 0 THEN net ELSE 0 END),
+           SUM(CASE WHEN is_trade THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net > 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net < 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_trade THEN volume ELSE 0 END),
+           SUM(CASE WHEN is_trade THEN 0 ELSE profit END)
+    FROM (SELECT account_id, COALESCE(magic_number, 0) AS magic_number, COALESCE(symbol, '') AS symbol,
+                 date(close_time) AS day, COALESCE(type, '') <> 'BALANCE' AS is_trade,
+                 COALESCE(profit, 0) + COALESCE(commission, 0) + COALESCE(swap, 0) AS net,
+                 COALESCE(volume, 0) AS volume, COALESCE(profit, 0) AS profit
+          FROM trades WHERE close_time IS NOT NULL) d
+    GROUP BY account_id, magic_number, symbol, day
+"""
+
+def _daily_pnl(engine):
+    """daily_pnl rollup table, filled from the existing trades"""
+    DailyPnl.__table__.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("LOCK TABLE daily_pnl IN SHARE ROW EXCLUSIVE MODE"))
+        conn.execute(text("DELETE FROM daily_pnl"))
+        rows = conn.execute(text(_DAILY_PNL_V4_SQL)).rowcount
+    logging.info(f"daily_pnl rebuilt: {rows} rows.")
+
+def _round_trips(engine):
+    """
+    trades.position_id/entry and the round_trips and position_legs tables. The
+    deals stored so far have no position yet, so there is nothing to match: new
+    deals are matched by the collector, older ones after
+    `python collector/rebuild_round_trips.py --backfill`.
+    """
+    add_missing_columns(engine, Trade.__table__)
+    for model in (RoundTrip, PositionLeg):
+        model.__table__.create(engine, checkfirst=True)
+    create_missing_indexes(engine, [Trade.__table__, RoundTrip.__table__])
+
+def _partitions(engine):
+    """
+    Monthly range partitions for trades and account_snapshots (Postgres; see
+    shared/partitions.py), and the equity_bars table
+    """
+    EquityBar.__table__.create(engine, checkfirst=True)
+    if engine.dialect.name != "postgresql":
+        return
+    for table in (Trade.__table__, AccountSnapshot.__table__):
+        with engine.connect() as conn:
+            if partitions.is_partitioned(conn, table.name):
+                continue
+        rebuild_table(engine, table, partition_by=partitions.PARTITIONED[table.name])
+
+_RISK_STATE_V7_FIELDS = ("account_id", "magic_number", "last_close_time", "last_ticket", "trades", "wins", "losses",
+                         "net_profit", "gross_profit", "gross_loss", "peak", "peak_time", "max_drawdown",
+                         "max_drawdown_seconds", "win_streak", "loss_streak", "max_win_streak", "max_loss_streak",
+                         "mean", "m2", "downside_sq")
+
+def _fold_risk_v7(state, deal):
+    """One deal into a risk_state row, as released with step 7 (exits count as trades)"""
+    net = (deal.profit or 0.0) + (deal.commission or 0.0) + (deal.swap or 0.0)
+    previous = state["net_profit"]
+    cum = state["net_profit"] = previous + net
+    state["last_close_time"], state["last_ticket"] = deal.close_time, deal.ticket
+    if net > 0:
+        state["gross_profit"] += net
+    elif net < 0:
+        state["gross_loss"] += net
+    if state["peak"] is None or cum >= state["peak"]:
+        if state["peak"] is not None and previous < state["peak"]:
+            under = (deal.close_time - state["peak_time"]).total_seconds()
+            state["max_drawdown_seconds"] = max(state["max_drawdown_seconds"], under)
+        state["peak"], state["peak_time"] = cum, deal.close_time
+    else:
+        state["max_drawdown"] = min(state["max_drawdown"], cum - state["peak"])
+        under = (deal.close_time - state["peak_time"]).total_seconds()
+        state["max_drawdown_seconds"] = max(state["max_drawdown_seconds"], under)
+
+    if deal.entry == "IN":
+        return
+    state["trades"] += 1
+    delta = net - state["mean"]
+    state["mean"] += delta / state["trades"]
+    state["m2"] += delta * (net - state["mean"])
+    if net > 0:
+        state["wins"] += 1
+        state["win_streak"], state["loss_streak"] = state["win_streak"] + 1, 0
+        state["max_win_streak"] = max(state["max_win_streak"], state["win_streak"])
+    elif net < 0:
+        state["losses"] += 1
+        state["downside_sq"] += net * net
+        state["win_streak"], state["loss_streak"] = 0, state["loss_streak"] + 1
+        state["max_loss_streak"] = max(state["max_loss_streak"], state["loss_streak"])
+
+def _risk_state(engine):
+    """risk_state table (see shared/risk_state.py), filled by replaying the stored deals"""
+    RiskState.__table__.create(engine, checkfirst=True)
+    deals_sql = text("""
+        SELECT account_id, COALESCE(magic_number, 0) AS magic_number, ticket, entry, profit, commission, swap,
+               close_time
+        FROM trades WHERE close_time IS NOT NULL AND COALESCE(type, '') <> 'BALANCE'
+        ORDER BY close_time, ticket
+    """).columns(close_time=Trade.close_time.type)
+    states = {}
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("LOCK TABLE risk_state IN SHARE ROW EXCLUSIVE MODE"))
+        conn.execute(text("DELETE FROM risk_state"))
+        deals = conn.execute(deals_sql, execution_options={"stream_results": True, "yield_per": REBUILD_BATCH_SIZE})
+        for deal in deals:
+            for key in ((deal.account_id, -1), (deal.account_id, deal.magic_number)):
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = dict.fromkeys(_RISK_STATE_V7_FIELDS, 0)
+                    state.update(account_id=key[0], magic_number=key[1], net_profit=0.0, gross_profit=0.0,
+                                 gross_loss=0.0, peak=None, peak_time=None, max_drawdown=0.0,
+                                 max_drawdown_seconds=0.0, mean=0.0, m2=0.0, downside_sq=0.0)
+                _fold_risk_v7(state, deal)
+        insert = text(f"INSERT INTO risk_state ({', '.join(_RISK_STATE_V7_FIELDS)}) "
+                      f"VALUES ({', '.join(':' + f for f in _RISK_STATE_V7_FIELDS)})").bindparams(
+            bindparam("last_close_time", type_=DateTime), bindparam("peak_time", type_=DateTime))
+        rows = list(states.values())
+        for i in range(0, len(rows), REBUILD_BATCH_SIZE):
+            conn.execute(insert, rows[i:i + REBUILD_BATCH_SIZE])
+    logging.info(f"risk_state rebuilt: {len(states)} states.")
+
+# daily_pnl since step 8: only exits count as trades (an IN deal's net still moves net_profit)
+_DAILY_PNL_V8_SQL = """
+    INSERT INTO daily_pnl (account_id, magic_number, symbol, day, net_profit, gross_profit, gross_loss,
+                           trades, wins, losses, volume, deposits)
+    SELECT account_id, magic_number, symbol, day,
+           SUM(CASE WHEN is_trade THEN net ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net > 0 THEN net ELSE 0 END),
+           SUM(CASE WHEN is_trade AND net < 0 THEN net ELSE 0 END),
+           SUM(CASE WHEN is_exit THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_exit AND net > 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_exit AND net < 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_trade THEN volume ELSE 0 END),
+           SUM(CASE WHEN is_trade THEN 0 ELSE profit END)
+    FROM (SELECT account_id, COALESCE(magic_number, 0) AS magic_number, COALESCE(symbol, '') AS symbol,
+                 date(close_time) AS day, COALESCE(type, '') <> 'BALANCE' AS is_trade,
+                 COALESCE(type, '') <> 'BALANCE' AND COALESCE(entry, '') <> 'IN' AS is_exit,
+                 COALESCE(profit, 0) + COALESCE(commission, 0) + COALESCE(swap, 0) AS net,
+                 COALESCE(volume, 0) AS volume, COALESCE(profit, 0) AS profit
+          FROM trades WHERE close_time IS NOT NULL) d
+    GROUP BY account_id, magic_number, symbol, day
+"""
+
+def _daily_pnl_exits(engine):
+    """
+    trades.entry (if step 5 hasn't added it), then daily_pnl refilled so that IN
+    deals stop counting as trades
+    """
+    live_cols = {col["name"] for col in inspect(engine).get_columns("trades")}
+    with engine.begin() as conn:
+        for name, col_type in (("position_id", "BIGINT"), ("entry", "VARCHAR")):
+            if name not in live_cols:
+                logging.info(f"Adding column trades.{name}...")
+                conn.execute(text(f'ALTER TABLE "trades" ADD COLUMN "{name}" {col_type}'))
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("LOCK TABLE daily_pnl IN SHARE ROW EXCLUSIVE MODE"))
+        conn.execute(text("DELETE FROM daily_pnl"))
+        rows = conn.execute(text(_DAILY_PNL_V8_SQL)).rowcount
+    logging.info(f"daily_pnl rebuilt: {rows} rows.")
+
+def _unique_snapshots(engine):
+    """
+    account_snapshots unique on (account_id, timestamp), replacing the plain index of
+    step 3, so a snapshot batch written twice (outbox replay) is skipped. Duplicates
+    already stored are dropped first, keeping the oldest row.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            DELETE FROM account_snapshots WHERE EXISTS (
+                SELECT 1 FROM account_snapshots d
+                WHERE d.account_id = account_snapshots.account_id AND d.timestamp = account_snapshots.timestamp
+                  AND d.id < account_snapshots.id)
+        """)).rowcount
+    logging.info(f"account_snapshots: {rows} duplicate rows dropped.")
+    create_missing_indexes(engine, [AccountSnapshot.__table__], names={"ux_account_snapshots_account_timestamp"})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        concurrently = ("CONCURRENTLY " if engine.dialect.name == "postgresql"
+                        and not partitions.is_partitioned(conn, "account_snapshots") else "")
+        conn.execute(text(f'DROP INDEX {concurrently}IF EXISTS "ix_account_snapshots_account_timestamp"'))
+
+# (version, name, step)
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "eas composite primary key", _eas_composite_key),
+    (3, "composite indexes for hot queries", _composite_indexes),
+    (4, "daily_pnl rollup", _daily_pnl),
+    (5, "round trips", _round_trips),
+    (6, "monthly partitions and equity bars", _partitions),
+    (7, "risk state", _risk_state),
+    (8, "daily_pnl counts exits only", _daily_pnl_exits),
+    (9, "unique account snapshots", _unique_snapshots),
+]
+
+# --- Runner ---
+
+def get_schema_version(conn):
+    """Highest applied migration version (0 for a database that was never migrated)"""
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+def pending_migrations(engine):
+    with engine.connect() as conn:
+        current = get_schema_version(conn)
+    return [m for m in MIGRATIONS if m[0] > current]
+
+def upgrade(engine, target=None):
+    """Apply pending migrations in order (up to `target`). Returns the versions applied."""
+    applied = []
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        lock_conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+    try:
+        SchemaVersion.__table__.create(engine, checkfirst=True)
+        for version, name, step in pending_migrations(engine):
+            if target is not None and version > target:
+                break
+            logging.info(f"Applying migration {version}: {name}...")
+            step(engine)
+            with engine.begin() as conn:
+                conn.execute(SchemaVersion.__table__.insert(),
+                             {"version": version, "name": name, "applied_at": datetime.utcnow()})
+            applied.append(version)
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            lock_conn.close()
+    return applied
@@ -0,0 +1,228 @@
+"""
+Local Parquet mirror of `trades` and `account_snapshots`.
+
+Layout (hive partitioning, one directory per account and month):
+
+    <root>/trades/account_id=<id>/month=<YYYY-MM>/part-<first ticket>.parquet
+    <root>/account_snapshots/account_id=<id>/month=<YYYY-MM>/part-<first id>.parquet
+
+`sync()` appends the rows written since the last sync. The watermark of each account
+is read back from its newest partition, so there is no state file that could
+disagree with the data. A run that dies halfway leaves fully written files
+only (temp file + rename), and the next run continues from what is there.
+Partitions that have collected many small files are merged by `compact()`.
+
+Rows changed in place in the database (e.g. position_id/entry filled in by
+`rebuild_round_trips.py --backfill`) never reach an append-only mirror:
+`invalidate()` drops an account's partitions from a month on, and the next sync
+fetches them again.
+
+Readers (`read()`) prune partitions by account and month before opening any file
+and only decode the requested columns.
+
+Needs pyarrow (`pip install pyarrow`); `available()` is False without it.
+"""
+import os
+import glob
+import shutil
+import logging
+
+import pandas as pd
+from sqlalchemy import select, or_, tuple_, BigInteger, Integer, Float, String, DateTime
+
+from shared.db_models import Trade, AccountSnapshot
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# table -> (model, time column, key column); rows are mirrored in (time, key) order
+TABLES = {
+    "trades": (Trade, "close_time", "ticket"),
+    "account_snapshots": (AccountSnapshot, "timestamp", "id"),
+}
+
+SYNC_BATCH_SIZE = 100_000 # rows fetched (and written) per round trip
+MAX_FILES_PER_PARTITION = 16 # compact() merges partitions with more files than this
+
+def available():
+    return pa is not None
+
+def get_mirror_dir():
+    """Mirror root from PARQUET_MIRROR_DIR (None when the mirror is not configured)"""
+    return os.getenv("PARQUET_MIRROR_DIR") or None
+
+def _arrow_schema(model):
+    types = {BigInteger: pa.int64(), Integer: pa.int64(), Float: pa.float64(), String: pa.string(),
+             DateTime: pa.timestamp("us")}
+    fields = []
+    for column in model.__table__.columns:
+        arrow_type = next((t for sql_type, t in types.items() if isinstance(column.type, sql_type)), pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def _partition_dir(root, table, account_id, month):
+    return os.path.join(root, table, f"account_id={account_id}", f"month={month}")
+
+def _part_files(partition_dir):
+    return sorted(glob.glob(os.path.join(partition_dir, "part-*.parquet")))
+
+def _write_atomic(arrow_table, path):
+    tmp = path + ".tmp"
+    pq.write_table(arrow_table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+# --- Watermarks ---
+
+def get_watermarks(root, table):
+    """{account_id: (time, key)} of the newest row mirrored per account"""
+    _, time_col, key_col = TABLES[table]
+    watermarks = {}
+    for account_dir in glob.glob(os.path.join(root, table, "account_id=*")):
+        months = sorted(glob.glob(os.path.join(account_dir, "month=*")))
+        files = _part_files(months[-1]) if months else []
+        if not files:
+            continue
+        df = pq.ParquetDataset(files, partitioning=None).read(columns=[time_col, key_col]).to_pandas()
+        newest = df.sort_values([time_col, key_col]).iloc[-1]
+        account_id = int(os.path.basename(account_dir).split("=", 1)[1])
+        watermarks[account_id] = (newest[time_col].to_pydatetime(), int(newest[key_col]))
+    return watermarks
+
+# --- Sync ---
+
+def write_partitions(root, table, df):
+    """
+    Write rows (all columns of `table`, in (time, key) order) as one new file per
+    (account, month) they touch. Returns the number of rows written.
+    """
+    model, time_col, key_col = TABLES[table]
+    schema = _arrow_schema(model)
+    # Columns added by later migrations are NULL in frames that predate them
+    missing = [name for name in schema.names if name not in df.columns]
+    df = df.assign(**dict.fromkeys(missing), **{time_col: pd.to_datetime(df[time_col])})
+    months = df[time_col].dt.strftime("%Y-%m")
+    # Months in order per account, so an interrupted run never leaves a gap behind a watermark
+    for (account_id, month), part in df.groupby([df["account_id"], months], sort=True):
+        directory = _partition_dir(root, table, int(account_id), month)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(part[key_col].iloc[0]):020d}.parquet")
+        _write_atomic(pa.Table.from_pandas(part, schema=schema, preserve_index=False), path)
+    return len(df)
+
+def sync(engine, root, tables=tuple(TABLES), batch_size=SYNC_BATCH_SIZE):
+    """Append rows written since the last sync. Returns {table: rows written}."""
+    if not available():
+        raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+    written = {}
+    for table in tables:
+        model, time_col, key_col = TABLES[table]
+        cols = model.__table__.c
+        watermarks = get_watermarks(root, table)
+
+        # 1. Everything past each account's watermark (all rows of accounts without one)
+        query = select(model.__table__).where(cols[time_col].is_not(None))
+        if watermarks:
+            query = query.where(or_(
+                cols.account_id.not_in(list(watermarks)),
+                *[(cols.account_id == account_id) & (tuple_(cols[time_col], cols[key_col]) > tuple_(t, k))
+                  for account_id, (t, k) in watermarks.items()],
+            ))
+        query = query.order_by(cols[time_col], cols[key_col])
+
+        # 2. Stream it in batches, one file per (account, month) touched by a batch
+        written[table] = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for rows in result.partitions(batch_size):
+                written[table] += write_partitions(root, table, pd.DataFrame(rows, columns=list(result.keys())))
+        logger.info(f"Mirror: {written[table]} new row(s) in {table}")
+    return written
+
+def compact(root, tables=tuple(TABLES), max_files=MAX_FILES_PER_PARTITION):
+    """
+    Merge partitions holding more than `max_files` files into one file. The merged
+    file is staged as `merged.pending` before the old parts are removed; a pending
+    file left by an interrupted run is finished first. Returns partitions merged.
+    """
+    merged = 0
+    for table in tables:
+        _, time_col, key_col = TABLES[table]
+        for directory in glob.glob(os.path.join(root, table, "account_id=*", "month=*")):
+            pending = os.path.join(directory, "merged.pending")
+            files = _part_files(directory)
+            if not os.path.exists(pending):
+                if len(files) <= max_files:
+                    continue
+                data = pq.ParquetDataset(files, partitioning=None).read().sort_by([(time_col, "ascending"), (key_col, "ascending")])
+                _write_atomic(data, pending)
+            # The pending file holds every row of the partition: drop the parts, then publish it
+            first_key = pq.read_table(pending, columns=[key_col]).column(key_col)[0].as_py()
+            for path in files:
+                os.remove(path)
+            os.replace(pending, os.path.join(directory, f"part-{int(first_key):020d}.parquet"))
+            merged += 1
+    return merged
+
+def invalidate(root, table, account_id, since=None):
+    """
+    Remove the partitions of `account_id` from the month of `since` on (all of them
+    without it), newest first, so an interrupted run still leaves a watermark that
+    resyncs everything after it. Returns partitions removed.
+    """
+    since_month = since.strftime("%Y-%m") if since is not None else None
+    account_dir = os.path.join(root, table, f"account_id={int(account_id)}")
+    removed = 0
+    for month_dir in sorted(glob.glob(os.path.join(account_dir, "month=*")), reverse=True):
+        if since_month and os.path.basename(month_dir).split("=", 1)[1] < since_month:
+            break
+        shutil.rmtree(month_dir)
+        removed += 1
+    return removed
+
+# --- Read ---
+
+def partition_files(root, table, accounts=None, start=None, end=None):
+    """Files of the partitions that can hold rows of `accounts` between `start` and `end`"""
+    start_month = start.strftime("%Y-%m") if start is not None else None
+    end_month = end.strftime("%Y-%m") if end is not None else None
+    wanted = None if accounts is None else {int(a) for a in accounts}
+
+    files = []
+    for account_dir in sorted(glob.glob(os.path.join(root, table, "account_id=*"))):
+        account_id = int(os.path.basename(account_dir).split("=", 1)[1])
+        if wanted is not None and account_id not in wanted:
+            continue
+        for month_dir in sorted(glob.glob(os.path.join(account_dir, "month=*"))):
+            month = os.path.basename(month_dir).split("=", 1)[1]
+            if (start_month and month < start_month) or (end_month and month > end_month):
+                continue
+            files.extend(_part_files(month_dir))
+    return files
+
+def read(root, table, columns=None, accounts=None, start=None, end=None):
+    """
+    Mirrored rows as a DataFrame. Partitions are pruned by `accounts` and by the
+    months of [start, end) before any file is opened; only `columns` are decoded.
+    """
+    if not available():
+        raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+    model, time_col, _ = TABLES[table]
+    files = partition_files(root, table, accounts, start, end)
+
+    schema = _arrow_schema(model)
+    names = list(columns) if columns else schema.names
+    if not files:
+        return schema.empty_table().select(names).to_pandas()
+
+    filters = []
+    if start is not None:
+        filters.append((time_col, ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append((time_col, "<", pd.Timestamp(end)))
+    data = pq.ParquetDataset(files, schema=schema, partitioning=None, filters=filters or None).read(columns=names)
+    return data.to_pandas()
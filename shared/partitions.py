@@ -0,0 +1,151 @@
+"""
+Monthly range partitioning of `trades` and `account_snapshots` (Postgres only).
+
+Migration 6 rebuilds both tables as `PARTITION BY RANGE` on their time column, one
+partition per calendar month (`trades_2024_01`, ...) plus a `<table>_default`
+partition that catches rows no month partition covers yet, so an insert never
+fails for lack of a partition. The primary keys gain the time column (Postgres
+requires it); the models keep their single-column keys, which is what SQLite
+uses and what the ORM needs. Time-bounded queries only scan the months they
+cover, and old snapshot months are dropped whole by shared/retention.py.
+
+Month partitions are created
+- ahead of time (current month + PARTITION_MONTHS_AHEAD) by the migration and
+  the retention job, and
+- on demand by the collector for deal batches from older months (backfills),
+  through `partition_registry`.
+Creating a month moves any rows the default partition holds for it. SQLite and
+unpartitioned tables make every function here a no-op.
+"""
+import re
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import text
+
+# table -> partition key column
+PARTITIONED = {"trades": "close_time", "account_snapshots": "timestamp"}
+# Months created past the current one
+PARTITION_MONTHS_AHEAD = 3
+# Arbitrary key for pg_advisory_xact_lock, so two processes can't create the same month at once
+PARTITION_LOCK_ID = 727002
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def months_between(start, end):
+    """Month starts from the month of `start` to the month of `end`, inclusive"""
+    month, last = month_start(start), month_start(end)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+def is_partitioned(conn, table):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name"
+    ), {"name": table}).scalar() is not None
+
+def list_partitions(conn, table):
+    """{month start: partition name} of the month partitions attached to `table`"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name"
+    ), {"name": table}).scalars()
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+    months = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            months[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+def create_default_partition(conn, table):
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+def create_partitions(conn, table, months):
+    """
+    Create the missing month partitions of `table` (in the caller's transaction).
+    Rows the default partition holds for a new month are moved into it first;
+    ATTACH only takes a lock that lets inserts carry on. Returns the names created.
+    """
+    column = PARTITIONED[table]
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+    existing = list_partitions(conn, table)
+    created = []
+    for month in sorted(set(months) - set(existing)):
+        name = partition_name(table, month)
+        lo, hi = f"{month:%Y-%m-%d}", f"{next_month(month):%Y-%m-%d}"
+        conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)'))
+        conn.execute(text(
+            f'WITH moved AS (DELETE FROM "{table}_default" WHERE "{column}" >= :lo AND "{column}" < :hi RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved'), {"lo": lo, "hi": hi})
+        conn.execute(text(f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{name}\" FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+        logging.info(f"Created partition {name}.")
+        created.append(name)
+    return created
+
+def create_ahead(engine, now=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Make sure every partitioned table has partitions up to `months_ahead` past the current month"""
+    now = now or datetime.utcnow()
+    last = month_start(now)
+    for _ in range(months_ahead):
+        last = next_month(last)
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITIONED:
+            if is_partitioned(conn, table):
+                created += create_partitions(conn, table, months_between(now, last))
+    return created
+
+def drop_partitions_before(conn, table, cutoff):
+    """Drop the month partitions of `table` that end at or before `cutoff`. Returns the names dropped."""
+    dropped = []
+    for month, name in sorted(list_partitions(conn, table).items()):
+        if next_month(month) > cutoff:
+            break
+        conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        conn.execute(text(f'DROP TABLE "{name}"'))
+        logging.info(f"Dropped partition {name}.")
+        dropped.append(name)
+    return dropped
+
+class PartitionRegistry:
+    """
+    Per-process cache of the month partitions known to exist, so the collector can
+    create partitions for a batch's months without a catalog query per batch.
+    """
+    def __init__(self):
+        self.months = {} # table -> set of month starts, None when the table isn't partitioned
+        self.lock = threading.Lock()
+
+    def ensure(self, session, table, timestamps):
+        """Create the partitions `table` needs for `timestamps` (does not commit)"""
+        conn = session.connection()
+        if conn.dialect.name != "postgresql":
+            return
+        with self.lock:
+            if table not in self.months:
+                self.months[table] = set(list_partitions(conn, table)) if is_partitioned(conn, table) else None
+            known = self.months[table]
+            if known is None:
+                return
+            missing = {month_start(ts) for ts in timestamps if ts is not None} - known
+            if missing:
+                create_partitions(conn, table, missing)
+                known |= missing
+
+    def invalidate(self):
+        """Forget what we know (after a rollback that may have undone a partition)"""
+        with self.lock:
+            self.months.clear()
+
+partition_registry = PartitionRegistry()
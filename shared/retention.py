@@ -0,0 +1,208 @@
+"""
+Downsampling and retention of `account_snapshots`.
+
+The collector writes one snapshot per account every live cycle, forever.
+`downsample()` folds them into OHLC-style equity bars (`equity_bars`): hourly bars
+from raw snapshots for every complete hour, then daily bars from the hourly ones
+for every complete day. Each resolution resumes from its newest bar, re-doing the
+last REBAR_HOURS so snapshots that reach the database late (outbox, spill file)
+still land in their bar. Bars are upserted, so re-runs are harmless.
+
+`apply_retention()` then bounds storage, never removing data that has not been
+downsampled yet (each account is held to its own bars, so a retired terminal
+doesn't stop the others' data from aging out):
+- raw snapshots older than `snapshot_days`: on a partitioned Postgres table, whole
+  month partitions are dropped once they are past the cutoff (no long DELETE, no
+  bloat); elsewhere rows are deleted in batches
+- hourly bars older than `hourly_days`; daily bars are kept
+
+`trades` is never aged out: it is the source of the daily_pnl rollup and the
+round trips. Partitioning keeps queries over recent windows on recent months.
+
+Run with `python collector/apply_retention.py [--every SECONDS]`.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.orm import Session
+
+from shared.db_models import AccountSnapshot, EquityBar, dialect_insert
+from shared import partitions
+
+SNAPSHOT_RETENTION_DAYS = 30
+HOURLY_BAR_RETENTION_DAYS = 365
+# Trailing hours re-aggregated on every run (late snapshots)
+REBAR_HOURS = 24
+# Raw snapshots read per query while catching up
+READ_WINDOW = timedelta(days=7)
+# Rows per DELETE batch on unpartitioned tables
+DELETE_BATCH_SIZE = 50_000
+
+BAR_FIELDS = ["open", "high", "low", "close", "balance", "margin", "margin_level", "samples"]
+
+def _floor(dt, resolution):
+    return dt.replace(minute=0, second=0, microsecond=0) if resolution == "1h" else datetime(dt.year, dt.month, dt.day)
+
+def _step(resolution):
+    return timedelta(hours=1) if resolution == "1h" else timedelta(days=1)
+
+def _watermarks(session, resolution):
+    """{account_id: newest bucket} of a bar resolution"""
+    rows = session.execute(select(EquityBar.account_id, func.max(EquityBar.bucket))
+                           .where(EquityBar.resolution == resolution).group_by(EquityBar.account_id))
+    return dict(rows.all())
+
+def _upsert_bars(session, bars, resolution):
+    if bars.empty:
+        return 0
+    table = EquityBar.__table__
+    stmt = dialect_insert(session.get_bind(), table)
+    stmt = stmt.on_conflict_do_update(index_elements=["account_id", "resolution", "bucket"],
+                                      set_={f: stmt.excluded[f] for f in BAR_FIELDS})
+    bars = bars.astype(object).where(bars.notna(), None)
+    rows = [{**row, "resolution": resolution,
+             "bucket": row["bucket"].to_pydatetime(), "samples": int(row["samples"])}
+            for row in bars.to_dict("records")]
+    session.execute(stmt, rows)
+    return len(rows)
+
+def snapshot_bars(snapshots):
+    """Raw snapshots (in time order) -> hourly bars"""
+    df = snapshots.assign(bucket=pd.to_datetime(snapshots["timestamp"]).dt.floor("h"))
+    return df.groupby(["account_id", "bucket"], as_index=False).agg(
+        open=("equity", "first"), high=("equity", "max"), low=("equity", "min"), close=("equity", "last"),
+        balance=("balance", "last"), margin=("margin", "max"), margin_level=("margin_level", "min"),
+        samples=("equity", "size"))
+
+def daily_bars(hourly):
+    """Hourly bars (in time order) -> daily bars"""
+    df = hourly.assign(bucket=pd.to_datetime(hourly["bucket"]).dt.floor("D"))
+    return df.groupby(["account_id", "bucket"], as_index=False).agg(
+        open=("open", "first"), high=("high", "max"), low=("low", "min"), close=("close", "last"),
+        balance=("balance", "last"), margin=("margin", "max"), margin_level=("margin_level", "min"),
+        samples=("samples", "sum"))
+
+def _downsample(engine, resolution, firsts, read, aggregate, now):
+    """Bars of `resolution` for every complete bucket, per account, READ_WINDOW per transaction"""
+    end = _floor(now, resolution)
+    written = 0
+    with Session(engine) as session:
+        marks = _watermarks(session, resolution)
+    for account_id, first in firsts.items():
+        start = _floor(first, resolution)
+        if account_id in marks:
+            start = max(start, marks[account_id] + _step(resolution) - timedelta(hours=REBAR_HOURS))
+            start = _floor(start, resolution)
+        while start < end:
+            window_end = min(start + READ_WINDOW, end)
+            with Session(engine) as session:
+                rows = read(session, account_id, start, window_end)
+                if not rows.empty:
+                    written += _upsert_bars(session, aggregate(rows), resolution)
+                session.commit()
+            start = window_end
+    return written
+
+def _read_snapshots(session, account_id, start, end):
+    query = (select(AccountSnapshot.account_id, AccountSnapshot.timestamp, AccountSnapshot.equity,
+                    AccountSnapshot.balance, AccountSnapshot.margin, AccountSnapshot.margin_level)
+             .where(AccountSnapshot.account_id == account_id, AccountSnapshot.timestamp >= start,
+                    AccountSnapshot.timestamp < end)
+             .order_by(AccountSnapshot.timestamp, AccountSnapshot.id))
+    return pd.read_sql(query, session.connection())
+
+def _read_hourly(session, account_id, start, end):
+    query = (select(EquityBar.account_id, EquityBar.bucket, *[EquityBar.__table__.c[f] for f in BAR_FIELDS])
+             .where(EquityBar.account_id == account_id, EquityBar.resolution == "1h",
+                    EquityBar.bucket >= start, EquityBar.bucket < end)
+             .order_by(EquityBar.bucket))
+    return pd.read_sql(query, session.connection())
+
+def downsample(engine, now=None):
+    """Bring hourly and daily bars up to the last complete hour/day. Returns bars written per resolution."""
+    now = now or datetime.utcnow()
+    with Session(engine) as session:
+        snapshot_firsts = dict(session.execute(
+            select(AccountSnapshot.account_id, func.min(AccountSnapshot.timestamp))
+            .where(AccountSnapshot.timestamp.is_not(None)).group_by(AccountSnapshot.account_id)).all())
+    hourly = _downsample(engine, "1h", snapshot_firsts, _read_snapshots, snapshot_bars, now)
+
+    with Session(engine) as session:
+        hourly_firsts = dict(session.execute(
+            select(EquityBar.account_id, func.min(EquityBar.bucket))
+            .where(EquityBar.resolution == "1h").group_by(EquityBar.account_id)).all())
+    daily = _downsample(engine, "1d", hourly_firsts, _read_hourly, daily_bars, now)
+    return {"1h": hourly, "1d": daily}
+
+def _snapshot_cutoffs(session, age_cutoff):
+    """
+    {account_id: time before which its raw snapshots may go}: `age_cutoff`, but
+    never past the end of the account's newest hourly bar (accounts without bars
+    are left out). Also returns the cutoff for whole month partitions, the earliest
+    time any account still has snapshots waiting for a bar; an account whose
+    snapshots all lie under its bars (a retired terminal) doesn't hold it back.
+    """
+    marks = _watermarks(session, "1h")
+    spans = session.execute(
+        select(AccountSnapshot.account_id, func.min(AccountSnapshot.timestamp), func.max(AccountSnapshot.timestamp))
+        .where(AccountSnapshot.account_id.is_not(None), AccountSnapshot.timestamp.is_not(None))
+        .group_by(AccountSnapshot.account_id))
+    cutoffs, partition_cutoff = {}, age_cutoff
+    for account_id, first, last in spans:
+        if account_id not in marks:
+            partition_cutoff = min(partition_cutoff, first)
+            continue
+        covered = marks[account_id] + _step("1h")
+        cutoffs[account_id] = min(age_cutoff, covered)
+        if last >= covered:
+            partition_cutoff = min(partition_cutoff, covered)
+    return cutoffs, partition_cutoff
+
+def _delete_snapshots_before(engine, account_id, cutoff):
+    table = AccountSnapshot.__table__
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            ids = (select(table.c.id).where(table.c.account_id == account_id, table.c.timestamp < cutoff)
+                   .limit(DELETE_BATCH_SIZE).scalar_subquery())
+            n = conn.execute(delete(table).where(table.c.id.in_(ids))).rowcount
+        deleted += n
+        if n < DELETE_BATCH_SIZE:
+            return deleted
+
+def apply_retention(engine, now=None, snapshot_days=SNAPSHOT_RETENTION_DAYS, hourly_days=HOURLY_BAR_RETENTION_DAYS):
+    """Age out downsampled raw snapshots and hourly bars. Returns what was removed."""
+    now = now or datetime.utcnow()
+    result = {"partitions_dropped": [], "snapshots_deleted": 0, "hourly_bars_deleted": 0}
+
+    with Session(engine) as session:
+        snapshot_cutoffs, partition_cutoff = _snapshot_cutoffs(session, now - timedelta(days=snapshot_days))
+        daily_marks = _watermarks(session, "1d")
+
+    # 1. Raw snapshots, each account up to its own hourly bars
+    with engine.begin() as conn:
+        is_partitioned = partitions.is_partitioned(conn, AccountSnapshot.__tablename__)
+        if is_partitioned:
+            result["partitions_dropped"] = partitions.drop_partitions_before(
+                conn, AccountSnapshot.__tablename__, partition_cutoff)
+            # Stray rows the default partition caught
+            for account_id, cutoff in snapshot_cutoffs.items():
+                result["snapshots_deleted"] += conn.execute(text(
+                    'DELETE FROM "account_snapshots_default" WHERE "account_id" = :account_id AND "timestamp" < :cutoff'),
+                    {"account_id": account_id, "cutoff": cutoff}).rowcount
+    if not is_partitioned:
+        for account_id, cutoff in snapshot_cutoffs.items():
+            result["snapshots_deleted"] += _delete_snapshots_before(engine, account_id, cutoff)
+
+    # 2. Hourly bars, each account up to its own daily bars
+    hourly_cutoff = now - timedelta(days=hourly_days)
+    with engine.begin() as conn:
+        for account_id, mark in daily_marks.items():
+            cutoff = min(hourly_cutoff, mark + _step("1d"))
+            result["hourly_bars_deleted"] += conn.execute(delete(EquityBar).where(
+                EquityBar.account_id == account_id, EquityBar.resolution == "1h", EquityBar.bucket < cutoff)).rowcount
+
+    logging.info(f"Retention: {result}")
+    return result
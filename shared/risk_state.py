@@ -0,0 +1,215 @@
+"""
+Running risk metrics per account and per EA (`risk_state`).
+
+`RiskTracker` folds deals in (close_time, ticket) order into one state per
+account (magic_number ALL_EAS) and one per (account, EA): cumulative net, peak,
+max drawdown and the longest time spent below a peak, win/loss streaks, profit
+totals and the per-trade accumulators behind Sharpe and Sortino (Welford mean and
+sum of squared deviations, sum of squared losses). Each deal costs O(1) per
+state, so dashboards read finished values instead of rescanning the history.
+
+Conventions follow the Dashboard and the daily_pnl rollup: BALANCE deals are
+left out, every other deal moves the equity curve, and only exits count as
+trades (an IN deal's commission lowers the curve without being a losing trade).
+The running peak starts at the first point of the curve. Break-even trades leave
+the streaks alone.
+
+The collector feeds the deals it just inserted through `apply_risk_state()` in
+the same transaction. A deal that sorts before an account's last folded deal
+(a backfill, a late outbox flush) cannot be folded in O(1): that account's
+states are replayed from `trades` instead. `rebuild_risk_state()` replays
+everything (`python collector/rebuild_rollups.py`).
+"""
+import math
+
+from sqlalchemy import select, delete, func, text
+
+from shared.db_models import Trade, RiskState, dialect_insert
+
+# magic_number of the account-wide state
+ALL_EAS = -1
+# Keys per IN (...) list / rows per INSERT batch
+BATCH_SIZE = 500
+
+STATE_FIELDS = ("account_id", "magic_number", "last_close_time", "last_ticket", "trades", "wins", "losses",
+                "net_profit", "gross_profit", "gross_loss", "peak", "peak_time", "max_drawdown",
+                "max_drawdown_seconds", "win_streak", "loss_streak", "max_win_streak", "max_loss_streak",
+                "mean", "m2", "downside_sq")
+
+def _naive(dt):
+    """Deals fresh from MT5 carry tzinfo=UTC, stored ones come back naive (UTC)"""
+    return dt.replace(tzinfo=None) if dt is not None and dt.tzinfo is not None else dt
+
+def new_state(account_id, magic_number):
+    state = dict.fromkeys(STATE_FIELDS, 0)
+    state.update(account_id=account_id, magic_number=magic_number, last_close_time=None, last_ticket=None,
+                 net_profit=0.0, gross_profit=0.0, gross_loss=0.0, peak=None, peak_time=None, max_drawdown=0.0,
+                 max_drawdown_seconds=0.0, mean=0.0, m2=0.0, downside_sq=0.0)
+    return state
+
+def is_risk_deal(row):
+    return row.get("type") != "BALANCE" and row.get("close_time") is not None
+
+def fold(state, row):
+    """Fold one deal (a `trades` row dict that sorts after the state's last deal) into `state`"""
+    close_time = _naive(row["close_time"])
+    net = (row["profit"] or 0.0) + (row["commission"] or 0.0) + (row["swap"] or 0.0)
+    state["last_close_time"], state["last_ticket"] = close_time, row["ticket"]
+
+    # 1. Equity curve
+    previous = state["net_profit"]
+    cum = state["net_profit"] = previous + net
+    if net > 0:
+        state["gross_profit"] += net
+    elif net < 0:
+        state["gross_loss"] += net
+    if state["peak"] is None or cum >= state["peak"]:
+        if state["peak"] is not None and previous < state["peak"]:
+            # Recovered: the time under water ends here
+            under = (close_time - state["peak_time"]).total_seconds()
+            state["max_drawdown_seconds"] = max(state["max_drawdown_seconds"], under)
+        state["peak"], state["peak_time"] = cum, close_time
+    else:
+        state["max_drawdown"] = min(state["max_drawdown"], cum - state["peak"])
+        under = (close_time - state["peak_time"]).total_seconds()
+        state["max_drawdown_seconds"] = max(state["max_drawdown_seconds"], under)
+
+    # 2. Trade statistics (exits only)
+    if row.get("entry") == "IN":
+        return
+    state["trades"] += 1
+    delta = net - state["mean"]
+    state["mean"] += delta / state["trades"]
+    state["m2"] += delta * (net - state["mean"])
+    if net > 0:
+        state["wins"] += 1
+        state["win_streak"], state["loss_streak"] = state["win_streak"] + 1, 0
+        state["max_win_streak"] = max(state["max_win_streak"], state["win_streak"])
+    elif net < 0:
+        state["losses"] += 1
+        state["downside_sq"] += net * net
+        state["win_streak"], state["loss_streak"] = 0, state["loss_streak"] + 1
+        state["max_loss_streak"] = max(state["max_loss_streak"], state["loss_streak"])
+
+def sharpe(state):
+    """Per-trade Sharpe ratio (mean / standard deviation of trade nets), None below two trades"""
+    if state["trades"] < 2 or state["m2"] <= 0:
+        return None
+    return state["mean"] / math.sqrt(state["m2"] / (state["trades"] - 1))
+
+def sortino(state):
+    """Per-trade Sortino ratio (mean / downside deviation), None without losses"""
+    if not state["trades"] or state["downside_sq"] <= 0:
+        return None
+    return state["mean"] / math.sqrt(state["downside_sq"] / state["trades"])
+
+def _scopes(row):
+    account_id = row["account_id"]
+    return ((account_id, ALL_EAS), (account_id, row["magic_number"] or 0))
+
+class RiskTracker:
+    def __init__(self, states=None):
+        self.states = states if states is not None else {} # (account_id, magic_number) -> state dict
+        self.touched = set()
+
+    def in_order(self, row):
+        """Whether `row` sorts after the last deal of its account (so it can be folded in)"""
+        state = self.states.get((row["account_id"], ALL_EAS))
+        if state is None or state["last_close_time"] is None:
+            return True
+        return (_naive(row["close_time"]), row["ticket"]) > (state["last_close_time"], state["last_ticket"])
+
+    def feed(self, row):
+        """Process one `trades` row dict (in close_time, ticket order)"""
+        if not is_risk_deal(row):
+            return
+        for key in _scopes(row):
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = new_state(*key)
+            fold(state, row)
+            self.touched.add(key)
+
+# --- Persistence ---
+
+def _load_states(session, account_ids):
+    table = RiskState.__table__
+    account_ids = list(account_ids)
+    states = {}
+    for i in range(0, len(account_ids), BATCH_SIZE):
+        query = select(table).where(table.c.account_id.in_(account_ids[i:i + BATCH_SIZE]))
+        for row in session.execute(query).mappings():
+            states[(row["account_id"], row["magic_number"])] = dict(row)
+    return states
+
+def _save_states(session, tracker, keys):
+    table = RiskState.__table__
+    rows = [{f: tracker.states[key][f] for f in STATE_FIELDS} for key in keys]
+    stmt = dialect_insert(session.get_bind(), table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account_id", "magic_number"],
+        set_={f: stmt.excluded[f] for f in STATE_FIELDS if f not in ("account_id", "magic_number")},
+    )
+    for i in range(0, len(rows), BATCH_SIZE):
+        session.execute(stmt, rows[i:i + BATCH_SIZE])
+
+def _replay(session, tracker, account_ids, batch_size):
+    """Rebuild the states of `account_ids` (None: all) in `tracker` from the stored deals, streamed"""
+    trades = Trade.__table__
+    query = (select(trades.c.account_id, trades.c.magic_number, trades.c.ticket, trades.c.type, trades.c.entry,
+                    trades.c.profit, trades.c.commission, trades.c.swap, trades.c.close_time)
+             .where(trades.c.close_time.is_not(None), func.coalesce(trades.c.type, "") != "BALANCE")
+             .order_by(trades.c.close_time, trades.c.ticket))
+    if account_ids is not None:
+        query = query.where(trades.c.account_id.in_(list(account_ids)))
+        for key in [key for key in tracker.states if key[0] in account_ids]:
+            del tracker.states[key]
+    result = session.connection().execute(query, execution_options={"stream_results": True, "yield_per": batch_size})
+    for row in result.mappings():
+        tracker.feed(row)
+
+def apply_risk_state(session, rows, batch_size=5000):
+    """
+    Fold newly inserted `trades` row dicts into the stored states (does not commit).
+    Accounts that received an out-of-order deal are replayed from `trades`.
+    Returns the number of states written.
+    """
+    rows = sorted((row for row in rows if is_risk_deal(row)), key=lambda r: (_naive(r["close_time"]), r["ticket"]))
+    if not rows:
+        return 0
+    if session.get_bind().dialect.name == "postgresql":
+        # Waits for a running rebuild_risk_state() to commit (collectors don't block each other)
+        session.execute(text("LOCK TABLE risk_state IN ROW EXCLUSIVE MODE"))
+    tracker = RiskTracker(_load_states(session, {row["account_id"] for row in rows}))
+    replay = set()
+    for row in rows:
+        if row["account_id"] in replay:
+            continue
+        if not tracker.in_order(row):
+            replay.add(row["account_id"])
+            continue
+        tracker.feed(row)
+    if replay:
+        # The new deals are already in `trades` (same transaction)
+        _replay(session, tracker, replay, batch_size)
+        tracker.touched |= {key for key in tracker.states if key[0] in replay}
+    _save_states(session, tracker, tracker.touched)
+    return len(tracker.touched)
+
+def rebuild_risk_state(session, account_id=None, batch_size=5000):
+    """
+    Replay stored deals into `risk_state` (all accounts, or one) without loading
+    them all (does not commit). Returns the number of states written.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        # Block collector updates (not reads) until we commit
+        session.execute(text("LOCK TABLE risk_state IN SHARE ROW EXCLUSIVE MODE"))
+    purge = delete(RiskState)
+    if account_id is not None:
+        purge = purge.where(RiskState.account_id == account_id)
+    session.execute(purge)
+
+    tracker = RiskTracker()
+    _replay(session, tracker, None if account_id is None else {account_id}, batch_size)
+    _save_states(session, tracker, list(tracker.states))
+    return len(tracker.states)
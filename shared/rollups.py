@@ -0,0 +1,101 @@
+"""
+Maintenance of the `daily_pnl` rollup.
+
+The collector folds every batch of newly inserted deals into the rollup with
+`apply_trade_rows()` in the same transaction as the deals themselves, so the rollup
+never drifts from `trades`. `rebuild_daily_pnl()` recomputes it from scratch
+(`python collector/rebuild_rollups.py`).
+
+Aggregation matches the dashboard: BALANCE deals count as deposits, every other
+deal adds net profit = profit + commission + swap. Only exits count as trades
+(wins/losses): an IN deal just opens a position, so its net (the entry
+commission) goes into the profit totals without counting as a losing trade.
+Deals stored without an entry (before migration 5) all count as trades.
+"""
+from sqlalchemy import select, delete, func, case, literal, text
+
+from shared.db_models import Trade, DailyPnl, dialect_insert
+
+# Additive measures; an upsert adds the incoming values to the stored ones
+MEASURES = ("net_profit", "gross_profit", "gross_loss", "trades", "wins", "losses", "volume", "deposits")
+
+def aggregate_trade_rows(rows):
+    """Fold `trades` row dicts into {(account_id, magic_number, symbol, day): measures}"""
+    totals = {}
+    for row in rows:
+        key = (row["account_id"], row["magic_number"] or 0, row["symbol"] or "", row["close_time"].date())
+        agg = totals.get(key)
+        if agg is None:
+            agg = totals[key] = dict.fromkeys(MEASURES, 0)
+        if row["type"] == "BALANCE":
+            agg["deposits"] += row["profit"] or 0.0
+            continue
+        net = (row["profit"] or 0.0) + (row["commission"] or 0.0) + (row["swap"] or 0.0)
+        counted = int(row.get("entry") != "IN")
+        agg["net_profit"] += net
+        agg["trades"] += counted
+        agg["volume"] += row["volume"] or 0.0
+        if net > 0:
+            agg["gross_profit"] += net
+            agg["wins"] += counted
+        elif net < 0:
+            agg["gross_loss"] += net
+            agg["losses"] += counted
+    return totals
+
+def apply_trade_rows(session, rows):
+    """Add newly inserted `trades` rows to the rollup (does not commit). Returns rollup rows touched."""
+    totals = aggregate_trade_rows(rows)
+    if not totals:
+        return 0
+    table = DailyPnl.__table__
+    stmt = dialect_insert(session.get_bind(), table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account_id", "magic_number", "symbol", "day"],
+        set_={m: table.c[m] + stmt.excluded[m] for m in MEASURES},
+    )
+    session.execute(stmt, [
+        {"account_id": acc, "magic_number": magic, "symbol": symbol, "day": day, **agg}
+        for (acc, magic, symbol, day), agg in totals.items()
+    ])
+    return len(totals)
+
+def rebuild_daily_pnl(session, account_id=None):
+    """
+    Recompute the rollup from `trades` (all accounts, or one) in one statement
+    (does not commit). Returns the number of rollup rows written.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        # Block concurrent collector upserts (not reads) until we commit: a deal
+        # committed before our snapshot is counted here, anything later is added by its
+        # own upsert once we are done.
+        session.execute(text("LOCK TABLE daily_pnl IN SHARE ROW EXCLUSIVE MODE"))
+
+    purge = delete(DailyPnl)
+    if account_id is not None:
+        purge = purge.where(DailyPnl.account_id == account_id)
+    session.execute(purge)
+
+    net = func.coalesce(Trade.profit, 0.0) + func.coalesce(Trade.commission, 0.0) + func.coalesce(Trade.swap, 0.0)
+    is_trade = func.coalesce(Trade.type, "") != "BALANCE"
+    is_exit = is_trade & (func.coalesce(Trade.entry, "") != "IN")
+    day = func.date(Trade.close_time)
+    magic = func.coalesce(Trade.magic_number, 0)
+    symbol = func.coalesce(Trade.symbol, "")
+    query = select(
+        Trade.account_id, magic, symbol, day,
+        func.sum(case((is_trade, net), else_=0.0)),
+        func.sum(case((is_trade & (net > 0), net), else_=0.0)),
+        func.sum(case((is_trade & (net < 0), net), else_=0.0)),
+        func.sum(case((is_exit, 1), else_=0)),
+        func.sum(case((is_exit & (net > 0), 1), else_=0)),
+        func.sum(case((is_exit & (net < 0), 1), else_=0)),
+        func.sum(case((is_trade, func.coalesce(Trade.volume, 0.0)), else_=0.0)),
+        func.sum(case((is_trade, literal(0.0)), else_=func.coalesce(Trade.profit, 0.0))),
+    ).where(Trade.close_time.is_not(None)).group_by(Trade.account_id, magic, symbol, day)
+    if account_id is not None:
+        query = query.where(Trade.account_id == account_id)
+
+    result = session.execute(DailyPnl.__table__.insert().from_select(
+        ["account_id", "magic_number", "symbol", "day", *MEASURES], query))
+    return result.rowcount
@@ -0,0 +1,208 @@
+"""
+Round trips reconstructed from MT5 deals.
+
+MT5 reports deals (executions), not trades. A position is opened by an IN deal,
+possibly scaled into by more IN deals, and closed by one or more OUT/OUT_BY deals
+(partial closes). An INOUT deal reverses it: it closes the open volume and opens
+the rest in the other direction. All deals of a position share its position_id.
+
+`RoundTripMatcher` consumes deals in (close_time, ticket) order and only keeps
+the open remainder of each position (a "leg"), so its memory is O(open
+positions). Every closing deal yields one round trip with the volume-weighted
+entry price, real open/close times, holding time and net PnL; the entry
+commission is shared out by closed volume.
+
+The collector feeds the deals it just inserted through `apply_round_trips()` in
+the same transaction, loading and saving only the legs it touches from
+`position_legs`. `rebuild_round_trips()` replays every stored deal
+(`python collector/rebuild_round_trips.py`). Deals stored before migration 5
+have no position_id and are skipped until backfilled.
+"""
+from sqlalchemy import select, delete, tuple_, text
+
+from shared.db_models import Trade, RoundTrip, PositionLeg, dialect_insert
+
+# Volumes below this are treated as fully closed (float lot arithmetic)
+VOLUME_EPS = 1e-9
+# Keys per IN (...) list / rows per INSERT batch
+BATCH_SIZE = 500
+
+LEG_FIELDS = ("account_id", "position_id", "open_ticket", "magic_number", "symbol", "direction", "volume",
+              "open_price", "open_time", "commission")
+
+def _naive(dt):
+    """Deals fresh from MT5 carry tzinfo=UTC, stored ones come back naive (UTC)"""
+    return dt.replace(tzinfo=None) if dt is not None and dt.tzinfo is not None else dt
+
+def is_position_deal(row):
+    """BUY/SELL deal that belongs to a known position"""
+    return bool(row.get("position_id")) and bool(row.get("entry")) and row["type"] in ("BUY", "SELL")
+
+class RoundTripMatcher:
+    def __init__(self, legs=None):
+        self.legs = legs if legs is not None else {} # (account_id, position_id) -> leg dict
+        self.touched = set() # keys whose leg changed since creation
+
+    def feed(self, row):
+        """Process one `trades` row dict (in close_time, ticket order). Returns the round trips it closes."""
+        if not is_position_deal(row):
+            return []
+        key = (row["account_id"], row["position_id"])
+        self.touched.add(key)
+        volume = row["volume"] or 0.0
+        commission = row["commission"] or 0.0
+        leg = self.legs.get(key)
+
+        # 1. Entry (or scale-in) in the position's direction
+        if row["entry"] == "IN" and (leg is None or leg["direction"] == row["type"]):
+            self._open(key, row, volume, commission)
+            return []
+
+        # 2. Exit: OUT/OUT_BY/INOUT, or an opposite IN on a netting account. Without a leg
+        # the entry predates the stored history; the exit is still recorded.
+        closed = min(volume, leg["volume"]) if leg else volume
+        share = closed / volume if volume > VOLUME_EPS else 1.0
+        trip = self._close(key, leg, row, closed, commission * share)
+
+        # 3. A reversal opens the remaining volume in the deal's direction
+        remainder = volume - closed
+        if remainder > VOLUME_EPS and row["entry"] in ("INOUT", "IN"):
+            self._open(key, row, remainder, commission * (1.0 - share))
+        return [trip]
+
+    def _open(self, key, row, volume, commission):
+        price = row["open_price"] # a deal's execution price is stored in open_price
+        leg = self.legs.get(key)
+        if leg is None:
+            self.legs[key] = {
+                "account_id": row["account_id"], "position_id": row["position_id"], "open_ticket": row["ticket"],
+                "magic_number": row["magic_number"], "symbol": row["symbol"], "direction": row["type"],
+                "volume": volume, "open_price": price, "open_time": _naive(row["close_time"]), "commission": commission,
+            }
+            return
+        total = leg["volume"] + volume
+        if total > VOLUME_EPS and price is not None and leg["open_price"] is not None:
+            leg["open_price"] = (leg["open_price"] * leg["volume"] + price * volume) / total
+        leg["volume"] = total
+        leg["commission"] += commission
+
+    def _close(self, key, leg, row, volume, exit_commission):
+        entry_commission = 0.0
+        if leg:
+            entry_commission = leg["commission"] * (volume / leg["volume"] if leg["volume"] > VOLUME_EPS else 1.0)
+            leg["commission"] -= entry_commission
+            leg["volume"] -= volume
+            if leg["volume"] <= VOLUME_EPS:
+                del self.legs[key]
+
+        open_time = leg["open_time"] if leg else None
+        close_time = _naive(row["close_time"])
+        profit = row["profit"] or 0.0
+        commission = entry_commission + exit_commission
+        swap = row["swap"] or 0.0
+        return {
+            "close_ticket": row["ticket"],
+            "account_id": row["account_id"],
+            "position_id": row["position_id"],
+            "open_ticket": leg["open_ticket"] if leg else None,
+            "magic_number": row["magic_number"],
+            "symbol": row["symbol"],
+            # The exit deal trades against the position
+            "direction": leg["direction"] if leg else ("SELL" if row["type"] == "BUY" else "BUY"),
+            "volume": volume,
+            "open_time": open_time,
+            "close_time": close_time,
+            "open_price": leg["open_price"] if leg else None,
+            "close_price": row["open_price"],
+            "holding_seconds": (close_time - open_time).total_seconds() if open_time else None,
+            "profit": profit,
+            "commission": commission,
+            "swap": swap,
+            "net_profit": profit + commission + swap,
+        }
+
+# --- Persistence ---
+
+def _load_legs(session, keys):
+    table = PositionLeg.__table__
+    keys = list(keys)
+    legs = {}
+    for i in range(0, len(keys), BATCH_SIZE):
+        query = select(table).where(tuple_(table.c.account_id, table.c.position_id).in_(keys[i:i + BATCH_SIZE]))
+        for row in session.execute(query).mappings():
+            legs[(row["account_id"], row["position_id"])] = dict(row)
+    return legs
+
+def _save_legs(session, matcher, keys):
+    """Upsert the open legs among `keys`, delete the closed ones"""
+    table = PositionLeg.__table__
+    open_legs = [{f: matcher.legs[key][f] for f in LEG_FIELDS} for key in keys if key in matcher.legs]
+    closed = [key for key in keys if key not in matcher.legs]
+    stmt = dialect_insert(session.get_bind(), table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["account_id", "position_id"],
+        set_={f: stmt.excluded[f] for f in LEG_FIELDS if f not in ("account_id", "position_id")},
+    )
+    for i in range(0, len(open_legs), BATCH_SIZE):
+        session.execute(stmt, open_legs[i:i + BATCH_SIZE])
+    for i in range(0, len(closed), BATCH_SIZE):
+        session.execute(delete(table).where(
+            tuple_(table.c.account_id, table.c.position_id).in_(closed[i:i + BATCH_SIZE])))
+
+def _insert_trips(session, trips):
+    stmt = dialect_insert(session.get_bind(), RoundTrip.__table__).on_conflict_do_nothing(index_elements=["close_ticket"])
+    for i in range(0, len(trips), BATCH_SIZE):
+        session.execute(stmt, trips[i:i + BATCH_SIZE])
+
+def apply_round_trips(session, rows):
+    """
+    Match newly inserted `trades` row dicts against the stored legs and write the
+    round trips they close (does not commit). Returns the number of round trips.
+    """
+    rows = sorted((row for row in rows if is_position_deal(row)), key=lambda r: (r["close_time"], r["ticket"]))
+    if not rows:
+        return 0
+    if session.get_bind().dialect.name == "postgresql":
+        # Waits for a running rebuild_round_trips() to commit (collectors don't block each other)
+        session.execute(text("LOCK TABLE position_legs IN ROW EXCLUSIVE MODE"))
+    matcher = RoundTripMatcher(_load_legs(session, {(r["account_id"], r["position_id"]) for r in rows}))
+    trips = [trip for row in rows for trip in matcher.feed(row)]
+    _insert_trips(session, trips)
+    _save_legs(session, matcher, matcher.touched)
+    return len(trips)
+
+def rebuild_round_trips(session, account_id=None, batch_size=5000):
+    """
+    Replay stored deals into `round_trips` and `position_legs` (all accounts, or one)
+    without loading them all: deals are streamed and only open legs are kept in
+    memory. Does not commit. Returns (round trips written, legs left open).
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        # Block collector matching (not reads) until we commit
+        session.execute(text("LOCK TABLE round_trips, position_legs IN SHARE ROW EXCLUSIVE MODE"))
+    for model in (RoundTrip, PositionLeg):
+        purge = delete(model)
+        if account_id is not None:
+            purge = purge.where(model.account_id == account_id)
+        session.execute(purge)
+
+    trades = Trade.__table__
+    query = (select(trades).where(trades.c.position_id.is_not(None), trades.c.close_time.is_not(None))
+             .order_by(trades.c.close_time, trades.c.ticket))
+    if account_id is not None:
+        query = query.where(trades.c.account_id == account_id)
+
+    matcher = RoundTripMatcher()
+    written, pending = 0, []
+    # Per statement: Connection.execution_options() would stream every later statement too
+    result = session.connection().execute(query, execution_options={"stream_results": True, "yield_per": batch_size})
+    for row in result.mappings():
+        pending.extend(matcher.feed(row))
+        if len(pending) >= batch_size:
+            _insert_trips(session, pending)
+            written += len(pending)
+            pending = []
+    _insert_trips(session, pending)
+    written += len(pending)
+    _save_legs(session, matcher, list(matcher.legs))
+    return written, len(matcher.legs)
@@ -0,0 +1,48 @@
+"""
+Shared fixtures: a migrated SQLite database per test and MT5 deals built with
+the fake terminal module (collector/fake_mt5.py), so the collector imports
+without the real MetaTrader5 package.
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collector import fake_mt5
+fake_mt5.install()
+
+from sqlalchemy.orm import sessionmaker
+from shared.db_models import get_engine
+from shared.migrations import upgrade
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    upgrade(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+def make_deal(ticket, minutes, type_, entry, position_id, volume, price, profit=0.0, commission=0.0, swap=0.0,
+              magic=101, symbol="EURUSD"):
+    """An MT5 deal as the terminal reports it, `minutes` after T0"""
+    t = int((T0 + timedelta(minutes=minutes)).timestamp())
+    deal_type = {"BUY": fake_mt5.DEAL_TYPE_BUY, "SELL": fake_mt5.DEAL_TYPE_SELL,
+                 "BALANCE": fake_mt5.DEAL_TYPE_BALANCE}[type_]
+    deal_entry = {"IN": fake_mt5.DEAL_ENTRY_IN, "OUT": fake_mt5.DEAL_ENTRY_OUT, "INOUT": fake_mt5.DEAL_ENTRY_INOUT,
+                  "OUT_BY": fake_mt5.DEAL_ENTRY_OUT_BY}[entry]
+    return fake_mt5.TradeDeal(ticket, ticket, t, t * 1000, deal_type, deal_entry, magic, position_id, 0,
+                              volume, price, commission, swap, profit, 0.0, symbol, "", "")
+
+def to_rows(deals, account_id=1001):
+    from collector.main_collector import deal_to_row
+    return [deal_to_row(deal, account_id) for deal in deals]
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, func
+
+from collector import fake_mt5, main_collector
+from collector.main_collector import sync_trades, get_app_config, BACKFILL_KEY, BACKFILL_DONE
+from shared.db_models import Trade
+
+@pytest.fixture(autouse=True)
+def collector(monkeypatch):
+    monkeypatch.setattr(main_collector, "OUTBOX", False)
+    monkeypatch.setattr(main_collector, "BACKFILL_DAYS", 40)
+    monkeypatch.setattr(main_collector, "BACKFILL_WINDOW_DAYS", 7)
+    main_collector.ea_registry.invalidate()
+    yield
+    main_collector.ea_registry.invalidate()
+    fake_mt5.reset()
+
+@pytest.fixture
+def history(monkeypatch):
+    """The terminal's deals, and the start of every history window fetched"""
+    deals = fake_mt5.generate_deals(200, start=datetime.now(timezone.utc) - timedelta(days=30), days=29)
+    fake_mt5.reset()
+    fake_mt5.add_terminal("A", login=1001, deals=deals)
+    fake_mt5.initialize("A")
+    real_get, calls = fake_mt5.history_deals_get, []
+    def history_deals_get(date_from, date_to, **kwargs):
+        calls.append(date_from)
+        return real_get(date_from, date_to)
+    monkeypatch.setattr(main_collector.mt5, "history_deals_get", history_deals_get)
+    return deals, calls
+
+def stored(session):
+    return session.execute(select(func.count()).select_from(Trade)).scalar()
+
+def checkpoint(session):
+    return get_app_config(session, BACKFILL_KEY.format(account_id=1001))
+
+def test_new_account_is_backfilled_in_windows(session, history):
+    deals, calls = history
+    assert sync_trades(session, 1001) == (200, 0)
+    assert stored(session) == 200
+    assert checkpoint(session) == BACKFILL_DONE
+    # 40 days in 7-day windows
+    assert len(calls) == 6
+    assert all(later - earlier == timedelta(days=7) for earlier, later in zip(calls, calls[1:]))
+
+def test_interrupted_backfill_resumes_from_its_checkpoint(session, history, monkeypatch):
+    deals, calls = history
+    fetch = main_collector.mt5.history_deals_get
+    monkeypatch.setattr(main_collector.mt5, "history_deals_get",
+                        lambda date_from, date_to: None if len(calls) == 3 else fetch(date_from, date_to))
+    # Fails on the fourth window: the first three are committed with their checkpoint
+    first, _ = sync_trades(session, 1001)
+    assert datetime.fromisoformat(checkpoint(session)) == calls[2] + timedelta(days=7)
+    assert stored(session) == first
+
+    monkeypatch.setattr(main_collector.mt5, "history_deals_get", fetch)
+    second, _ = sync_trades(session, 1001)
+    assert calls[3] == calls[2] + timedelta(days=7)
+    assert first + second == 200
+    assert stored(session) == 200
+    assert checkpoint(session) == BACKFILL_DONE
+
+def test_after_the_backfill_only_new_deals_are_fetched(session, history):
+    deals, calls = history
+    sync_trades(session, 1001)
+    calls.clear()
+
+    assert sync_trades(session, 1001)[0] == 0
+    last = session.execute(select(func.max(Trade.close_time))).scalar()
+    assert calls == [last.replace(tzinfo=timezone.utc)]
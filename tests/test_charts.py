@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.shared.charts import lttb, minmax, decimate
+
+def spiky(n):
+    y = np.sin(np.linspace(0, 20, n))
+    y[n // 3] = 50.0
+    y[2 * n // 3] = -50.0
+    return y
+
+@pytest.mark.parametrize("n_out", [10, 11, 100, 10_000])
+def test_lttb_returns_n_out_sorted_unique_indices(n_out):
+    n = 10_000
+    keep = lttb(np.arange(n), spiky(n), n_out)
+    assert len(keep) == min(n_out, n)
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert (np.diff(keep) > 0).all()
+
+@pytest.mark.parametrize("n, n_out", [(0, 10), (1, 10), (5, 5), (5, 6), (100, 2), (100, 0)])
+def test_lttb_keeps_everything_when_nothing_to_drop(n, n_out):
+    assert list(lttb(np.arange(n), np.zeros(n), n_out)) == list(range(n))
+
+def test_lttb_smallest_reduction_and_spikes():
+    n = 1000
+    y = spiky(n)
+    keep = lttb(np.arange(n), y, 3)
+    assert len(keep) == 3 and keep[0] == 0 and keep[-1] == n - 1
+    keep = lttb(np.arange(n), y, 50)
+    assert n // 3 in keep and 2 * n // 3 in keep
+    assert len(lttb(np.arange(n), y, n - 1)) == n - 1
+
+def test_lttb_accepts_datetimes_and_flat_series():
+    x = pd.date_range("2024-01-01", periods=500, freq="min")
+    keep = lttb(x, np.ones(500), 20)
+    assert len(keep) == 20 and len(set(keep)) == 20
+
+@pytest.mark.parametrize("n_out", [4, 5, 100, 999])
+def test_minmax_keeps_extremes_and_ends(n_out):
+    n = 1000
+    y = spiky(n)
+    keep = minmax(y, n_out)
+    assert len(keep) <= n_out
+    assert {0, n - 1, int(np.argmax(y)), int(np.argmin(y))} <= set(keep)
+    assert (np.diff(keep) > 0).all()
+
+def test_minmax_single_bucket():
+    y = np.array([3.0, 1.0, 4.0, 1.5, 9.0, 2.0, 6.0])
+    assert list(minmax(y, 4)) == [0, 1, 4, 6]
+
+@pytest.mark.parametrize("n, n_out", [(0, 10), (3, 3), (10, 3), (10, 20)])
+def test_minmax_keeps_everything_when_nothing_to_drop(n, n_out):
+    assert list(minmax(np.arange(n, dtype=float), n_out)) == list(range(n))
+
+def test_decimate_bounds_rows():
+    df = pd.DataFrame({"t": pd.date_range("2024-01-01", periods=5000, freq="min"), "v": spiky(5000)})
+    assert decimate(df, "t", "v", max_points=5000) is df
+    assert len(decimate(df, "t", "v", max_points=300)) == 300
+    assert len(decimate(df, "t", "v", max_points=300, method="minmax")) <= 300
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import select, func
+
+from collector import fake_mt5
+from collector.main_collector import bulk_insert_trades, ea_registry
+from shared.db_models import Trade, EA
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    # The EA cache is per process; each test has its own database
+    ea_registry.invalidate()
+    yield
+    ea_registry.invalidate()
+
+def count(session, model):
+    return session.execute(select(func.count()).select_from(model)).scalar()
+
+def test_counts_inserted_and_skipped_deals(session):
+    deals = fake_mt5.generate_deals(100)
+    assert bulk_insert_trades(session, 1001, deals[:60]) == (60, 0)
+    session.commit()
+
+    # Overlapping batch: the first 60 are already stored
+    assert bulk_insert_trades(session, 1001, deals) == (40, 60)
+    session.commit()
+    assert bulk_insert_trades(session, 1001, deals) == (0, 100)
+    assert count(session, Trade) == 100
+
+def test_duplicate_tickets_in_one_batch_count_as_skipped(session):
+    deals = fake_mt5.generate_deals(10)
+    assert bulk_insert_trades(session, 1001, deals + deals[:3]) == (10, 3)
+    assert bulk_insert_trades(session, 1001, []) == (0, 0)
+
+def test_registers_each_new_ea_once(session):
+    deals = fake_mt5.generate_deals(50, magics=(7, 8))
+    bulk_insert_trades(session, 1001, deals)
+    bulk_insert_trades(session, 2002, deals[:10])
+    session.commit()
+    keys = set(map(tuple, session.execute(select(EA.magic_number, EA.account_id))))
+    # The deposit carries magic 0
+    assert keys == {(0, 1001), (7, 1001), (8, 1001)} | {(d.magic, 2002) for d in deals[:10]}
@@ -0,0 +1,110 @@
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import sessionmaker
+
+from shared.db_models import Base, get_engine, SchemaVersion, DailyPnl, RiskState
+from shared.migrations import MIGRATIONS, upgrade, pending_migrations
+from shared.rollups import rebuild_daily_pnl
+from shared.risk_state import rebuild_risk_state
+
+# `trades` as stored before migrations 4-8 (no position_id/entry, no rollups)
+LEGACY_TRADES = """
+    CREATE TABLE trades (
+        ticket BIGINT PRIMARY KEY, account_id BIGINT, magic_number BIGINT, symbol VARCHAR, type VARCHAR,
+        volume FLOAT, open_price FLOAT, close_price FLOAT, open_time DATETIME, close_time DATETIME,
+        profit FLOAT, commission FLOAT, swap FLOAT, comment VARCHAR
+    )
+"""
+LEGACY_DEALS = [
+    (1, 1001, 0, None, "BALANCE", 0.0, 1000.0, "2024-01-01 00:00:00.000000"),
+    (2, 1001, 101, "EURUSD", "BUY", 0.1, 0.0, "2024-01-02 10:00:00.000000"),
+    (3, 1001, 101, "EURUSD", "SELL", 0.1, 25.0, "2024-01-02 12:00:00.000000"),
+    (4, 1001, 102, "XAUUSD", "SELL", 0.5, -40.0, "2024-01-03 09:30:00.000000"),
+    (5, 2002, 101, "EURUSD", "BUY", 1.0, 12.5, "2024-01-03 18:00:00.000000"),
+]
+
+def versions(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(SchemaVersion.version).order_by(SchemaVersion.version)).scalars().all()
+
+def test_fresh_database_upgrades_once(engine):
+    # The fixture already migrated it
+    assert versions(engine) == [version for version, _, _ in MIGRATIONS]
+    assert pending_migrations(engine) == []
+    assert upgrade(engine) == []
+    assert versions(engine) == [version for version, _, _ in MIGRATIONS]
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: ({col["name"] for col in inspector.get_columns(table)},
+                sorted(inspector.get_pk_constraint(table)["constrained_columns"]),
+                {ix["name"]: (tuple(ix["column_names"]), bool(ix["unique"])) for ix in inspector.get_indexes(table)})
+        for table in inspector.get_table_names()
+    }
+
+def test_steps_build_the_current_models(engine, tmp_path):
+    # Step 1 only creates the baseline tables; later steps must add everything else
+    reference = get_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    Base.metadata.create_all(reference)
+    assert schema(engine) == schema(reference)
+    reference.dispose()
+
+def legacy_engine(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_TRADES))
+        conn.execute(text(
+            "INSERT INTO trades (ticket, account_id, magic_number, symbol, type, volume, profit, commission, swap, "
+            "open_time, close_time) VALUES (:t, :a, :m, :s, :ty, :v, :p, -0.5, 0.0, :ct, :ct)"),
+            [dict(zip(("t", "a", "m", "s", "ty", "v", "p", "ct"), deal)) for deal in LEGACY_DEALS])
+    return engine
+
+def test_legacy_database_upgrades_twice(tmp_path):
+    engine = legacy_engine(tmp_path)
+    assert upgrade(engine) == [version for version, _, _ in MIGRATIONS]
+    assert upgrade(engine) == []
+
+    columns = {col["name"] for col in inspect(engine).get_columns("trades")}
+    assert {"position_id", "entry"} <= columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM trades")).scalar() == len(LEGACY_DEALS)
+
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        migrated_pnl = session.execute(select(DailyPnl.__table__).order_by(*DailyPnl.__table__.primary_key)).all()
+        migrated_risk = session.execute(select(RiskState.__table__).order_by(*RiskState.__table__.primary_key)).all()
+        # Deals without an entry all count as trades
+        assert sum(row.trades for row in migrated_pnl) == 4
+        assert sum(row.deposits for row in migrated_pnl) == 1000.0
+
+        # What the migrations computed is what the current rebuilds compute
+        rebuild_daily_pnl(session)
+        rebuild_risk_state(session)
+        session.commit()
+        assert session.execute(select(DailyPnl.__table__).order_by(*DailyPnl.__table__.primary_key)).all() == migrated_pnl
+        assert session.execute(select(RiskState.__table__).order_by(*RiskState.__table__.primary_key)).all() == migrated_risk
+    engine.dispose()
+
+def test_upgrade_stops_at_target(tmp_path):
+    engine = legacy_engine(tmp_path)
+    assert upgrade(engine, target=4) == [1, 2, 3, 4]
+    assert [version for version, _, _ in pending_migrations(engine)] == [5, 6, 7, 8, 9]
+    assert upgrade(engine) == [5, 6, 7, 8, 9]
+    engine.dispose()
+
+def test_duplicate_snapshots_are_dropped_before_the_unique_key(tmp_path):
+    engine = legacy_engine(tmp_path)
+    upgrade(engine, target=8)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO account_snapshots (account_id, timestamp, equity) VALUES (:a, :t, :e)"),
+                     [{"a": 1001, "t": "2024-01-01 00:00:00.000000", "e": e} for e in (1.0, 2.0, 3.0)]
+                     + [{"a": 2002, "t": "2024-01-01 00:00:00.000000", "e": 4.0}])
+    assert upgrade(engine) == [9]
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT account_id, equity FROM account_snapshots ORDER BY account_id")).all() == [
+            (1001, 1.0), (2002, 4.0)]
+    indexes = {ix["name"]: ix["unique"] for ix in inspect(engine).get_indexes("account_snapshots")}
+    assert indexes.get("ux_account_snapshots_account_timestamp")
+    assert "ix_account_snapshots_account_timestamp" not in indexes
+    engine.dispose()
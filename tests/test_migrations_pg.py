@@ -0,0 +1,75 @@
+"""
+Migrations on Postgres: the partitioned rebuild of step 6 (rebuild_table with
+partition_by, _swap_partitioned_names). Runs against the server in
+TEST_POSTGRES_URL (e.g. postgresql+psycopg2://postgres@localhost/postgres) in a
+scratch database, and is skipped without one.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from shared.db_models import Base, Trade, AccountSnapshot
+from shared.migrations import upgrade
+from shared import partitions
+
+PG_URL = os.getenv("TEST_POSTGRES_URL")
+
+@pytest.fixture
+def pg_engine():
+    if not PG_URL:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    try:
+        admin = create_engine(PG_URL, isolation_level="AUTOCOMMIT")
+        name = f"test_migrations_{uuid.uuid4().hex[:8]}"
+        with admin.connect() as conn:
+            conn.execute(text(f'CREATE DATABASE "{name}"'))
+    except Exception as e:
+        pytest.skip(f"Postgres unavailable: {e}")
+    engine = create_engine(admin.url.set(database=name))
+    yield engine
+    engine.dispose()
+    with admin.connect() as conn:
+        conn.execute(text(f'DROP DATABASE "{name}"'))
+    admin.dispose()
+
+def test_partitioned_rebuild_keeps_rows_and_live_names(pg_engine):
+    assert upgrade(pg_engine, target=5) == [1, 2, 3, 4, 5]
+    start = datetime(2024, 1, 15)
+    trades = [{"ticket": i, "account_id": 1001, "magic_number": 101, "symbol": "EURUSD", "type": "SELL",
+               "entry": "OUT", "position_id": i, "volume": 0.1, "profit": 1.0, "commission": 0.0, "swap": 0.0,
+               "close_time": start + timedelta(days=10 * i)} for i in range(1, 13)]
+    snapshots = [{"account_id": 1001, "timestamp": start + timedelta(days=10 * i), "equity": 1000.0 + i}
+                 for i in range(12)]
+    with pg_engine.begin() as conn:
+        conn.execute(Trade.__table__.insert(), trades)
+        conn.execute(AccountSnapshot.__table__.insert(), snapshots)
+
+    assert upgrade(pg_engine) == [6, 7, 8, 9]
+    assert upgrade(pg_engine) == []
+
+    inspector = inspect(pg_engine)
+    with pg_engine.connect() as conn:
+        for table, column, count in (("trades", "close_time", 12), ("account_snapshots", "timestamp", 12)):
+            assert partitions.is_partitioned(conn, table)
+            assert conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar() == count
+            # One partition per month of data, named after the live table
+            months = partitions.list_partitions(conn, table)
+            assert set(partitions.months_between(datetime(2024, 1, 1), datetime(2024, 5, 1))) <= set(months)
+            assert conn.execute(text(f'SELECT COUNT(*) FROM "{table}_default"')).scalar() == 0
+            pk = inspector.get_pk_constraint(table)
+            assert pk["name"] == f"{table}_pkey"
+            assert column in pk["constrained_columns"]
+            assert {ix["name"] for ix in inspector.get_indexes(table)} == {
+                ix.name for ix in Base.metadata.tables[table].indexes}
+        # Nothing left under the shadow's names
+        assert conn.execute(text("SELECT relname FROM pg_class WHERE relname LIKE '%\\_\\_rebuild%'")).all() == []
+
+    # The snapshot id sequence survived the swap
+    with pg_engine.begin() as conn:
+        new_id = conn.execute(AccountSnapshot.__table__.insert().returning(AccountSnapshot.id),
+                              {"account_id": 1001, "timestamp": datetime(2024, 6, 1), "equity": 1.0}).scalar()
+        assert new_id > conn.execute(text("SELECT MAX(id) FROM account_snapshots WHERE id <> :id"),
+                                     {"id": new_id}).scalar()
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.orm import sessionmaker
+
+from collector import fake_mt5, main_collector
+from collector.outbox import Outbox, OutboxFlusher, get_outbox
+from shared.db_models import Trade, AccountSnapshot
+
+class NoDB:
+    """Stands in for the session where the outbox path must not touch the database"""
+    def __getattr__(self, name):
+        raise AssertionError(f"database used: session.{name}")
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    path = str(tmp_path / "outbox.db")
+    monkeypatch.setattr(main_collector, "OUTBOX", True)
+    monkeypatch.setattr(main_collector, "OUTBOX_PATH", path)
+    monkeypatch.setattr(main_collector, "BACKFILL_DAYS", 40)
+    monkeypatch.setattr(main_collector, "BACKFILL_WINDOW_DAYS", 7)
+    yield get_outbox(path)
+    fake_mt5.reset()
+
+def terminal(deals):
+    fake_mt5.reset()
+    fake_mt5.add_terminal("A", login=1001, deals=deals)
+    fake_mt5.initialize("A")
+
+def recent_deals(n, start_ticket=1):
+    return fake_mt5.generate_deals(n, start=datetime.now(timezone.utc) - timedelta(days=30), days=29,
+                                   start_ticket=start_ticket)
+
+def queued_deals(outbox):
+    return [row for _, kind, _, payload in outbox.peek(1000) if kind == "deals" for row in payload]
+
+def drain(outbox, engine):
+    flusher = OutboxFlusher(outbox, sessionmaker(bind=engine))
+    while flusher.flush_once():
+        pass
+
+def test_backfill_goes_through_the_outbox(outbox, engine):
+    deals = recent_deals(200)
+    terminal(deals)
+    queued, skipped = main_collector.sync_trades(NoDB(), 1001)
+
+    assert (queued, skipped) == (200, 0)
+    assert sorted(row["ticket"] for row in queued_deals(outbox)) == [d.ticket for d in deals]
+    assert outbox.get_backfill(1001) is None
+    assert outbox.get_watermark(1001)[1] == deals[-1].ticket
+
+    drain(outbox, engine)
+    with sessionmaker(bind=engine)() as session:
+        assert session.execute(select(func.count()).select_from(Trade)).scalar() == 200
+
+def test_backfill_resumes_from_the_outbox_checkpoint(outbox, monkeypatch):
+    deals = recent_deals(200)
+    terminal(deals)
+    real_get, calls = fake_mt5.history_deals_get, []
+    def failing_get(date_from, date_to, **kwargs):
+        calls.append(date_from)
+        return None if len(calls) == 3 else real_get(date_from, date_to)
+    monkeypatch.setattr(main_collector.mt5, "history_deals_get", failing_get)
+
+    first, _ = main_collector.sync_trades(NoDB(), 1001)
+    checkpoint = outbox.get_backfill(1001)
+    assert checkpoint == calls[2]
+    assert 0 < first < 200
+
+    second, _ = main_collector.sync_trades(NoDB(), 1001)
+    assert calls[3] == checkpoint
+    assert first + second == 200
+    assert sorted(row["ticket"] for row in queued_deals(outbox)) == [d.ticket for d in deals]
+    assert outbox.get_backfill(1001) is None
+
+def test_empty_history_seeds_the_watermark(outbox):
+    terminal([])
+    before = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert main_collector.sync_trades(NoDB(), 1001) == (0, 0)
+    since, ticket = outbox.get_watermark(1001)
+    assert ticket == 0 and since >= before
+
+    deposit = recent_deals(1, start_ticket=50)[0]
+    fake_mt5.TERMINALS["A"]["deals"] = [deposit._replace(time=int(since.replace(tzinfo=timezone.utc).timestamp()))]
+    assert main_collector.sync_trades(NoDB(), 1001) == (1, 0)
+    assert outbox.get_watermark(1001)[1] == 50
+
+def test_new_deals_resume_from_the_watermark(outbox):
+    deals = recent_deals(100)
+    terminal(deals[:60])
+    main_collector.sync_trades(NoDB(), 1001)
+    fake_mt5.TERMINALS["A"]["deals"] = deals
+
+    queued, skipped = main_collector.sync_trades(NoDB(), 1001)
+    assert queued == 40 and skipped >= 1
+    assert sorted(row["ticket"] for row in queued_deals(outbox)) == [d.ticket for d in deals]
+
+def test_position_baseline_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    fields = main_collector.POSITION_FIELDS
+    row = {"ticket": 1, "account_id": 1001, **{f: 0 for f in fields}}
+    other = {**row, "ticket": 2}
+
+    first = Outbox(path).append_positions(1001, [row, other], fields)
+    assert first["replace"] and len(first["upserts"]) == 2
+    # Another process appending the next cycle diffs against the same baseline
+    second = Outbox(path).append_positions(1001, [{**row, "profit": 5}], fields)
+    assert second == {"upserts": [{**row, "profit": 5}], "closed": [2], "replace": False}
+    unchanged = Outbox(path).append_positions(1001, [{**row, "profit": 5}], fields)
+    assert unchanged["upserts"] == [] and unchanged["closed"] == []
+
+    outbox = Outbox(path)
+    assert outbox.pending() == 2
+    outbox.reset_positions(1001)
+    assert outbox.append_positions(1001, [row], fields)["replace"]
+
+def test_replayed_deal_batch_is_not_written_twice(outbox, engine):
+    terminal(recent_deals(50))
+    main_collector.sync_trades(NoDB(), 1001)
+    flusher = OutboxFlusher(outbox, sessionmaker(bind=engine))
+    # Crash between the DB commit and the ack: the batch is flushed again
+    outbox.ack = lambda ids: None
+    flusher.flush_once()
+    del outbox.ack
+    assert outbox.pending() > 0
+    drain(outbox, engine)
+
+    with sessionmaker(bind=engine)() as session:
+        assert session.execute(select(func.count()).select_from(Trade)).scalar() == 50
+
+def test_replayed_snapshot_batch_is_not_written_twice(outbox, engine):
+    now = datetime(2024, 1, 1, 12, 0)
+    snapshots = [{"account_id": 1001, "timestamp": now + timedelta(seconds=i), "balance": 1000.0, "equity": 1000.0 + i}
+                 for i in range(3)]
+    outbox.append("snapshots", None, snapshots)
+    flusher = OutboxFlusher(outbox, sessionmaker(bind=engine))
+    outbox.ack = lambda ids: None
+    flusher.flush_once()
+    del outbox.ack
+    drain(outbox, engine)
+
+    with sessionmaker(bind=engine)() as session:
+        assert session.execute(select(func.count()).select_from(AccountSnapshot)).scalar() == 3
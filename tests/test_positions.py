@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import select
+
+from collector import fake_mt5, main_collector
+from collector.main_collector import diff_open_positions, sync_open_positions
+from shared.db_models import OpenPosition
+
+def position(ticket, profit=0.0, volume=0.1, symbol="EURUSD"):
+    return fake_mt5.TradePosition(ticket, 0, fake_mt5.POSITION_TYPE_BUY, 101, ticket, volume, 1.1, 0.0, 0.0,
+                                  1.1, 0.0, profit, symbol, "")
+
+@pytest.fixture
+def terminal(monkeypatch):
+    monkeypatch.setattr(main_collector, "OUTBOX", False)
+    fake_mt5.reset()
+    state = fake_mt5.add_terminal("A", login=1001)
+    fake_mt5.initialize("A")
+    yield state
+    fake_mt5.reset()
+
+def stored(session):
+    return {row.ticket: row for row in session.execute(select(OpenPosition)).scalars()}
+
+def test_diff_against_stored_rows(session, terminal):
+    terminal["positions"] = [position(1), position(2), position(3)]
+    sync_open_positions(session, 1001)
+
+    upserts, closed = diff_open_positions(session, 1001, [position(1), position(2, profit=4.0), position(4)])
+    assert sorted(row["ticket"] for row in upserts) == [2, 4]
+    assert closed == [3]
+    assert diff_open_positions(session, 1001, [position(1), position(2), position(3)]) == ([], [])
+
+def test_sync_only_writes_what_changed(session, terminal):
+    terminal["positions"] = [position(1), position(2)]
+    sync_open_positions(session, 1001)
+    first = {ticket: row.updated_at for ticket, row in stored(session).items()}
+    session.expire_all()
+
+    terminal["positions"] = [position(1), position(2, profit=7.5), position(3)]
+    sync_open_positions(session, 1001)
+    rows = stored(session)
+    assert sorted(rows) == [1, 2, 3]
+    assert rows[1].updated_at == first[1]
+    assert rows[2].updated_at > first[2] and rows[2].profit == 7.5
+    session.expire_all()
+
+    terminal["positions"] = [position(3)]
+    sync_open_positions(session, 1001)
+    assert sorted(stored(session)) == [3]
+
+def test_other_accounts_are_left_alone(session, terminal):
+    session.add(OpenPosition(ticket=99, account_id=2002, symbol="XAUUSD", volume=1.0))
+    session.commit()
+    terminal["positions"] = [position(1)]
+    sync_open_positions(session, 1001)
+    terminal["positions"] = []
+    sync_open_positions(session, 1001)
+    assert sorted(stored(session)) == [99]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from shared.db_models import AccountSnapshot, EquityBar
+from shared.retention import downsample, apply_retention
+
+NOW = datetime(2024, 6, 1, 12, 30)
+
+def add_snapshots(engine, account_id, start, end, step=timedelta(minutes=30)):
+    rows, t = [], start
+    while t < end:
+        rows.append({"account_id": account_id, "timestamp": t, "balance": 1000.0, "equity": 1000.0})
+        t += step
+    with engine.begin() as conn:
+        conn.execute(AccountSnapshot.__table__.insert(), rows)
+
+def oldest_snapshot(session, account_id):
+    return session.execute(select(func.min(AccountSnapshot.timestamp))
+                           .where(AccountSnapshot.account_id == account_id)).scalar()
+
+def test_retired_account_does_not_hold_back_the_others(engine, session):
+    # 1001 stopped reporting 50 days ago, 2002 still does
+    add_snapshots(engine, 1001, NOW - timedelta(days=60), NOW - timedelta(days=50))
+    add_snapshots(engine, 2002, NOW - timedelta(days=40), NOW)
+    downsample(engine, now=NOW)
+
+    removed = apply_retention(engine, now=NOW, snapshot_days=30)
+
+    cutoff = NOW - timedelta(days=30)
+    assert removed["snapshots_deleted"] > 0
+    assert oldest_snapshot(session, 1001) is None
+    assert oldest_snapshot(session, 2002) >= cutoff
+
+def test_snapshots_without_bars_are_kept(engine, session):
+    add_snapshots(engine, 1001, NOW - timedelta(days=40), NOW)
+    downsample(engine, now=NOW)
+    # Arrived late (e.g. from an outbox) for an account that has no bars yet
+    add_snapshots(engine, 3003, NOW - timedelta(days=45), NOW - timedelta(days=44))
+    # Not downsampled past the last complete hour of 1001 either
+    session.execute(EquityBar.__table__.delete().where(EquityBar.bucket >= NOW - timedelta(days=35)))
+    session.commit()
+
+    apply_retention(engine, now=NOW, snapshot_days=30)
+
+    assert oldest_snapshot(session, 3003) == NOW - timedelta(days=45)
+    newest_bar = session.execute(select(func.max(EquityBar.bucket)).where(
+        EquityBar.account_id == 1001, EquityBar.resolution == "1h")).scalar()
+    assert oldest_snapshot(session, 1001) == newest_bar + timedelta(hours=1)
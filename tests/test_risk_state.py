@@ -0,0 +1,97 @@
+import math
+import statistics
+
+import pytest
+from sqlalchemy import select
+
+from collector import fake_mt5
+from collector.main_collector import bulk_insert_trades
+from shared.db_models import RiskState
+from shared.risk_state import ALL_EAS, STATE_FIELDS, RiskTracker, new_state, fold, sharpe, sortino, rebuild_risk_state
+
+from conftest import make_deal, to_rows
+
+def folded(deals):
+    tracker = RiskTracker()
+    for row in to_rows(deals):
+        tracker.feed(row)
+    return tracker.states
+
+def test_fold_tracks_curve_streaks_and_moments():
+    nets = [10.0, 5.0, -20.0, -5.0, 30.0, -1.0]
+    deals = [make_deal(i + 1, i * 60, "SELL", "OUT", i + 1, 0.1, 1.0, profit=net) for i, net in enumerate(nets)]
+    state = folded(deals)[(1001, ALL_EAS)]
+
+    assert state["trades"] == 6 and state["wins"] == 3 and state["losses"] == 3
+    assert state["net_profit"] == pytest.approx(19.0)
+    assert state["gross_profit"] == pytest.approx(45.0)
+    assert state["gross_loss"] == pytest.approx(-26.0)
+    # Peak 15 after the second trade, trough -10 after the fourth, recovered by the fifth
+    assert state["peak"] == pytest.approx(20.0)
+    assert state["max_drawdown"] == pytest.approx(-25.0)
+    assert state["max_drawdown_seconds"] == 3 * 3600
+    assert (state["max_win_streak"], state["max_loss_streak"]) == (2, 2)
+    assert (state["win_streak"], state["loss_streak"]) == (0, 1)
+    assert state["mean"] == pytest.approx(statistics.mean(nets))
+    assert sharpe(state) == pytest.approx(statistics.mean(nets) / statistics.stdev(nets))
+    downside = math.sqrt(sum(n * n for n in nets if n < 0) / len(nets))
+    assert sortino(state) == pytest.approx(statistics.mean(nets) / downside)
+
+def test_entries_move_the_curve_but_are_not_trades():
+    states = folded([
+        make_deal(1, 0, "BALANCE", "IN", 0, 0.0, 0.0, profit=1000.0),
+        make_deal(2, 1, "BUY", "IN", 5, 1.0, 1.0, commission=-3.0),
+        make_deal(3, 2, "SELL", "OUT", 5, 1.0, 1.1, profit=10.0, commission=-3.0),
+    ])
+    state = states[(1001, ALL_EAS)]
+    assert state["trades"] == 1 and state["wins"] == 1
+    assert state["net_profit"] == pytest.approx(4.0)
+    assert state["gross_loss"] == pytest.approx(-3.0)
+    assert state["max_drawdown"] == 0.0 # the curve starts at its first point
+    assert set(states) == {(1001, ALL_EAS), (1001, 101)}
+    assert sharpe(state) is None and sortino(state) is None
+
+def test_break_even_leaves_streaks_alone():
+    state = new_state(1001, ALL_EAS)
+    for ticket, net in enumerate([5.0, 0.0, 5.0], start=1):
+        fold(state, to_rows([make_deal(ticket, ticket, "SELL", "OUT", ticket, 0.1, 1.0, profit=net)])[0])
+    assert state["win_streak"] == 2 and state["trades"] == 3 and state["wins"] == 2
+
+def stored(session):
+    rows = session.execute(select(RiskState.__table__).order_by(RiskState.account_id, RiskState.magic_number))
+    return [tuple(row._mapping[f] for f in STATE_FIELDS) for row in rows]
+
+def assert_states_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        for field, a, b in zip(STATE_FIELDS, got, want):
+            assert a == (pytest.approx(b) if isinstance(b, float) else b), field
+
+def test_in_order_batches_equal_rebuild(session):
+    deals = fake_mt5.generate_deals(301, days=60)
+    for lo, hi in ((0, 100), (100, 101), (101, 301)):
+        bulk_insert_trades(session, 1001, deals[lo:hi])
+        session.commit()
+    incremental = stored(session)
+    assert len(incremental) == 4 # the account and three EAs
+
+    rebuild_risk_state(session)
+    session.commit()
+    assert_states_equal(stored(session), incremental)
+
+def test_late_deals_replay_the_account(session):
+    deals = fake_mt5.generate_deals(301, days=60)
+    other = fake_mt5.generate_deals(51, days=60, start_ticket=10_000, seed=7)
+    # The newest deals arrive first; the older batch can't be folded in and replays account 1001
+    bulk_insert_trades(session, 1001, deals[200:])
+    bulk_insert_trades(session, 2002, other)
+    session.commit()
+    before = {row[:2]: row for row in stored(session) if row[0] == 2002}
+    bulk_insert_trades(session, 1001, deals[:200])
+    session.commit()
+    replayed = stored(session)
+    assert {row[:2]: row for row in replayed if row[0] == 2002} == before
+
+    rebuild_risk_state(session)
+    session.commit()
+    assert_states_equal(stored(session), replayed)
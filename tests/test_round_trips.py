@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import select
+
+from collector import fake_mt5
+from collector.main_collector import bulk_insert_trades
+from shared.db_models import RoundTrip, PositionLeg
+from shared.round_trips import RoundTripMatcher, rebuild_round_trips
+
+from conftest import make_deal, to_rows
+
+def match(deals):
+    matcher = RoundTripMatcher()
+    trips = [trip for row in to_rows(deals) for trip in matcher.feed(row)]
+    return trips, matcher.legs
+
+def test_partial_close_shares_entry_commission_by_volume():
+    trips, legs = match([
+        make_deal(1, 0, "BUY", "IN", 1, 1.0, 1.1000, commission=-2.0),
+        make_deal(2, 60, "SELL", "OUT", 1, 0.4, 1.1020, profit=8.0, commission=-0.8),
+        make_deal(3, 120, "SELL", "OUT", 1, 0.6, 1.1030, profit=18.0, commission=-1.2),
+    ])
+    assert [t["volume"] for t in trips] == pytest.approx([0.4, 0.6])
+    assert [t["commission"] for t in trips] == pytest.approx([-1.6, -2.4])
+    assert [t["net_profit"] for t in trips] == pytest.approx([6.4, 15.6])
+    assert [t["holding_seconds"] for t in trips] == [3600.0, 7200.0]
+    assert all(t["direction"] == "BUY" and t["open_ticket"] == 1 and t["open_price"] == 1.1 for t in trips)
+    assert legs == {}
+
+def test_scale_in_averages_entry_price():
+    trips, legs = match([
+        make_deal(1, 0, "BUY", "IN", 1, 1.0, 1.0),
+        make_deal(2, 1, "BUY", "IN", 1, 3.0, 1.2),
+        make_deal(3, 2, "SELL", "OUT", 1, 2.0, 1.3),
+    ])
+    assert trips[0]["open_price"] == pytest.approx(1.15)
+    assert legs[(1001, 1)]["volume"] == pytest.approx(2.0)
+    assert legs[(1001, 1)]["open_price"] == pytest.approx(1.15)
+
+def test_reversal_closes_then_opens_the_rest():
+    trips, legs = match([
+        make_deal(1, 0, "BUY", "IN", 7, 1.0, 1.00, commission=-1.0),
+        make_deal(2, 10, "SELL", "INOUT", 7, 3.0, 1.10, profit=10.0, commission=-3.0),
+    ])
+    assert len(trips) == 1
+    assert trips[0]["volume"] == pytest.approx(1.0)
+    assert trips[0]["direction"] == "BUY"
+    # Entry commission plus the closing third of the reversal deal's commission
+    assert trips[0]["commission"] == pytest.approx(-2.0)
+    leg = legs[(1001, 7)]
+    assert (leg["direction"], leg["open_ticket"], leg["open_price"]) == ("SELL", 2, 1.10)
+    assert leg["volume"] == pytest.approx(2.0)
+    assert leg["commission"] == pytest.approx(-2.0)
+
+    more, legs = match([
+        make_deal(1, 0, "BUY", "IN", 7, 1.0, 1.00, commission=-1.0),
+        make_deal(2, 10, "SELL", "INOUT", 7, 3.0, 1.10, profit=10.0, commission=-3.0),
+        make_deal(3, 20, "BUY", "OUT", 7, 2.0, 1.05, profit=9.0, commission=-2.0),
+    ])
+    assert more[1]["direction"] == "SELL"
+    assert more[1]["volume"] == pytest.approx(2.0)
+    assert more[1]["commission"] == pytest.approx(-4.0)
+    assert more[1]["holding_seconds"] == 600.0
+    assert legs == {}
+
+def test_close_by_closes_both_positions():
+    trips, legs = match([
+        make_deal(1, 0, "BUY", "IN", 1, 1.0, 1.10),
+        make_deal(2, 5, "SELL", "IN", 2, 0.5, 1.12),
+        # Position 2 closes position 1 by half its volume: one OUT_BY deal on each side
+        make_deal(3, 30, "SELL", "OUT_BY", 1, 0.5, 1.12, profit=10.0),
+        make_deal(4, 30, "BUY", "OUT_BY", 2, 0.5, 1.10, profit=0.0),
+    ])
+    assert [(t["position_id"], t["direction"], t["volume"]) for t in trips] == [(1, "BUY", 0.5), (2, "SELL", 0.5)]
+    assert list(legs) == [(1001, 1)]
+    assert legs[(1001, 1)]["volume"] == pytest.approx(0.5)
+
+def test_exit_without_entry_in_history():
+    trips, legs = match([make_deal(5, 0, "SELL", "OUT", 3, 0.2, 1.2, profit=4.0)])
+    assert trips[0]["open_ticket"] is None
+    assert trips[0]["open_time"] is None
+    assert trips[0]["direction"] == "BUY"
+    assert legs == {}
+
+def test_balance_and_unknown_position_deals_are_ignored():
+    trips, legs = match([
+        make_deal(1, 0, "BALANCE", "IN", 0, 0.0, 0.0, profit=1000.0),
+        make_deal(2, 1, "BUY", "IN", 0, 1.0, 1.0),
+    ])
+    assert trips == [] and legs == {}
+
+def stored(session):
+    trips = session.execute(select(RoundTrip).order_by(RoundTrip.close_ticket)).scalars().all()
+    legs = session.execute(select(PositionLeg).order_by(PositionLeg.position_id)).scalars().all()
+    columns = [c.name for c in RoundTrip.__table__.columns]
+    leg_columns = [c.name for c in PositionLeg.__table__.columns]
+    return ([tuple(getattr(t, c) for c in columns) for t in trips],
+            [tuple(getattr(leg, c) for c in leg_columns) for leg in legs])
+
+def test_incremental_matching_equals_rebuild(session):
+    deals = fake_mt5.generate_deals(401, days=30)
+    # Batch boundaries between entries and their exits, so legs carry over through position_legs
+    for lo, hi in ((0, 57), (57, 58), (58, 250), (250, 401)):
+        bulk_insert_trades(session, 1001, deals[lo:hi])
+        session.commit()
+    incremental = stored(session)
+    assert len(incremental[0]) == 200
+
+    rebuild_round_trips(session)
+    session.commit()
+    assert stored(session) == incremental
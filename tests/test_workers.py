@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, func
+
+from collector import fake_mt5, main_collector, workers
+from collector.workers import create_pool, run_pool_cycle
+from shared.db_models import Trade
+
+def deals(n, start_ticket):
+    return fake_mt5.generate_deals(n, start=datetime.now(timezone.utc) - timedelta(days=30), days=29,
+                                   start_ticket=start_ticket)
+
+@pytest.fixture
+def pool(engine, monkeypatch):
+    # Worker processes are forked from here: they see the fake terminals and these settings
+    monkeypatch.setattr(workers, "DATABASE_URL", engine.url.render_as_string(hide_password=False))
+    monkeypatch.setattr(workers, "_Session", None)
+    monkeypatch.setattr(workers, "SNAPSHOT_BUFFER", True)
+    monkeypatch.setattr(main_collector, "OUTBOX", False)
+    monkeypatch.setattr(main_collector, "BACKFILL_DAYS", 40)
+    main_collector.ea_registry.invalidate()
+    fake_mt5.reset()
+    fake_mt5.add_terminal("A", login=1001, deals=deals(120, 1))
+    fake_mt5.add_terminal("B", login=2002, deals=deals(80, 10_000))
+    executor = create_pool(2)
+    yield executor
+    executor.shutdown()
+    fake_mt5.reset()
+
+def test_pool_cycle_syncs_every_terminal(pool, session):
+    results, broken = run_pool_cycle(pool, ["A", "B"])
+
+    assert not broken
+    by_path = {r["path"]: r for r in results}
+    assert {path: (r["ok"], r["account_id"], r["inserted"]) for path, r in by_path.items()} == {
+        "A": (True, 1001, 120), "B": (True, 2002, 80)}
+    assert all("trades" in r["timings"] and r["elapsed"] > 0 for r in results)
+    # Buffered snapshots come back to the supervisor instead of being written
+    assert [s["account_id"] for s in by_path["A"]["snapshots"]] == [1001]
+    assert [s["account_id"] for s in by_path["B"]["snapshots"]] == [2002]
+
+    counts = dict(session.execute(select(Trade.account_id, func.count()).group_by(Trade.account_id)).all())
+    assert counts == {1001: 120, 2002: 80}
+
+def test_failed_terminal_does_not_stop_the_others(pool):
+    results, broken = run_pool_cycle(pool, ["A", "missing"])
+
+    assert not broken
+    by_path = {r["path"]: r for r in results}
+    assert by_path["A"]["ok"]
+    assert not by_path["missing"]["ok"] and by_path["missing"]["error"].startswith("connect failed")
+
+def test_next_cycle_only_adds_new_deals(pool, session):
+    run_pool_cycle(pool, ["A", "B"])
+    results, _ = run_pool_cycle(pool, ["A", "B"])
+    assert all(r["ok"] and r["inserted"] == 0 for r in results)
+    assert session.execute(select(func.count()).select_from(Trade)).scalar() == 200